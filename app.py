@@ -1,38 +1,60 @@
-from flask import Flask, Blueprint
-from flask_login import LoginManager
-from flask_admin import Admin
-from models import DB_NAME, db, User, Assignment, Note
-from flask_migrate import Migrate
+import os
+import logging
+from flask import Flask
+from models import DB_NAME, User, Assignment, Note, FocusData, FocusSession
+from extensions import db, login_manager
+from commands import register_commands
 
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 
-def create_app():
+
+def create_app(minimal=False):
+    """
+    Build the iFocus application.
+
+    minimal=True gives an app with only the database and CLI commands configured, for the cron
+    job and scripts that never serve a request. The full app also sets up login, metrics,
+    profiling, the admin panel and the blueprints. Tables are not created here; run
+    `flask --app app init-db` once per database.
+    """
     app = Flask(__name__)
     app.config["SECRET_KEY"] = "secret_key"
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_NAME}"
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("IFOCUS_DATABASE_URI", f"sqlite:///{DB_NAME}")
 
     db.init_app(app)
-    with app.app_context():
-        db.create_all()
+    register_commands(app)
+    if minimal:
+        return app
+
+    import instrumentation
+    import profiling
+    from flask_admin import Admin
+    from views import (UserAdminView, AssignmentAdminView, NoteAdminView, FocusDataAdminView, FocusSessionAdminView,
+                       ProfilesView, ExportView, SignoutView)
+    from routes import bp as main_bp
+    from focus_routes import bp as focus_bp
+
+    instrumentation.init_app(app)
+
+    login_manager.init_app(app)
+    login_manager.login_view = 'main.login'
+    profiling.init_app(app)
+
+    admin = Admin(app, name='iFocus Admin', template_mode='bootstrap4')
+    admin.add_view(UserAdminView(User, db.session))
+    admin.add_view(AssignmentAdminView(Assignment, db.session))
+    admin.add_view(NoteAdminView(Note, db.session))
+    admin.add_view(FocusDataAdminView(FocusData, db.session, name="Focus data"))
+    admin.add_view(FocusSessionAdminView(FocusSession, db.session, name="Focus sessions"))
+    admin.add_view(ProfilesView(name="Profiles", endpoint="profiles"))
+    admin.add_view(ExportView(name="Export", endpoint="export"))
+    admin.add_view(SignoutView(name="Signout"))
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(focus_bp)
 
     return app
 
 
-app = create_app()
-# migrate = Migrate(app, db)
-
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-from views import UserAdminView, AssignmentAdminView, NoteAdminView, SignoutView
-
-admin = Admin(app, name='iFocus Admin', template_mode='bootstrap4')
-admin.add_view(UserAdminView(User, db.session))
-admin.add_view(AssignmentAdminView(Assignment, db.session))
-admin.add_view(NoteAdminView(Note, db.session))
-admin.add_view(SignoutView(name="Signout"))
-
-from routes import *
-
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,58 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from benchmarks.conftest import login
+from models import db, FocusData, User
+from views import ADMIN_COUNT_LIMIT
+
+PAGE_SIZE = 20
+
+
+@pytest.fixture(scope="module")
+def admin_client(flask_app, dataset):
+    with flask_app.app_context():
+        if User.query.filter_by(username="bench_admin").first() is None:
+            db.session.add(User(username="bench_admin", password=generate_password_hash("password"), role="Admin"))
+            db.session.commit()
+    return login(flask_app, "bench_admin")
+
+
+@pytest.mark.benchmark(group="admin-deep-page")
+def bench_offset_page(benchmark, app_context, dataset):
+    """The query Flask-Admin runs for the last pages of the samples list: OFFSET plus a count."""
+    total = FocusData.query.count()
+
+    def page():
+        rows = FocusData.query.order_by(FocusData.id.desc()).offset(total - PAGE_SIZE).limit(PAGE_SIZE).all()
+        return rows, FocusData.query.count()
+
+    rows, _ = benchmark(page)
+    assert len(rows) == PAGE_SIZE
+
+
+@pytest.mark.benchmark(group="admin-deep-page")
+def bench_keyset_page(benchmark, app_context, dataset):
+    """The same page sought on the primary key, with the capped count KeysetModelView runs."""
+
+    def page():
+        rows = (FocusData.query.filter(FocusData.id < PAGE_SIZE + 1).order_by(FocusData.id.desc())
+                .limit(PAGE_SIZE + 1).all())
+        capped = db.session.query(db.func.count()).select_from(
+            FocusData.query.with_entities(FocusData.id).limit(ADMIN_COUNT_LIMIT + 1).subquery()).scalar()
+        return rows, capped
+
+    rows, _ = benchmark(page)
+    assert len(rows) == PAGE_SIZE
+
+
+@pytest.mark.benchmark(group="admin-list")
+def bench_keyset_route(benchmark, admin_client):
+    response = benchmark(admin_client.get, f"/admin/focusdata/?after={PAGE_SIZE + 1}")
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="admin-list")
+def bench_keyset_filtered_route(benchmark, admin_client, dataset):
+    assignment_id = dataset["assignment_ids"][-1]
+    response = benchmark(admin_client.get, f"/admin/focusdata/?flt0_0={assignment_id}&after={PAGE_SIZE + 1}")
+    assert response.status_code == 200
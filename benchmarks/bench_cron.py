@@ -0,0 +1,110 @@
+import pytest
+
+from benchmarks.conftest import StubLLM
+
+
+@pytest.mark.benchmark(group="cron")
+def bench_generate_insights_for_student(benchmark, cron, app_context, dataset):
+    from models import User, Assignment, db
+    student = db.session.get(User, dataset["student_ids"][0])
+    assignment = db.session.get(Assignment, dataset["assignment_ids"][0])
+    assert benchmark(cron.generate_insights, student, assignment)
+
+
+@pytest.mark.benchmark(group="cron")
+def bench_generate_assignment_insights(benchmark, cron, app_context, dataset):
+    from models import Assignment, db
+    assignment = db.session.get(Assignment, dataset["assignment_ids"][0])
+    assert benchmark(cron.generate_assignment_insights, assignment)
+
+
+@pytest.mark.benchmark(group="cron-end-to-end")
+def bench_cron_end_to_end(benchmark, cron, app_context):
+    def run():
+        cron.generate_for_all_users()
+        cron.generate_insights_for_all_assignments()
+
+    benchmark.pedantic(run, rounds=3)
+
+
+def bench_cohort_counts_every_student(cron, app_context, dataset, monkeypatch):
+    """Students whose insights fail, or are deferred once the breaker opens, are still in the class sketch."""
+    from cohort import load_cohort
+    from llm_gateway import CircuitBreaker, gateway
+    from models import db, InsightJob
+
+    def unavailable(self, messages):
+        raise ConnectionError("model server down")
+
+    # The cron fixture has put StubLLM in place of ChatOllama
+    monkeypatch.setattr("langchain_ollama.ChatOllama.invoke", unavailable)
+    monkeypatch.setattr(gateway, "breaker", CircuitBreaker())
+    assignment_id = dataset["assignment_ids"][0]
+    try:
+        for attempt in range(2):
+            cron.run_insights(assignments=False, assignment_id=assignment_id, run_id="cohort-check", snapshot=False)
+            assert gateway.breaker.is_open()
+            assert {sketch.count for sketch in load_cohort(assignment_id).values()} == {len(dataset["student_ids"])}
+    finally:
+        InsightJob.query.delete()
+        db.session.commit()
+
+
+def bench_worker_keeps_run_leases(cron, app_context, dataset, monkeypatch):
+    """A worker job on a unit a nightly run completed must not make a retry of that run redo it."""
+    from datetime import datetime
+    import insight_jobs
+    from leases import lease_owner
+    from models import db, Enrollment, InsightJob
+
+    calls = []
+    real_invoke = StubLLM.invoke
+    monkeypatch.setattr("langchain_ollama.ChatOllama.invoke",
+                        lambda self, messages: calls.append(1) or real_invoke(self, messages))
+    assignment_id = dataset["assignment_ids"][1]
+    enrollment = Enrollment.query.filter_by(assignment_id=assignment_id).first()
+
+    def worker_job():
+        now = datetime.utcnow()
+        job = InsightJob(kind="enrollment", dedupe_key=f"lease-check:{now}", user_id=enrollment.user_id,
+                         assignment_id=assignment_id, status="running", attempts=1, run_after=now)
+        db.session.add(job)
+        db.session.commit()
+        return insight_jobs.run_job(job, lease_owner())
+
+    try:
+        cron.run_insights(assignments=False, assignment_id=assignment_id, run_id="lease-check", snapshot=False)
+        assert worker_job() == "done"
+        # A job that fails hands the run's completion back too
+        generate_insights = cron.generate_insights
+        monkeypatch.setattr(cron, "generate_insights", lambda *args: None)
+        assert worker_job() != "done"
+        monkeypatch.setattr(cron, "generate_insights", generate_insights)
+        calls.clear()
+        cron.run_insights(assignments=False, assignment_id=assignment_id, run_id="lease-check", snapshot=False)
+        assert calls == []
+    finally:
+        InsightJob.query.delete()
+        db.session.commit()
+
+
+def bench_cohort_written_back_with_snapshot(cron, app_context, dataset, monkeypatch):
+    """With a snapshot the class sketches wait for the write-back, and the assignment stage reads them from memory."""
+    from models import CohortSketch
+
+    assignment_id = dataset["assignment_ids"][0]
+    seen = []
+
+    def cohort_quantiles(assignment_id):
+        live_rows = CohortSketch.query.filter_by(assignment_id=assignment_id, run_id="snapshot-check").count()
+        seen.append((live_rows, real_quantiles(assignment_id)))
+        return seen[-1][1]
+
+    real_quantiles = cron.cohort_quantiles
+    monkeypatch.setattr(cron, "cohort_quantiles", cohort_quantiles)
+    cron.run_insights(assignment_id=assignment_id, run_id="snapshot-check", snapshot=True)
+
+    [(live_rows, quantiles)] = seen
+    assert live_rows == 0
+    assert {entry["students"] for entry in quantiles.values()} == {len(dataset["student_ids"])}
+    assert CohortSketch.query.filter_by(assignment_id=assignment_id, run_id="snapshot-check").count() == len(quantiles)
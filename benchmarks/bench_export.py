@@ -0,0 +1,22 @@
+import pytest
+
+from export import export_stream, parquet_available
+
+
+def drain(chunks):
+    return sum(len(chunk) for chunk in chunks)
+
+
+@pytest.mark.benchmark(group="export")
+@pytest.mark.parametrize("fmt,compress", [("csv", False), ("csv", True), ("ndjson", False), ("ndjson", True)])
+def bench_export_samples(benchmark, app_context, dataset, fmt, compress):
+    assignment_id = dataset["assignment_ids"][0]
+    size = benchmark(lambda: drain(export_stream("samples", fmt, compress, assignment_ids=[assignment_id])))
+    assert size
+
+
+@pytest.mark.benchmark(group="export")
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow is not installed")
+def bench_export_samples_parquet(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+    assert benchmark(lambda: drain(export_stream("samples", "parquet", assignment_ids=[assignment_id])))
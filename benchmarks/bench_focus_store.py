@@ -0,0 +1,47 @@
+import pytest
+
+from focus_store import binned_fixation_grid, binned_focus_grid, load_focus_arrays
+from heatmaps import focus_grid
+from models import FocusData
+
+
+@pytest.mark.benchmark(group="focus-loader")
+def bench_load_orm_objects(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+
+    def load():
+        focus_data = FocusData.query.filter_by(assignment_id=assignment_id).all()
+        return [data.x_coord for data in focus_data], [data.y_coord for data in focus_data]
+
+    x_coords, _ = benchmark(load)
+    assert x_coords
+
+
+@pytest.mark.benchmark(group="focus-loader")
+def bench_load_focus_arrays(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+    focus_data = benchmark(load_focus_arrays, assignment_id=assignment_id)
+    assert len(focus_data) == FocusData.query.filter_by(assignment_id=assignment_id).count()
+
+
+@pytest.mark.benchmark(group="focus-heatmap-grid")
+def bench_grid_from_arrays(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+
+    def grid():
+        focus_data = load_focus_arrays(assignment_id=assignment_id)
+        return focus_grid(focus_data.x, focus_data.y)
+
+    benchmark(grid)
+
+
+@pytest.mark.benchmark(group="focus-heatmap-grid")
+def bench_grid_binned_in_sql(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+    assert benchmark(binned_focus_grid, assignment_id=assignment_id) is not None
+
+
+@pytest.mark.benchmark(group="focus-heatmap-grid")
+def bench_fixation_grid_binned_in_sql(benchmark, app_context, dataset):
+    assignment_id = dataset["assignment_ids"][0]
+    assert benchmark(binned_fixation_grid, assignment_id=assignment_id) is not None
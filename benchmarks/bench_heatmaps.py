@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from heatmaps import focus_grid, render_heatmap
+
+
+@pytest.fixture(scope="module")
+def coordinates():
+    rng = np.random.default_rng(0)
+    return rng.random(100_000), rng.random(100_000)
+
+
+@pytest.mark.benchmark(group="heatmap-binning")
+def bench_focus_grid(benchmark, coordinates):
+    benchmark(focus_grid, *coordinates)
+
+
+@pytest.mark.benchmark(group="heatmap-render")
+def bench_render_heatmap(benchmark, coordinates, scratch_static):
+    grid = focus_grid(*coordinates)
+    benchmark(render_heatmap, grid, str(scratch_static / "heatmap.png"), "Benchmark")
+
+
+@pytest.mark.benchmark(group="heatmap-routes")
+def bench_student_heatmap_route(benchmark, student_client, dataset, scratch_static):
+    assignment_id = dataset["assignment_ids"][0]
+    response = benchmark(student_client.get, f"/student/heatmap/{assignment_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="heatmap-routes")
+def bench_student_all_heatmaps_route(benchmark, student_client, scratch_static):
+    # Rendered files younger than 10 minutes are reused, so clear them before every round
+    def setup():
+        for path in (scratch_static / "static" / "heatmaps").iterdir():
+            path.unlink()
+
+    response = benchmark.pedantic(student_client.get, args=("/student/heatmaps",), setup=setup, rounds=5)
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="heatmap-routes")
+def bench_teacher_heatmap_route(benchmark, teacher_client, dataset, scratch_static):
+    assignment_id = dataset["assignment_ids"][0]
+
+    def setup():
+        for path in (scratch_static / "static" / "teacher_heatmaps").iterdir():
+            path.unlink()
+
+    response = benchmark.pedantic(teacher_client.get, args=(f"/teacher/heatmap/{assignment_id}",),
+                                  setup=setup, rounds=5)
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="heatmap-cron")
+def bench_cron_student_heatmap(benchmark, cron, dataset):
+    student_id, assignment_id = dataset["student_ids"][0], dataset["assignment_ids"][0]
+    assert benchmark(cron.generate_heatmap, student_id, assignment_id)
+
+
+@pytest.mark.benchmark(group="heatmap-cron")
+def bench_cron_assignment_heatmap(benchmark, cron, dataset):
+    assert benchmark(cron.generate_assignment_heatmap, dataset["assignment_ids"][0])
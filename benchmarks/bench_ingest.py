@@ -0,0 +1,39 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def open_session(student_client, dataset):
+    """An open focus session with a registered viewport for bench_student_0."""
+    assignment_id = dataset["assignment_ids"][0]
+    session_id = student_client.post("/focus_session/start", json={"assignment_id": assignment_id}).json["session_id"]
+    viewport_id = student_client.post("/focus_viewport", json={
+        "session_id": session_id,
+        "viewport": {"width": 1440, "height": 900},
+        "content_rect": {"left": 120, "top": 80, "width": 960, "height": 600},
+    }).json["viewport_id"]
+    yield session_id, viewport_id
+    student_client.post(f"/focus_session/{session_id}/end")
+
+
+@pytest.mark.benchmark(group="ingest")
+def bench_save_focus_data(benchmark, student_client, open_session):
+    session_id, viewport_id = open_session
+    start = datetime.utcnow()
+    counter = itertools.count()
+
+    def post_sample():
+        n = next(counter)
+        return student_client.post("/save_focus_data", json={
+            "session_id": session_id,
+            "viewport_id": viewport_id,
+            "x": 120 + (n * 37) % 960,
+            "y": 80 + (n * 53) % 600,
+            "outside": n % 10 == 0,
+            "timestamp": (start + timedelta(milliseconds=100 * n)).isoformat() + "Z",
+        })
+
+    response = benchmark(post_sample)
+    assert response.status_code == 200
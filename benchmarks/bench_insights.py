@@ -0,0 +1,53 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+import routes
+from conftest import login
+from models import db, User, Assignment
+
+REGION = {"id": 1, "page": 1, "kind": "paragraph", "text": "Most-read paragraph", "seconds": 42.0,
+          "share": 0.5, "students": 3}
+COHORT = {"focus": {"students": 10, "quantiles": [11.1, 22.2, 33.3, 44.4, 55.5]}}
+
+
+@pytest.fixture
+def pdf_assignment(app_context, dataset, scratch_static, monkeypatch):
+    """A PDF assignment of bench_teacher_0 with a heatmap, stub regions and stub class quantiles."""
+    calls = []
+    monkeypatch.setattr(routes, "region_dwell", lambda *args, **kwargs: calls.append("regions") or [REGION])
+    monkeypatch.setattr(routes, "cohort_quantiles", lambda *args, **kwargs: calls.append("cohort") or COHORT)
+    assignment = Assignment(title="Insights page", teacher_id=dataset["teacher_ids"][0], pdf_path="reading.pdf")
+    db.session.add(assignment)
+    db.session.commit()
+    (scratch_static / "static" / "teacher_heatmaps" / f"heatmap_assignment_{assignment.id}.png").touch()
+    yield assignment.id, calls
+    db.session.delete(assignment)
+    db.session.commit()
+
+
+@pytest.fixture
+def other_teacher_client(flask_app, app_context):
+    if User.query.filter_by(username="bench_teacher_other").first() is None:
+        db.session.add(User(username="bench_teacher_other", password=generate_password_hash("password"),
+                            role="Teacher"))
+        db.session.commit()
+    return login(flask_app, "bench_teacher_other")
+
+
+@pytest.mark.benchmark(group="insights")
+def bench_teacher_insights_page(benchmark, teacher_client, pdf_assignment):
+    assignment_id, calls = pdf_assignment
+    response = benchmark(teacher_client.get, f"/teacher/insights/{assignment_id}")
+    assert response.status_code == 200
+    assert b"Most-read paragraph" in response.data and b"33.3" in response.data
+    assert "regions" in calls and "cohort" in calls
+
+
+def bench_teacher_insights_owner_only(other_teacher_client, pdf_assignment):
+    """Another teacher sees neither the regions nor the class quantiles of an assignment."""
+    assignment_id, calls = pdf_assignment
+    response = other_teacher_client.get(f"/teacher/insights/{assignment_id}")
+    assert response.status_code == 302
+    assert calls == []
+    page = other_teacher_client.get(f"/teacher/insights/{assignment_id}", follow_redirects=True)
+    assert b"Most-read paragraph" not in page.data and b"33.3" not in page.data
@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+
+import live_focus
+from live_focus import FocusBroker, WINDOW_SECONDS
+
+
+class FakeClock:
+    """Stands in for time.monotonic, advanced by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(live_focus.time, "monotonic", clock)
+    return clock
+
+
+@pytest.mark.benchmark(group="live")
+def bench_publish_without_subscriber(benchmark, clock):
+    """Samples published while no teacher watches must not pile up in the broker."""
+    broker = FocusBroker()
+    counter = itertools.count()
+
+    def publish():
+        n = next(counter)
+        clock.now = n * 0.01  # 100 samples per second
+        broker.publish_sample(1, 1, "student", (n % 97) / 97, (n % 89) / 89, n % 10 == 0)
+
+    for _ in range(100_000):
+        publish()
+    benchmark(publish)
+    window = broker._windows[1][1]
+    assert len(window.samples) <= WINDOW_SECONDS * 100 + 1
+    assert sum(window.cells.values()) == len(window.samples)
+
+    # A student who stopped sending is dropped by the ticker, with their assignment
+    broker.publish_sample(1, 2, "idle", 0.5, 0.5, False)
+    clock.now += WINDOW_SECONDS + 1
+    broker.tick()
+    assert broker._windows == {}
+    assert broker._thread is not None
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import cron_utils
+import fixations
+import cohort
+import quantile_sketch
+import video_attention
+from benchmarks.synthetic import generate_session_samples
+from focus_store import FocusArrays
+from models import FocusData
+from datetime import datetime, timedelta
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def make_focus_data(samples, sample_rate_hz=10.0, seed=0):
+    """Transient FocusData objects shaped like one session of gaze samples."""
+    rng = np.random.default_rng(seed)
+    x, y, outside, offsets = generate_session_samples(rng, samples, sample_rate_hz)
+    start = datetime(2024, 9, 2, 9, 0, 0)
+    return [
+        FocusData(user_id=1, assignment_id=1, session_id=1, x_coord=x_coord, y_coord=y_coord,
+                  outside=is_outside, timestamp=start + timedelta(seconds=offset))
+        for x_coord, y_coord, is_outside, offset in zip(x.tolist(), y.tolist(), outside.tolist(), offsets.tolist())
+    ]
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"{size}_samples")
+def focus_data(request):
+    return make_focus_data(request.param)
+
+
+@pytest.mark.benchmark(group="metrics")
+@pytest.mark.parametrize("function", [
+    cron_utils.calculate_total_duration,
+    cron_utils.calculate_distraction_time,
+    cron_utils.calculate_focus_distribution,
+    cron_utils.count_focus_quadrants,
+    cron_utils.identify_focus_hotspots,
+    cron_utils.calculate_focus_transitions,
+    cron_utils.calculate_session_metrics,
+    cron_utils.summarize_focus_behavior,
+], ids=lambda function: function.__name__)
+def bench_cron_utils(benchmark, focus_data, function):
+    benchmark(function, focus_data)
+
+
+@pytest.mark.benchmark(group="metrics")
+def bench_calculate_focus_time(benchmark, focus_data):
+    total_duration = cron_utils.calculate_total_duration(focus_data)
+    benchmark(cron_utils.calculate_focus_time, focus_data, total_duration)
+
+
+@pytest.mark.benchmark(group="metrics")
+def bench_merge_and_summarize_sessions(benchmark, focus_data):
+    metrics = [cron_utils.calculate_session_metrics(focus_data)] * 50
+    benchmark(lambda: cron_utils.summarize_metrics(cron_utils.merge_session_metrics(metrics)))
+
+
+@pytest.mark.benchmark(group="fixations")
+@pytest.mark.parametrize("detector", [fixations.idt_fixations, fixations.ivt_fixations],
+                         ids=lambda detector: detector.__name__)
+def bench_detect_fixations(benchmark, focus_data, detector):
+    data = FocusArrays.from_entries(focus_data).sorted_by_time()
+    detected = benchmark(detector, data)
+    assert 0 < len(detected) < len(data)
+
+
+@pytest.mark.benchmark(group="video-attention")
+@pytest.mark.parametrize("samples", [100_000, 1_000_000], ids=lambda samples: f"{samples}_samples")
+def bench_attention_curve_counts(benchmark, samples):
+    rng = np.random.default_rng(0)
+    video_time = np.sort(rng.random(samples)) * 3600
+    outside = rng.random(samples) < 0.1
+    users = rng.integers(1, 31, samples)
+    _, seconds, counts, _ = benchmark(video_attention.curve_counts, video_time, outside, users)
+    assert counts.sum() == samples
+
+
+@pytest.fixture(scope="module")
+def shard_sketches():
+    """Sketches of focus % for 8 shards of a 4000-student cohort."""
+    rng = np.random.default_rng(0)
+    sketches = []
+    for values in np.array_split(rng.normal(70, 15, 4000), 8):
+        sketch = quantile_sketch.KLLSketch(seed=0)
+        sketch.extend(values)
+        sketches.append(sketch.to_dict())
+    return sketches
+
+
+@pytest.mark.benchmark(group="cohort-sketch")
+def bench_cohort_percentile_query(benchmark, shard_sketches):
+    def query():
+        merged = quantile_sketch.KLLSketch.from_dict(shard_sketches[0])
+        for sketch in shard_sketches[1:]:
+            merged.merge(quantile_sketch.KLLSketch.from_dict(sketch))
+        return merged.rank(75.0), merged.quantiles(cohort.QUANTILES)
+
+    rank, _ = benchmark(query)
+    assert 0.55 < rank < 0.7
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from content_regions import RegionIndex
+
+PAGES = 20
+SAMPLES = 1_000_000
+
+
+def make_document(pages=PAGES, paragraphs=10, lines=5, words=10):
+    """
+    (paragraph boxes, word boxes) of a text-only document laid out like a report: each page
+    a column of paragraphs made of lines of equal-width words. Boxes are (page, x0, y0, x1, y1).
+    """
+    line_height, word_width = 0.015, 0.07
+    word_boxes, paragraph_boxes = [], []
+    for page in range(1, pages + 1):
+        top = 0.08
+        for _ in range(paragraphs):
+            for line in range(lines):
+                y0 = top + line * line_height * 1.2
+                for word in range(words):
+                    x0 = 0.1 + word * word_width * 1.15
+                    word_boxes.append((page, x0, y0, x0 + word_width, y0 + line_height))
+            bottom = top + (lines - 1) * line_height * 1.2 + line_height
+            paragraph_boxes.append((page, 0.1, top, 0.1 + words * word_width * 1.15, bottom))
+            top = bottom + 2 * line_height
+    return np.array(paragraph_boxes), np.array(word_boxes)
+
+
+@pytest.fixture(scope="module")
+def document():
+    return make_document()
+
+
+@pytest.fixture(scope="module")
+def gaze():
+    rng = np.random.default_rng(0)
+    return rng.integers(1, PAGES + 1, SAMPLES), rng.random(SAMPLES), rng.random(SAMPLES)
+
+
+def scan_boxes(boxes, page, x, y):
+    """The per-box scan the index replaces: test every sample against every box."""
+    result = np.full(len(page), -1)
+    for position, (box_page, x0, y0, x1, y1) in enumerate(boxes):
+        hit = (page == box_page) & (x0 <= x) & (x <= x1) & (y0 <= y) & (y <= y1) & (result < 0)
+        result[hit] = position
+    return result
+
+
+@pytest.mark.benchmark(group="region-lookup")
+@pytest.mark.parametrize("kind", ["paragraph", "word"])
+def bench_region_index_lookup(benchmark, document, gaze, kind):
+    boxes = document[0] if kind == "paragraph" else document[1]
+    index = RegionIndex(*boxes.T)
+    hits = benchmark(index.lookup, *gaze)
+    assert (hits >= 0).any()
+
+
+@pytest.mark.benchmark(group="region-lookup")
+def bench_region_index_build(benchmark, document):
+    boxes = document[1]
+    assert len(benchmark(RegionIndex, *boxes.T)) == len(boxes)
+
+
+@pytest.mark.benchmark(group="region-lookup")
+def bench_paragraph_box_scan(benchmark, document, gaze):
+    paragraphs = document[0]
+    hits = benchmark.pedantic(scan_boxes, args=(paragraphs, *gaze), rounds=1, iterations=1)
+    np.testing.assert_array_equal(hits, RegionIndex(*paragraphs.T).lookup(*gaze))
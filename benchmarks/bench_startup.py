@@ -0,0 +1,52 @@
+"""
+Worker cold-start budget.
+
+Every gunicorn worker builds the app with create_app() at boot, so anything imported on
+the way is paid for by every worker in time and resident memory. These checks build the
+app in a fresh interpreter under `python -X importtime` and fail when a heavy library is
+loaded eagerly again or when the imports get slower than IMPORT_BUDGET_SECONDS.
+"""
+import os
+import subprocess
+import sys
+
+from benchmarks.conftest import PROJECT_ROOT
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.5"))
+
+# Only needed by heatmap rendering, LLM calls, PDF uploads and YouTube transcripts
+LAZY_MODULES = ("matplotlib", "scipy", "openai", "langchain_ollama", "pdfplumber", "youtube_transcript_api")
+
+
+WORKER_BOOT = "import app; app.create_app()"
+
+
+def boot_worker(*flags, code=WORKER_BOOT):
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=PROJECT_ROOT, env=os.environ.copy(),
+                          capture_output=True, text=True, check=True)
+
+
+def total_import_seconds(importtime_output):
+    """Sum of the cumulative times of top-level imports in `python -X importtime` output."""
+    total = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e6
+
+
+def bench_heavy_modules_are_lazy():
+    result = boot_worker(code=f"import sys; {WORKER_BOOT}; print(' '.join(sorted(sys.modules)))")
+    loaded = set(result.stdout.split())
+    eager = [module for module in LAZY_MODULES if module in loaded]
+    assert not eager, f"imported at worker start: {', '.join(eager)}"
+
+
+def bench_worker_import_time_budget():
+    # Best of three, so a busy machine does not fail the budget on its own
+    seconds = min(total_import_seconds(boot_worker("-X", "importtime").stderr) for _ in range(3))
+    print(f"\nworker imports: {seconds * 1000:.0f} ms (budget {IMPORT_BUDGET_SECONDS * 1000:.0f} ms)")
+    assert seconds <= IMPORT_BUDGET_SECONDS
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The benchmarks import the application modules from the project root and point
+# them at a scratch SQLite database before anything creates the Flask app.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="ifocus-bench-")
+os.environ.setdefault("IFOCUS_DATABASE_URI", f"sqlite:///{os.path.join(SCRATCH_DIR, 'bench.db')}")
+os.environ.setdefault("LLM_MODEL", "llama")
+
+from benchmarks.synthetic import SyntheticConfig, populate  # noqa: E402
+
+
+class StubLLM:
+    """Stands in for ChatOllama so the cron pipeline runs without a model server."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    content = "Stub insight. Best Regards, Your friendly iFocus Buddy"
+
+    def invoke(self, messages):
+        return type("AIMessage", (), {"content": self.content})()
+
+    def stream(self, messages):
+        for word in self.content.split(" "):
+            yield type("AIMessageChunk", (), {"content": word + " "})()
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    from app import create_app
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+
+@pytest.fixture(scope="session")
+def dataset(flask_app):
+    """A small classroom: 10 students x 2 assignments x 2 sessions of 5 minutes at 10 Hz."""
+    with flask_app.app_context():
+        from models import db
+        db.drop_all()
+        db.create_all()
+        return populate(SyntheticConfig())
+
+
+@pytest.fixture
+def app_context(flask_app, dataset):
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def scratch_static(tmp_path, monkeypatch):
+    """Run in a scratch directory so rendered heatmaps never land in the project's static folder."""
+    os.makedirs(tmp_path / "static" / "heatmaps")
+    os.makedirs(tmp_path / "static" / "teacher_heatmaps")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def login(flask_app, username, password="password"):
+    client = flask_app.test_client()
+    client.post("/login", data={"username": username, "password": password})
+    return client
+
+
+@pytest.fixture
+def student_client(flask_app, dataset):
+    return login(flask_app, "bench_student_0")
+
+
+@pytest.fixture
+def teacher_client(flask_app, dataset):
+    return login(flask_app, "bench_teacher_0")
+
+
+@pytest.fixture
+def cron(app_context, scratch_static, monkeypatch):
+    """
+    The cron_job module, inside an app context, with its LLM replaced by StubLLM
+    and heatmaps written to scratch.
+    """
+    import cron_job
+    monkeypatch.setattr("langchain_ollama.ChatOllama", StubLLM)
+    monkeypatch.setattr(cron_job, "heatmap_dir", str(scratch_static / "static" / "heatmaps"))
+    monkeypatch.setattr(cron_job, "teacher_heatmap_dir", str(scratch_static / "static" / "teacher_heatmaps"))
+    return cron_job
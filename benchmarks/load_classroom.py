@@ -0,0 +1,231 @@
+"""
+Load generator that simulates a classroom of WebGazer clients against a running server.
+
+Every synthetic student logs in through the real /login form, opens a focus session,
+registers its viewport and then streams gaze samples to /save_focus_data at a fixed rate.
+At the same time a teacher polls the dashboard, assignment and heatmap pages. The report
+lists throughput, latency percentiles and error rates per endpoint, plus how long a writer
+had to wait for the SQLite write lock while the test was running.
+
+Create the accounts once (no focus data needed), start gunicorn and run the test:
+    IFOCUS_DATABASE_URI=sqlite:////tmp/load.db python -m benchmarks.synthetic --students 60 --sessions 0
+    IFOCUS_DATABASE_URI=sqlite:////tmp/load.db gunicorn -w 4 -b 127.0.0.1:8000 'app:create_app()'
+    python -m benchmarks.load_classroom --students 60 --hz 15 --duration 120 --db /tmp/load.db
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import generate_session_samples
+
+VIEWPORT = {"width": 1440, "height": 900}
+CONTENT_RECT = {"left": 120, "top": 80, "width": 960, "height": 600}
+
+
+class Recorder:
+    """Collects latencies and outcomes per endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.requests = defaultdict(int)
+        self.lock_waits = []
+        self.lock_timeouts = 0
+        self.schedule_lag = []
+
+    async def request(self, client, name, method, url, expected=(200,), **kwargs):
+        self.requests[name] += 1
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[name][type(e).__name__] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[name][str(response.status_code)] += 1
+        return response
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name in sorted(self.requests):
+            latencies = np.array(self.latencies[name]) * 1000
+            total = self.requests[name]
+            failed = sum(self.errors[name].values())
+            endpoints[name] = {
+                "requests": total,
+                "throughput_per_s": round(total / elapsed, 2),
+                "error_rate": round(failed / total, 4) if total else 0.0,
+                "errors": dict(self.errors[name]),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+                "p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2) if latencies.size else None,
+                "max_ms": round(float(latencies.max()), 2) if latencies.size else None,
+            }
+
+        waits = np.array(self.lock_waits) * 1000
+        lag = np.array(self.schedule_lag) * 1000
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "endpoints": endpoints,
+            "db_write_lock": {
+                "probes": len(self.lock_waits) + self.lock_timeouts,
+                "timeouts": self.lock_timeouts,
+                "p50_wait_ms": round(float(np.percentile(waits, 50)), 2) if waits.size else None,
+                "p99_wait_ms": round(float(np.percentile(waits, 99)), 2) if waits.size else None,
+                "max_wait_ms": round(float(waits.max()), 2) if waits.size else None,
+            },
+            "client_schedule_lag_p99_ms": round(float(np.percentile(lag, 99)), 2) if lag.size else None,
+        }
+
+
+async def login(client, recorder, username, password):
+    response = await recorder.request(client, "login", "POST", "/login", expected=(302,),
+                                      data={"username": username, "password": password})
+    if response is None or response.status_code != 302:
+        raise RuntimeError(f"Login failed for {username}")
+
+
+async def run_student(base_url, recorder, username, password, assignment_id, hz, deadline, seed):
+    rng = np.random.default_rng(seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        await login(client, recorder, username, password)
+
+        response = await recorder.request(client, "focus_session_start", "POST", "/focus_session/start",
+                                          json={"assignment_id": assignment_id})
+        session_id = response.json()["session_id"]
+        response = await recorder.request(client, "focus_viewport", "POST", "/focus_viewport", json={
+            "session_id": session_id, "viewport": VIEWPORT, "content_rect": CONTENT_RECT,
+        })
+        viewport_id = response.json()["viewport_id"]
+
+        samples = int((deadline - time.monotonic()) * hz) + 1
+        x, y, outside, _ = generate_session_samples(rng, max(samples, 2), hz)
+        pixels_x = CONTENT_RECT["left"] + x * CONTENT_RECT["width"]
+        pixels_y = CONTENT_RECT["top"] + y * CONTENT_RECT["height"]
+
+        interval = 1.0 / hz
+        next_send = time.monotonic() + rng.random() * interval  # spread students across the interval
+        for i in range(samples):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if next_send > now:
+                await asyncio.sleep(next_send - now)
+            else:
+                recorder.schedule_lag.append(now - next_send)
+            next_send += interval
+
+            await recorder.request(client, "save_focus_data", "POST", "/save_focus_data", json={
+                "session_id": session_id,
+                "viewport_id": viewport_id,
+                "x": float(pixels_x[i]),
+                "y": float(pixels_y[i]),
+                "outside": bool(outside[i]),
+                "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            })
+
+        await recorder.request(client, "focus_session_end", "POST", f"/focus_session/{session_id}/end")
+
+
+async def run_teacher(base_url, recorder, username, password, assignment_id, interval, deadline):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await login(client, recorder, username, password)
+        pages = [
+            ("teacher_dashboard", "/teacher_dashboard"),
+            ("view_assignment", f"/assignment/{assignment_id}"),
+            ("teacher_heatmap", f"/teacher/heatmap/{assignment_id}"),
+        ]
+        while time.monotonic() < deadline:
+            for name, url in pages:
+                await recorder.request(client, name, "GET", url, expected=(200, 302))
+            await asyncio.sleep(interval)
+
+
+def probe_write_lock(db_path, recorder, deadline, interval=0.5, timeout=5.0):
+    """Measure how long a writer waits for the SQLite write lock while the load is running."""
+    connection = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    try:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                recorder.lock_waits.append(time.perf_counter() - start)
+                connection.execute("ROLLBACK")
+            except sqlite3.OperationalError:
+                recorder.lock_timeouts += 1
+            time.sleep(interval)
+    finally:
+        connection.close()
+
+
+async def run(args):
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + args.duration
+
+    tasks = [
+        run_student(args.base_url, recorder, f"{args.student_prefix}{n}", args.password,
+                    args.assignment_id, args.hz, deadline, seed=n)
+        for n in range(args.students)
+    ]
+    if args.teacher:
+        tasks.append(run_teacher(args.base_url, recorder, args.teacher, args.password, args.assignment_id,
+                                 args.teacher_interval, deadline))
+    if args.db:
+        tasks.append(asyncio.to_thread(probe_write_lock, args.db, recorder, deadline))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    report = recorder.report(time.monotonic() - start)
+    report["failed_clients"] = len(failures)
+    report["config"] = {"students": args.students, "hz": args.hz, "duration_s": args.duration}
+    for failure in failures[:5]:
+        print(f"Client failed: {failure!r}")
+    return report
+
+
+def print_report(report):
+    print(f"\nElapsed: {report['elapsed_s']} s, failed clients: {report['failed_clients']}")
+    print(f"{'endpoint':<22}{'req':>8}{'req/s':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<22}{stats['requests']:>8}{stats['throughput_per_s']:>9}{stats['error_rate'] * 100:>7.2f}"
+              f"{stats['p50_ms'] or 0:>9}{stats['p95_ms'] or 0:>9}{stats['p99_ms'] or 0:>9}{stats['max_ms'] or 0:>9}")
+    lock = report["db_write_lock"]
+    if lock["probes"]:
+        print(f"\nSQLite write lock wait: p50 {lock['p50_wait_ms']} ms, p99 {lock['p99_wait_ms']} ms, "
+              f"max {lock['max_wait_ms']} ms, timeouts {lock['timeouts']}/{lock['probes']}")
+    print(f"Client schedule lag p99: {report['client_schedule_lag_p99_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a classroom of WebGazer clients against a running server.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--hz", type=float, default=10.0, help="gaze samples per second per student")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--assignment-id", type=int, default=1)
+    parser.add_argument("--student-prefix", default="bench_student_")
+    parser.add_argument("--teacher", default="bench_teacher_0", help="teacher polling dashboards; empty to disable")
+    parser.add_argument("--teacher-interval", type=float, default=5.0, help="seconds between teacher page polls")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--db", help="path of the server's SQLite file, to measure write-lock contention")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Synthetic gaze data for benchmarks and load tests.
+
+Gaze is modelled as a sequence of fixations (a dwell around one point of the
+learning content with small jitter) separated by saccades, with occasional
+glances outside the content. Coordinates are normalised to the content element,
+like the ones stored by /save_focus_data.
+
+Populate a scratch database with:
+    IFOCUS_DATABASE_URI=sqlite:////tmp/bench.db python -m benchmarks.synthetic --students 30
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+from werkzeug.security import generate_password_hash
+
+
+@dataclass
+class SyntheticConfig:
+    students: int = 10
+    assignments: int = 2
+    teachers: int = 1
+    sessions_per_enrollment: int = 2
+    session_seconds: float = 300.0
+    sample_rate_hz: float = 10.0
+    outside_probability: float = 0.1
+    seed: int = 42
+    start: datetime = datetime(2024, 9, 2, 9, 0, 0)
+
+
+def generate_session_samples(rng, samples, sample_rate_hz, outside_probability=0.1):
+    """
+    Generate one session of gaze samples.
+    Returns (x, y, outside, offsets) arrays, where offsets are seconds since the session start.
+    """
+    # Fixations last roughly 200-600 ms; draw enough of them to cover every sample
+    fixation_samples = np.maximum(1, rng.normal(0.4, 0.15, samples) * sample_rate_hz).astype(int)
+    fixation_count = int(np.searchsorted(np.cumsum(fixation_samples), samples)) + 1
+    fixation_samples = fixation_samples[:fixation_count]
+
+    centres_x = rng.beta(2.0, 2.0, fixation_count)
+    centres_y = rng.beta(1.5, 2.5, fixation_count)   # reading bias towards the top
+    outside_fixations = rng.random(fixation_count) < outside_probability
+    # Glances away land just beyond one of the edges of the content
+    centres_x[outside_fixations] = rng.choice([-0.15, 1.15], outside_fixations.sum())
+
+    x = np.repeat(centres_x, fixation_samples)[:samples] + rng.normal(0, 0.01, samples)
+    y = np.repeat(centres_y, fixation_samples)[:samples] + rng.normal(0, 0.01, samples)
+    outside = np.repeat(outside_fixations, fixation_samples)[:samples]
+    offsets = np.arange(samples) / sample_rate_hz
+    return x, y, outside, offsets
+
+
+def generate_focus_rows(config, user_id, assignment_id, session_id, session_start, rng):
+    """Generate FocusData insert rows (dictionaries) for one session."""
+    samples = max(2, int(config.session_seconds * config.sample_rate_hz))
+    x, y, outside, offsets = generate_session_samples(rng, samples, config.sample_rate_hz,
+                                                      config.outside_probability)
+    return [
+        {
+            "user_id": user_id,
+            "assignment_id": assignment_id,
+            "session_id": session_id,
+            "x_coord": x_coord,
+            "y_coord": y_coord,
+            "outside": is_outside,
+            "timestamp": session_start + timedelta(seconds=offset),
+        }
+        for x_coord, y_coord, is_outside, offset in zip(x.tolist(), y.tolist(), outside.tolist(), offsets.tolist())
+    ]
+
+
+def populate(config, password="password"):
+    """
+    Fill the database bound to the current app context with synthetic users, assignments,
+    enrollments, closed focus sessions and focus data. Returns a dictionary of created ids.
+    Users are named bench_teacher_<n> and bench_student_<n> and share `password`.
+    """
+    from sqlalchemy import insert
+    from models import db, User, Assignment, Enrollment, FocusSession, FocusData
+    from focus_sessions import close_session
+
+    rng = np.random.default_rng(config.seed)
+    password_hash = generate_password_hash(password)
+
+    teachers = [User(username=f"bench_teacher_{n}", password=password_hash, role="Teacher")
+                for n in range(config.teachers)]
+    students = [User(username=f"bench_student_{n}", password=password_hash, role="Student")
+                for n in range(config.students)]
+    db.session.add_all(teachers + students)
+    db.session.commit()
+
+    assignments = [
+        Assignment(title=f"Benchmark Assignment {n}", teacher_id=teachers[n % len(teachers)].id,
+                   youtube_url=f"https://www.youtube.com/watch?v=bench{n:06d}")
+        for n in range(config.assignments)
+    ]
+    db.session.add_all(assignments)
+    db.session.commit()
+
+    enrollments = [Enrollment(user_id=student.id, assignment_id=assignment.id)
+                   for assignment in assignments for student in students]
+    db.session.add_all(enrollments)
+    db.session.commit()
+
+    sample_count = 0
+    sessions = []
+    for day, enrollment in enumerate(enrollments):
+        for n in range(config.sessions_per_enrollment):
+            session_start = config.start + timedelta(days=n, minutes=day)
+            session = FocusSession(user_id=enrollment.user_id, assignment_id=enrollment.assignment_id,
+                                   started_at=session_start, last_seen_at=session_start)
+            db.session.add(session)
+            db.session.flush()
+            rows = generate_focus_rows(config, enrollment.user_id, enrollment.assignment_id,
+                                       session.id, session_start, rng)
+            db.session.execute(insert(FocusData), rows)
+            sample_count += len(rows)
+            sessions.append(session)
+        db.session.commit()
+
+    for session in sessions:
+        close_session(session, "synthetic", commit=False)
+    db.session.commit()
+
+    return {
+        "teacher_ids": [teacher.id for teacher in teachers],
+        "student_ids": [student.id for student in students],
+        "assignment_ids": [assignment.id for assignment in assignments],
+        "session_ids": [session.id for session in sessions],
+        "sample_count": sample_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populate the configured database with synthetic gaze data.")
+    parser.add_argument("--students", type=int, default=SyntheticConfig.students)
+    parser.add_argument("--assignments", type=int, default=SyntheticConfig.assignments)
+    parser.add_argument("--teachers", type=int, default=SyntheticConfig.teachers)
+    parser.add_argument("--sessions", type=int, default=SyntheticConfig.sessions_per_enrollment,
+                        help="sessions per enrollment")
+    parser.add_argument("--session-seconds", type=float, default=SyntheticConfig.session_seconds)
+    parser.add_argument("--sample-rate", type=float, default=SyntheticConfig.sample_rate_hz, help="samples per second")
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    args = parser.parse_args()
+
+    config = SyntheticConfig(students=args.students, assignments=args.assignments, teachers=args.teachers,
+                             sessions_per_enrollment=args.sessions, session_seconds=args.session_seconds,
+                             sample_rate_hz=args.sample_rate, seed=args.seed)
+
+    from app import create_app
+    from extensions import db
+    app = create_app(minimal=True)
+    with app.app_context():
+        db.create_all()
+        created = populate(config)
+    print(f"Created {len(created['student_ids'])} students, {len(created['assignment_ids'])} assignments, "
+          f"{len(created['session_ids'])} sessions and {created['sample_count']} focus samples")
+
+
+if __name__ == "__main__":
+    main()
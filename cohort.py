@@ -0,0 +1,190 @@
+"""
+Class distributions of per-enrollment focus metrics, for comparing a student to the class.
+
+While `flask focus run-insights` processes enrollments it adds each student's focus %,
+average session length and transitions per minute to a KLL quantile sketch per assignment
+and metric (see quantile_sketch.py). Students are added whether or not their insights could be
+generated, and those the run does not process (deferred to the insight worker, or finished by
+an earlier attempt of the same run) are added from their cached session metrics, so every
+attempt sketches the shard's whole class. Once the shard's enrollments are done the sketches
+replace the shard's rows in the cohort_sketch table, one row per assignment, metric and shard.
+Readers merge the rows of the latest run, so percentile queries cost O(sketch size) and
+never touch FocusData. When the run reads from a snapshot the rows are written back with its
+other results at the end; until then the assignment stage of the same run reads the shard's
+sketches from memory, merged with the rows other shards of the run already stored.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, has_app_context
+
+from models import db, CohortSketch
+from quantile_sketch import KLLSketch
+from snapshot import current_snapshot
+
+# Metric name: short key used in prompts
+COHORT_METRICS = {"focus": "focus", "session_minutes": "session_min", "transitions": "sw"}
+COHORT_LABELS = {"focus": "Focus on the content (%)", "session_minutes": "Minutes per session",
+                 "transitions": "Transitions per minute"}
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def cohort_values(metrics):
+    """The per-enrollment values sketched for merged session metrics: focus %, minutes per session, transitions/min."""
+    duration = metrics["total_duration"]
+    minutes = duration / 60
+    values = {"session_minutes": minutes / metrics.get("session_count", 1)}
+    if duration:
+        values["focus"] = 100 * (duration - metrics["distraction_time"]) / duration
+        values["transitions"] = metrics["transitions"] / minutes
+    return values
+
+
+class CohortSketches:
+    """The sketches a cron run builds for one shard, per assignment and metric."""
+
+    def __init__(self, run_id, shard):
+        self.run_id = run_id
+        self.shard = f"{shard[0]}/{shard[1]}"
+        self.sketches = defaultdict(dict)
+        # (user_id, assignment_id) of the enrollments added, so none is counted twice
+        self.added = set()
+        self.stored = False
+
+    def add(self, user_id, assignment_id, metrics):
+        if (user_id, assignment_id) in self.added:
+            return
+        self.added.add((user_id, assignment_id))
+        for metric, value in cohort_values(metrics).items():
+            self.sketches[assignment_id].setdefault(metric, KLLSketch()).update(value)
+
+    def missing(self, enrollments):
+        """{assignment_id: user_ids} of the enrollments not added yet."""
+        missing = defaultdict(set)
+        for enrollment in enrollments:
+            if (enrollment.user_id, enrollment.assignment_id) not in self.added:
+                missing[enrollment.assignment_id].add(enrollment.user_id)
+        return missing
+
+    def store(self):
+        """
+        Write the sketches, replacing this shard's rows: committed now, or queued for the
+        snapshot's write-back when the run reads from one. Returns the number of rows written.
+        """
+        if db.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        snapshot = current_snapshot()
+        now = datetime.utcnow()
+        written = 0
+        for assignment_id, sketches in self.sketches.items():
+            for metric, sketch in sketches.items():
+                values = {"run_id": self.run_id, "count": sketch.count, "sketch": sketch.to_dict(), "updated_at": now}
+                statement = insert(CohortSketch).values(assignment_id=assignment_id, metric=metric, shard=self.shard,
+                                                        **values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[CohortSketch.assignment_id, CohortSketch.metric, CohortSketch.shard], set_=values)
+                if snapshot is not None:
+                    snapshot.write(statement)
+                else:
+                    db.session.execute(statement)
+                written += 1
+        if snapshot is None:
+            db.session.commit()
+        self.stored = True
+        return written
+
+    def stored_cohort(self, assignment_id):
+        """{metric: KLLSketch} copies of this shard's stored sketches of an assignment, or None."""
+        if not self.stored or not self.sketches.get(assignment_id):
+            return None
+        return {metric: KLLSketch.from_dict(sketch.to_dict())
+                for metric, sketch in self.sketches[assignment_id].items()}
+
+
+def current_cohort():
+    """The CohortSketches of the cron run in this app context, or None."""
+    return g.get("cohort_sketches") if has_app_context() else None
+
+
+@contextmanager
+def cohort_sketches(run_id, shard):
+    """
+    Collect the metrics of the enrollments processed in this app context (see
+    `record_cohort_metrics`). The caller stores them once every enrollment was seen, so a
+    run that fails part way never replaces the complete class of an earlier run.
+    """
+    sketches = CohortSketches(run_id, shard)
+    g.cohort_sketches = sketches
+    try:
+        yield sketches
+    finally:
+        g.pop("cohort_sketches", None)
+
+
+def record_cohort_metrics(user_id, assignment_id, metrics):
+    """Add an enrollment's merged metrics to the running cron job's sketches; does nothing outside one."""
+    sketches = current_cohort()
+    if sketches is not None and metrics is not None:
+        sketches.add(user_id, assignment_id, metrics)
+
+
+def load_cohort(assignment_id):
+    """
+    {metric: KLLSketch} merged over the shards of the latest run, or None before the first run.
+    During a run this shard's stored sketches stand in for its rows, which may not be written yet.
+    """
+    rows = (CohortSketch.query.filter_by(assignment_id=assignment_id)
+            .order_by(CohortSketch.updated_at.desc()).all())
+    sketches = current_cohort()
+    cohort = sketches.stored_cohort(assignment_id) if sketches is not None else None
+    if cohort is not None:
+        latest = sketches.run_id
+        rows = [row for row in rows if row.shard != sketches.shard]
+    elif not rows:
+        return None
+    else:
+        latest = rows[0].run_id
+        cohort = {}
+    for row in rows:
+        if row.run_id != latest:
+            continue
+        sketch = KLLSketch.from_dict(row.sketch)
+        cohort[row.metric] = cohort[row.metric].merge(sketch) if row.metric in cohort else sketch
+    return cohort
+
+
+def cohort_quantiles(assignment_id, cohort=None):
+    """
+    {metric: {"students": n, "quantiles": [p10, p25, p50, p75, p90]}} of the class, rounded,
+    or None when no sketches were stored yet.
+    """
+    cohort = cohort if cohort is not None else load_cohort(assignment_id)
+    if not cohort:
+        return None
+    return {metric: {"students": sketch.count,
+                     "quantiles": [round(value, 1) for value in sketch.quantiles(QUANTILES)]}
+            for metric, sketch in cohort.items()}
+
+
+def cohort_percentiles(assignment_id, metrics, cohort=None):
+    """
+    Where one student's merged metrics sit in the class: {metric: {"value", "percentile"
+    (% of the class at or below it), "median"}}, or None without sketches or metrics.
+    """
+    cohort = cohort if cohort is not None else load_cohort(assignment_id)
+    if not cohort or metrics is None:
+        return None
+    result = {}
+    for metric, value in cohort_values(metrics).items():
+        sketch = cohort.get(metric)
+        if sketch is None or not sketch.count:
+            continue
+        result[metric] = {
+            "value": round(value, 1),
+            "percentile": round(100 * sketch.rank(value)),
+            "median": round(sketch.quantiles([0.5])[0], 1),
+        }
+    return result
@@ -0,0 +1,219 @@
+import os
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from extensions import db
+
+
+@click.command("init-db")
+@click.option("--drop", is_flag=True, help="Drop every table first (destroys all data).")
+def init_db_command(drop):
+    """Create the database tables and indexes that do not exist yet."""
+    import models  # noqa: F401  registers every table on db.metadata
+
+    if drop:
+        click.confirm("This deletes all iFocus data. Continue?", abort=True)
+        db.drop_all()
+    db.create_all()
+    # create_all skips tables that already exist, so add nullable columns and indexes introduced since
+    add_missing_columns()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    click.echo(f"Database ready at {db.engine.url}")
+
+
+def add_missing_columns():
+    """ALTER TABLE ... ADD COLUMN for every nullable model column missing from an existing table."""
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                click.echo(f"Added column {table.name}.{column.name}")
+
+
+focus_cli = AppGroup("focus", help="Focus analytics jobs (heatmaps and LLM insights).")
+
+
+def parse_shard(ctx, param, value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise click.BadParameter("expected INDEX/COUNT, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise click.BadParameter("INDEX must be between 0 and COUNT - 1")
+    return index, count
+
+
+@focus_cli.command("run-insights")
+@click.option("--students-only", "scope", flag_value="students", help="Only generate per-student insights.")
+@click.option("--assignments-only", "scope", flag_value="assignments", help="Only generate per-assignment insights.")
+@click.option("--teacher", help="Only the assignments (and their students) of this teacher username.")
+@click.option("--assignment", "assignment_id", type=int, help="Only this assignment id.")
+@click.option("--shard", default="0/1", callback=parse_shard, show_default=True,
+              help="Process the units whose id hashes to INDEX out of COUNT shards.")
+@click.option("--run-id", help="Name of this run for lease bookkeeping [default: today's date].")
+@click.option("--profile", is_flag=True, help="Save a per-stage timing breakdown and a cProfile of the run.")
+@click.option("--snapshot/--no-snapshot", default=True, show_default=True,
+              help="Read focus data from a point-in-time copy of the database and write the results back at the end.")
+def run_insights_command(scope, teacher, assignment_id, shard, run_id, profile, snapshot):
+    """
+    Generate heatmaps and insights, the work of the nightly cron job.
+
+    Several processes or machines sharing the database can split the work with
+    --shard 0/N ... --shard N-1/N. Every enrollment and assignment is claimed with a
+    lease first, so overlapping or retried runs never repeat the same unit.
+    """
+    import cron_job
+    from models import User
+
+    teacher_id = None
+    if teacher:
+        user = User.query.filter_by(username=teacher, role="Teacher").first()
+        if user is None:
+            raise click.BadParameter(f"no teacher named {teacher}", param_hint="--teacher")
+        teacher_id = user.id
+
+    cron_job.check_llm_config()
+    options = dict(students=scope != "assignments", assignments=scope != "students", teacher_id=teacher_id,
+                   assignment_id=assignment_id, shard=shard, run_id=run_id, snapshot=snapshot)
+    if profile:
+        cron_job.run_profiled(current_app, cron_job.run_insights, **options)
+    else:
+        cron_job.run_insights(**options)
+
+
+@focus_cli.command("worker")
+@click.option("--once", is_flag=True, help="Exit when no job is due instead of polling.")
+@click.option("--poll", "poll_interval", default=5.0, show_default=True, help="Seconds between polls of an empty queue.")
+@click.option("--max-jobs", type=int, help="Exit after this many jobs.")
+def worker_command(once, poll_interval, max_jobs):
+    """Process queued insight jobs (enqueued when sessions close or samples arrive)."""
+    import cron_job
+    from insight_jobs import work
+
+    cron_job.check_llm_config()
+    processed = work(once=once, poll_interval=poll_interval, max_jobs=max_jobs)
+    click.echo(f"Processed {processed} jobs")
+
+
+@focus_cli.command("jobs")
+@click.option("--retry-dead", is_flag=True, help="Queue dead jobs again with a fresh set of attempts.")
+def jobs_command(retry_dead):
+    """Show the insight job queue by status."""
+    from insight_jobs import queue_stats, retry_dead_jobs
+
+    if retry_dead:
+        click.echo(f"Requeued {retry_dead_jobs()} dead jobs")
+    for status, count in sorted(queue_stats().items()):
+        click.echo(f"{status:<12}{count:>8}")
+
+
+@focus_cli.command("detect-fixations")
+def detect_fixations_command():
+    """Detect the fixations of sessions closed before fixation detection existed."""
+    from focus_sessions import backfill_fixations
+
+    sessions, legacy = backfill_fixations()
+    click.echo(f"Detected fixations for {sessions} sessions and {legacy} enrollments with legacy samples")
+
+
+@focus_cli.command("build-curves")
+@click.option("--assignment", "assignment_id", type=int, help="Only this assignment.")
+def build_curves_command(assignment_id):
+    """Rebuild the video attention curves from the samples of closed sessions."""
+    from video_attention import rebuild_curves
+
+    click.echo(f"Rebuilt the attention curves of {rebuild_curves(assignment_id)} assignments")
+
+
+@focus_cli.command("index-regions")
+@click.option("--assignment", "assignment_id", type=int, help="Only this assignment.")
+def index_regions_command(assignment_id):
+    """Extract the word, line, paragraph and figure regions of PDF assignments."""
+    from content_regions import index_pdf
+    from models import Assignment
+
+    query = Assignment.query.filter(Assignment.pdf_path.isnot(None))
+    if assignment_id is not None:
+        query = query.filter(Assignment.id == assignment_id)
+    for assignment in query:
+        try:
+            count = index_pdf(assignment)
+        except Exception as e:
+            db.session.rollback()
+            click.echo(f"fail  assignment {assignment.id}: {e}")
+            continue
+        db.session.commit()
+        click.echo(f"ok    assignment {assignment.id}: {count} regions")
+
+
+@focus_cli.command("export")
+@click.argument("dataset", type=click.Choice(["samples", "fixations", "sessions"]))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson", "parquet"]), default="csv", show_default=True)
+@click.option("--assignment", "assignment_ids", type=int, multiple=True, help="Only this assignment (repeatable).")
+@click.option("--student", "user_id", type=int, help="Only this student's user id.")
+@click.option("--start", help="Only rows from this time on (ISO 8601, UTC).")
+@click.option("--end", help="Only rows before this time (ISO 8601, UTC).")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip CSV and NDJSON; gzip codec for Parquet columns.")
+@click.option("-o", "--output", default="-", help="File to write, default stdout.")
+def export_command(dataset, fmt, assignment_ids, user_id, start, end, compress, output):
+    """Stream gaze samples, fixations or session metrics to a CSV, NDJSON or Parquet file."""
+    from export import export_stream, parse_time
+
+    try:
+        chunks = export_stream(dataset, fmt, compress, assignment_ids=list(assignment_ids) or None,
+                               user_id=user_id, start=parse_time(start), end=parse_time(end))
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    with click.open_file(output, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    if output != "-":
+        click.echo(f"Wrote {output}", err=True)
+
+
+@focus_cli.command("prefetch-transcripts")
+@click.argument("urls", nargs=-1)
+@click.option("--file", "url_file", type=click.File(), help="Read more URLs from this file, one per line.")
+@click.option("--assignments", "from_assignments", is_flag=True, help="Also prefetch every YouTube assignment.")
+@click.option("--language", default="en", show_default=True)
+@click.option("--workers", default=8, show_default=True, help="Videos fetched concurrently.")
+@click.option("--summarize", is_flag=True, help="Also store the LLM summary of each transcript.")
+def prefetch_transcripts_command(urls, url_file, from_assignments, language, workers, summarize):
+    """Fetch and store the transcripts of many YouTube videos ahead of use."""
+    from content import summarize_text
+    from models import Assignment
+    from transcripts import TranscriptStore
+
+    urls = list(urls)
+    if url_file:
+        urls += [line.strip() for line in url_file if line.strip() and not line.startswith("#")]
+    if from_assignments:
+        urls += [url for (url,) in db.session.query(Assignment.youtube_url).filter(Assignment.youtube_url.isnot(None))]
+    if not urls:
+        raise click.UsageError("Give URLs, --file or --assignments.")
+
+    store = TranscriptStore()
+    results = store.prefetch(urls, language=language, workers=workers,
+                             summarize=summarize_text if summarize else None,
+                             model=os.getenv("LLM_MODEL", "openai").lower())
+    for url, outcome in results.items():
+        click.echo(f"ok    {url}" if outcome == "ok" else f"fail  {url}: {outcome}")
+    failed = sum(outcome != "ok" for outcome in results.values())
+    click.echo(f"{len(results) - failed} stored, {failed} failed in {store.directory}")
+
+
+def register_commands(app: Flask):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(focus_cli)
@@ -0,0 +1,138 @@
+"""
+Learning-content processing shared by the web app and scripts: text extraction from
+uploaded PDFs, YouTube transcripts and their LLM summaries. Nothing here needs a request.
+"""
+import logging
+import os
+
+from instrumentation import timed
+from llm_gateway import gateway, LLMUnavailable
+from transcripts import DEFAULT_LANGUAGE, TranscriptStore, parse_video_id
+
+SUMMARY_SYSTEM_PROMPT = "You are an assistant that summarizes long transcripts into concise summaries."
+
+logger = logging.getLogger(__name__)
+
+
+def _summarize(text):
+    """Like `summarize_text`, but raises LLMUnavailable instead of returning None."""
+    if os.getenv("LLM_MODEL", "openai").lower() == "llama":
+        return summarize_text_llama(text)
+    return summarize_text_openai(text)
+
+
+def summarize_text(text):
+    """
+    Summarize text using the selected LLM model based on the LLM_MODEL environment variable.
+    Defaults to the OpenAI method if the environment variable is not set. Returns None when
+    the LLM is unavailable; new assignments then get their summary from a queued job.
+    """
+    try:
+        return _summarize(text)
+    except LLMUnavailable as e:
+        logger.warning("Skipping summary: %s", e)
+        return None
+
+def summarize_text_llama(text):
+    from langchain_ollama import ChatOllama
+
+    messages = [
+        (
+            "system",
+            SUMMARY_SYSTEM_PROMPT + "Please use the same front size as text for header sections. "
+        ),
+        ("human", f"Summarize the following text in rich text format in {200} words:\n\n{text}"),
+    ]
+    try:
+        with gateway.call("summary", *(content for _, content in messages)) as timeout:
+            llm = ChatOllama(
+                model="llama3.2",
+                temperature=0,
+                client_kwargs={"timeout": timeout}
+            )
+            with timed("llm_call", model="llama3.2", purpose="summary"):
+                ai_msg = llm.invoke(messages)
+        return ai_msg.content
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        logger.warning("Error summarizing text: %s", e)
+        return None
+
+def summarize_text_openai(text):
+    """
+    Summarize text using the OpenAI Chat API.
+    """
+    import openai
+    from openai import OpenAI
+
+    # Set your OpenAI API key
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    # Retries are left to the gateway and the insight job queue
+    client = OpenAI(api_key=openai.api_key, max_retries=0)
+    model = "gpt-4"
+    messages = [
+        {
+            "role": "system",
+            "content": SUMMARY_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Summarize the following text in rich text format in {200} words:\n\n{text}"
+        }
+    ]
+
+    try:
+        with gateway.call("summary", *(message["content"] for message in messages)) as timeout, \
+                timed("llm_call", model=model, purpose="summary"):
+            response = client.chat.completions.create(
+                messages=messages,
+                model=model,
+                timeout=timeout,
+            )
+        notes_content = "This is an AI generated notes. Please feel free to update...\n\n" + response.choices[0].message.content
+        return notes_content
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        logger.warning("Error summarizing text: %s", e)
+        return None
+
+def fetch_youtube_transcription(youtube_url, language=DEFAULT_LANGUAGE):
+    """
+    Summarize the captions of a YouTube video. Transcripts and summaries come from the local
+    transcript store when the video was seen before.
+    """
+    video_id = parse_video_id(youtube_url)
+    if video_id is None:
+        raise ValueError(f"Not a YouTube video URL: {youtube_url}")
+    llm_model = os.getenv("LLM_MODEL", "openai").lower()
+    return TranscriptStore().summary(video_id, summarize_text, llm_model, language)
+
+def extract_pdf_text(file_path):
+    import pdfplumber
+
+    with timed("pdf_extract"), pdfplumber.open(file_path) as pdf:
+        return " ".join(text for text in (page.extract_text() for page in pdf.pages) if text)
+
+def process_pdf(file_path):
+    """
+    Extract text from a PDF file and summarize it using OpenAI.
+    """
+    return summarize_text(extract_pdf_text(file_path))
+
+def summarize_assignment(assignment):
+    """
+    Store the summary of an assignment's PDF or video, for summary jobs queued while the LLM
+    was unavailable. Raises LLMUnavailable if it still is; returns False if summarizing failed.
+    """
+    if assignment.pdf_path:
+        summary = _summarize(extract_pdf_text(assignment.pdf_path))
+    else:
+        video_id = parse_video_id(assignment.youtube_url)
+        llm_model = os.getenv("LLM_MODEL", "openai").lower()
+        summary = TranscriptStore().summary(video_id, _summarize, llm_model)
+    if not summary:
+        return False
+    assignment.summary = summary
+    return True
@@ -0,0 +1,290 @@
+"""
+Content regions of PDF assignments and the spatial index that maps gaze onto them.
+
+When a PDF is uploaded its words, lines, paragraphs and figures are extracted once with
+pdfplumber and stored as ContentRegion boxes normalised to their page, where (0, 0) is the
+top-left and (1, 1) the bottom-right corner. The assignment page renders the PDF with pdf.js
+and sends, with every gaze sample, the page under the gaze and the position on that page,
+which already accounts for how far the student has scrolled.
+
+`RegionIndex` is a uniform grid over the pages whose cells list the regions overlapping
+them, so mapping samples to regions checks a few candidate boxes per sample, for all samples
+at once, instead of scanning every box. `region_dwell` sums the time the gaze spent on each
+paragraph and figure; it is part of the teacher's assignment insights.
+"""
+import os
+
+import numpy as np
+from sqlalchemy import String, delete, insert, select, type_coerce
+
+from fixations import MAX_GAP_SECONDS
+from instrumentation import timed
+from models import db, ContentRegion, FocusData
+from snapshot import analytics_session
+
+KINDS = ("word", "line", "paragraph", "figure")
+# Regions teachers see attention for; words and lines are kept for finer lookups
+BLOCK_KINDS = ("paragraph", "figure")
+# Cells per page side of the lookup grid
+REGION_GRID = int(os.getenv("REGION_GRID", "32"))
+# Vertical space between two lines, in median line heights, that starts a new paragraph
+PARAGRAPH_GAP = 0.8
+# Padding of region boxes for dwell lookups, in page sizes, absorbing some gaze jitter
+REGION_MARGIN = 0.01
+TEXT_MAX = 500
+CHUNK_SIZE = 50_000
+
+_SECOND = np.timedelta64(1, "s")
+_columns = FocusData.__table__.c
+_region_columns = ContentRegion.__table__.c
+
+
+def _box(item, page):
+    """(x0, y0, x1, y1) of a pdfplumber object, normalised to the page."""
+    left, top = page.bbox[0], page.bbox[1]
+    return (
+        min(max((item["x0"] - left) / page.width, 0.0), 1.0),
+        min(max((item["top"] - top) / page.height, 0.0), 1.0),
+        min(max((item["x1"] - left) / page.width, 0.0), 1.0),
+        min(max((item["bottom"] - top) / page.height, 0.0), 1.0),
+    )
+
+
+def _region(page, kind, item, text=None):
+    x0, y0, x1, y1 = _box(item, page)
+    return {"page": page.page_number, "kind": kind, "x0": x0, "y0": y0, "x1": x1, "y1": y1,
+            "text": text[:TEXT_MAX] if text else None}
+
+
+def group_paragraphs(lines, gap=PARAGRAPH_GAP):
+    """
+    Merge text lines (pdfplumber dicts ordered top to bottom) into paragraphs, starting a new
+    one wherever the space above a line exceeds `gap` median line heights.
+    """
+    if not lines:
+        return []
+    height = float(np.median([line["bottom"] - line["top"] for line in lines]))
+    groups = [[lines[0]]]
+    for previous, line in zip(lines, lines[1:]):
+        if line["top"] - previous["bottom"] > gap * height:
+            groups.append([])
+        groups[-1].append(line)
+    return [{
+        "x0": min(line["x0"] for line in group),
+        "top": min(line["top"] for line in group),
+        "x1": max(line["x1"] for line in group),
+        "bottom": max(line["bottom"] for line in group),
+        "text": " ".join(line["text"] for line in group),
+    } for group in groups]
+
+
+def page_regions(page):
+    """Word, line, paragraph and figure regions of one pdfplumber page."""
+    regions = [_region(page, "word", word, word["text"]) for word in page.extract_words()]
+    lines = sorted(page.extract_text_lines(return_chars=False), key=lambda line: line["top"])
+    regions += [_region(page, "line", line, line["text"]) for line in lines]
+    regions += [_region(page, "paragraph", paragraph, paragraph["text"]) for paragraph in group_paragraphs(lines)]
+    regions += [_region(page, "figure", image) for image in page.images]
+    return regions
+
+
+def extract_regions(file_path):
+    """The regions of every page of a PDF, as dicts ready for `store_regions`."""
+    import pdfplumber
+
+    with timed("pdf_regions"), pdfplumber.open(file_path) as pdf:
+        return [region for page in pdf.pages for region in page_regions(page)]
+
+
+def store_regions(assignment_id, regions):
+    """Replace an assignment's regions, in the current transaction. Returns how many were stored."""
+    db.session.execute(delete(ContentRegion).where(ContentRegion.assignment_id == assignment_id))
+    if regions:
+        db.session.execute(insert(ContentRegion), [dict(region, assignment_id=assignment_id) for region in regions])
+    return len(regions)
+
+
+def index_pdf(assignment):
+    """Extract and store the regions of a PDF assignment (the caller commits)."""
+    return store_regions(assignment.id, extract_regions(assignment.pdf_path))
+
+
+class RegionIndex:
+    """
+    Uniform grid over the pages of one document. Every page is split into grid x grid cells
+    and the regions overlapping each cell are listed smallest first, for all cells in one
+    flat array: the candidates of cell c are members[offsets[c]:offsets[c + 1]]. Pages are
+    numbered from 1, like pdfplumber and pdf.js number them.
+    """
+
+    def __init__(self, page, x0, y0, x1, y1, grid=REGION_GRID, margin=0.0):
+        self.page = np.asarray(page, dtype=np.int64)
+        self.x0 = np.asarray(x0, dtype=np.float64) - margin
+        self.y0 = np.asarray(y0, dtype=np.float64) - margin
+        self.x1 = np.asarray(x1, dtype=np.float64) + margin
+        self.y1 = np.asarray(y1, dtype=np.float64) + margin
+        self.grid = grid
+        self.pages = int(self.page.max()) if len(self.page) else 0
+
+        first_x, last_x = self._cell(self.x0), self._cell(self.x1)
+        first_y, last_y = self._cell(self.y0), self._cell(self.y1)
+        width = last_x - first_x + 1
+        counts = width * (last_y - first_y + 1)
+
+        # One entry per (region, covered cell), regions smallest first so lookups prefer them
+        order = np.argsort((self.x1 - self.x0) * (self.y1 - self.y0), kind="stable")
+        region = np.repeat(order, counts[order])
+        local = np.arange(len(region)) - np.repeat(np.cumsum(counts[order]) - counts[order], counts[order])
+        cells = (((self.page[region] - 1) * grid + first_y[region] + local // width[region]) * grid
+                 + first_x[region] + local % width[region])
+
+        by_cell = np.argsort(cells, kind="stable")
+        self.members = region[by_cell]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=self.pages * grid * grid))))
+
+    @classmethod
+    def from_rows(cls, rows, grid=REGION_GRID, margin=0.0):
+        """Index for (page, x0, y0, x1, y1, ...) rows, e.g. the result of `load_regions`."""
+        if not rows:
+            return cls(*(np.empty(0) for _ in range(5)), grid=grid, margin=margin)
+        columns = list(zip(*rows))
+        return cls(*columns[:5], grid=grid, margin=margin)
+
+    def __len__(self):
+        return len(self.page)
+
+    def _cell(self, value):
+        return np.clip(np.floor(value * self.grid), 0, self.grid - 1).astype(np.int64)
+
+    def lookup(self, page, x, y):
+        """
+        The region (position in the indexed arrays) containing each point, the smallest one
+        where regions overlap, or -1. Runs one vectorised step per candidate of the fullest
+        cell, each over the points that are still unresolved.
+        """
+        page = np.asarray(page, dtype=np.int64)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        result = np.full(len(page), -1, dtype=np.int64)
+        valid = (page >= 1) & (page <= self.pages) & (x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)
+        pending = np.flatnonzero(valid)
+        cells = ((page[pending] - 1) * self.grid + self._cell(y[pending])) * self.grid + self._cell(x[pending])
+        starts = self.offsets[cells]
+        counts = self.offsets[cells + 1] - starts
+
+        step = 0
+        while len(pending):
+            more = counts > step
+            pending, starts, counts = pending[more], starts[more], counts[more]
+            if not len(pending):
+                break
+            region = self.members[starts + step]
+            px, py = x[pending], y[pending]
+            hit = (self.x0[region] <= px) & (px <= self.x1[region]) & (self.y0[region] <= py) & (py <= self.y1[region])
+            result[pending[hit]] = region[hit]
+            pending, starts, counts = pending[~hit], starts[~hit], counts[~hit]
+            step += 1
+        return result
+
+
+def load_regions(assignment_id, kinds=BLOCK_KINDS):
+    """(page, x0, y0, x1, y1, id, kind, text) rows of an assignment's regions of the given kinds."""
+    columns = _region_columns
+    query = (select(columns.page, columns.x0, columns.y0, columns.x1, columns.y1, columns.id, columns.kind,
+                    columns.text)
+             .where(columns.assignment_id == assignment_id, columns.kind.in_(kinds))
+             .order_by(columns.id))
+    return analytics_session().execute(query).all()
+
+
+class PageSamples:
+    """
+    Gaze samples that landed on a PDF page, as parallel arrays: page (int64, from 1), x and
+    y on the page (float64, 0-1), timestamp (datetime64[us]), user_id and session_id (int64).
+    """
+
+    __slots__ = ("page", "x", "y", "timestamp", "user_id", "session_id")
+
+    def __init__(self, page, x, y, timestamp, user_id, session_id):
+        self.page = page
+        self.x = x
+        self.y = y
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.session_id = session_id
+
+    def __len__(self):
+        return len(self.page)
+
+
+def load_page_samples(assignment_id, chunk_size=CHUNK_SIZE):
+    """The page samples of an assignment, read in chunks with a column-only select."""
+    query = (select(_columns.page, _columns.page_x, _columns.page_y, type_coerce(_columns.timestamp, String),
+                    _columns.user_id, _columns.session_id)
+             .where(_columns.assignment_id == assignment_id, _columns.page.isnot(None))
+             .order_by(_columns.id))
+
+    chunks = []
+    result = analytics_session().connection().execution_options(yield_per=chunk_size).execute(query)
+    for rows in result.partitions():
+        count = len(rows)
+        page, x, y, timestamp, users, sessions = zip(*rows)
+        chunks.append(PageSamples(
+            np.fromiter(page, dtype=np.int64, count=count),
+            np.fromiter(x, dtype=np.float64, count=count),
+            np.fromiter(y, dtype=np.float64, count=count),
+            np.array(timestamp, dtype="datetime64[us]"),
+            np.fromiter(users, dtype=np.int64, count=count),
+            np.fromiter((0 if session is None else session for session in sessions), dtype=np.int64, count=count),
+        ))
+    if not chunks:
+        return None
+    return PageSamples(*(np.concatenate([getattr(chunk, name) for chunk in chunks]) for name in PageSamples.__slots__))
+
+
+def sample_seconds(timestamp, session_id, max_gap=MAX_GAP_SECONDS):
+    """
+    Seconds of gaze each sample stands for: the time until the session's next sample, or 0
+    for the last sample of a session and before gaps longer than max_gap (tracking lost).
+    """
+    order = np.lexsort((timestamp, session_id))
+    seconds = np.zeros(len(timestamp))
+    if len(order) < 2:
+        return seconds
+    gaps = np.diff(timestamp[order]) / _SECOND
+    same = (np.diff(session_id[order]) == 0) & (gaps <= max_gap)
+    seconds[order[:-1]] = np.where(same, gaps, 0.0)
+    return seconds
+
+
+def region_dwell(assignment_id, kinds=BLOCK_KINDS, limit=None):
+    """
+    Gaze time per region of a PDF assignment, most-read first: dicts with the region's id,
+    page, kind and text, its dwell seconds, share (of all the time the gaze was on a page)
+    and the number of students who looked at it. Regions nobody looked at are left out.
+    """
+    with timed("region_dwell"):
+        regions = load_regions(assignment_id, kinds)
+        samples = load_page_samples(assignment_id) if regions else None
+        if samples is None:
+            return []
+
+        index = RegionIndex.from_rows(regions, margin=REGION_MARGIN)
+        seconds = sample_seconds(samples.timestamp, samples.session_id)
+        hits = index.lookup(samples.page, samples.x, samples.y)
+        inside = hits >= 0
+        dwell = np.bincount(hits[inside], weights=seconds[inside], minlength=len(index))
+        readers = np.unique(np.column_stack((hits[inside], samples.user_id[inside])), axis=0)
+        students = np.bincount(readers[:, 0], minlength=len(index))
+        total = seconds.sum()
+
+    order = [int(position) for position in np.argsort(-dwell, kind="stable") if dwell[position] > 0]
+    return [{
+        "id": regions[position].id,
+        "page": regions[position].page,
+        "kind": regions[position].kind,
+        "text": regions[position].text,
+        "seconds": round(float(dwell[position]), 1),
+        "share": round(float(dwell[position] / total), 3) if total else 0.0,
+        "students": int(students[position]),
+    } for position in order[:limit]]
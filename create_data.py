@@ -1,6 +1,8 @@
 import os
-from app import app, db
-from routes import process_pdf, fetch_youtube_transcription
+from flask import current_app
+from app import create_app
+from extensions import db
+from content import process_pdf, fetch_youtube_transcription
 from models import User, Assignment, Enrollment
 from werkzeug.security import generate_password_hash
 
@@ -38,7 +40,7 @@ def create_assignments():
         return
 
      # Ensure the static folder path for the PDF file
-    static_folder = os.path.join(app.root_path, "static", "uploads", "pdfs")
+    static_folder = os.path.join(current_app.root_path, "static", "uploads", "pdfs")
     print(static_folder)
     os.makedirs(static_folder, exist_ok=True)
 
@@ -114,6 +116,7 @@ def create_assignments():
     print("Assignments assigned to students s1 and s2")
 
 if __name__ == "__main__":
+    app = create_app(minimal=True)
     with app.app_context():
         print("Creating users...")
         create_users()
@@ -2,7 +2,7 @@ from werkzeug.security import generate_password_hash
 from models import db, User
 from app import create_app
 
-app = create_app()
+app = create_app(minimal=True)
 
 # Create a superuser function
 def create_superuser():
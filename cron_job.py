@@ -1,28 +1,29 @@
+import argparse
+import cProfile
 import os
-import matplotlib.pyplot as plt
-from app import db, create_app
-from models import FocusData, Assignment, Enrollment
-import openai
-from openai import OpenAI
-from cron_utils import summarize_focus_behavior
-from langchain_ollama import ChatOllama
+import time
+import zlib
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+from sqlalchemy import update
+
+from models import db, User, FocusData, Assignment, Enrollment
+from focus_sessions import close_idle_sessions, session_metrics, session_metrics_by_user
+from cron_utils import merge_session_metrics
+from focus_store import heatmap_grid
+from prompts import PROMPT_REGIONS, student_prompt, assignment_prompt
+from content_regions import region_dwell
+from heatmaps import render_heatmap
+from instrumentation import timed, operation_latency
+from profiling import profiler, profile_dir
+from llm_gateway import gateway, LLMUnavailable
+from leases import DEFAULT_LEASE_TTL, acquire_lease, complete_lease, release_lease, lease_owner
+from snapshot import analytics_snapshot, analytics_session, current_snapshot
+from insight_jobs import defer_unit
+from cohort import cohort_percentiles, cohort_quantiles, cohort_sketches, record_cohort_metrics
 
-
-# Initialize OpenAI API key
-openai.api_key = None
 llm_model = os.getenv("LLM_MODEL", "openai").lower()
-if llm_model == "openai":
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    if not openai.api_key:
-        raise ValueError("The OPENAI_API_KEY environment variable is not set.")
-    else:
-        print("Generating insights using OpenAI Model")
-else:
-    print("Generating insights using Llama Model")
-
-# Set up Flask application context
-app = create_app()
-app.app_context().push()
 
 # Heatmap directory
 project_root = os.path.abspath(os.path.dirname(__file__))
@@ -30,23 +31,17 @@ heatmap_dir = os.path.join(project_root, 'static', 'heatmaps')
 teacher_heatmap_dir = os.path.join(project_root, 'static', 'teacher_heatmaps')
 
 os.makedirs(heatmap_dir, exist_ok=True)
+os.makedirs(teacher_heatmap_dir, exist_ok=True)
 
-def aggregate_focus_data(assignment_id):
-    """Aggregates focus data for all students in an assignment."""
-    focus_data = FocusData.query.filter_by(assignment_id=assignment_id).all()
-    if not focus_data:
-        return None  # No focus data available
-
-    x_coords = [data.x_coord for data in focus_data]
-    y_coords = [data.y_coord for data in focus_data]
-
-    return {"x_coords": x_coords, "y_coords": y_coords}
+# With a snapshot, leases are completed only at the final write-back, so they must outlive the run
+SNAPSHOT_LEASE_TTL = timedelta(hours=6)
 
 def generate_assignment_heatmap(assignment_id):
     """Generate a heatmap for all students in a given assignment."""
-    # Aggregate focus data
-    aggregated_data = aggregate_focus_data(assignment_id)
-    if not aggregated_data:
+    # Aggregate fixation time into heatmap bins inside the database
+    with profiler.stage("query"):
+        grid, label = heatmap_grid(assignment_id=assignment_id)
+    if grid is None:
         return None  # No focus data available
 
     # File naming convention
@@ -54,92 +49,95 @@ def generate_assignment_heatmap(assignment_id):
     heatmap_path = os.path.join(teacher_heatmap_dir, file_name)
 
     # Generate heatmap
-    plt.figure(figsize=(10, 8))
-    plt.hist2d(aggregated_data["x_coords"], aggregated_data["y_coords"], bins=50, cmap='hot')
-    plt.colorbar(label='Frequency')
-    plt.title(f'Heatmap for Assignment {assignment_id}')
-    plt.xlabel('X Coordinate')
-    plt.ylabel('Y Coordinate')
-    plt.savefig(heatmap_path)
-    plt.close()
+    with profiler.stage("render"):
+        return render_heatmap(grid, heatmap_path, f'Heatmap for Assignment {assignment_id}', label)
+
+
+def assignment_insight_messages(assignment):
+    """(system, user) prompts for an assignment's insights, or None when there is no focus data."""
+    # Per-student metrics merged from the metrics cached on every closed session
+    with profiler.stage("metrics"):
+        per_user = session_metrics_by_user(assignment.id)
+        pooled = merge_session_metrics(per_user.values())
+        if pooled is None:
+            return None
+        usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(per_user)))
+        regions = region_dwell(assignment.id, limit=PROMPT_REGIONS) if assignment.pdf_path else None
+        cohort = cohort_quantiles(assignment.id)
+    per_student = {usernames.get(user_id, f"user {user_id}"): metrics for user_id, metrics in per_user.items()}
+    return assignment_prompt(assignment, pooled, per_student, regions, cohort)
 
-    return heatmap_path
 
 def generate_assignment_insights(assignment):
     """Generate insights for an assignment using aggregated focus data."""
-    # Aggregate focus data for all students
-    focus_data = FocusData.query.filter_by(assignment_id=assignment.id).all()
-    if not focus_data:
-        print(f"No focus data available for Assignment {assignment.id}.")
-        return None
-
-    # Summarize focus behavior using the utility function
-    summary = summarize_focus_behavior(focus_data)
-    if summary is None:
+    messages = assignment_insight_messages(assignment)
+    if messages is None:
         print(f"Error generating insights for assignment Assignment {assignment.id}")
         return
 
-    # Prepare a prompt for OpenAI
-    prompt = (
-        f"Analyze the following summary of focus behavior for Assignment '{assignment.title}':\n\n"
-        f"{summary}\n\n"
-        f"Based on this summary, provide actionable insights to help the teacher improve student engagement, "
-        f"address potential distractions, and make the assignment more effective. Keep the insights concise and useful."
-    )
-
-    if llm_model == "llama":
-        return generate_assignment_insights_llama(assignment, prompt)
-    else:
-        return generate_assignment_insights_openai(assignment, prompt)
+    with profiler.stage("llm"):
+        if llm_model == "llama":
+            return generate_assignment_insights_llama(assignment, *messages)
+        else:
+            return generate_assignment_insights_openai(assignment, *messages)
 
 
-def generate_assignment_insights_llama(assignment, prompt):
+def generate_assignment_insights_llama(assignment, system_prompt, prompt):
     """Generate insights for an assignment using aggregated focus data with Llama model"""
     messages = [
-        (
-            "system",
-            "You are an assistant that provides actionable feedback for teachers based on student focus behavior data."
-        ),
+        ("system", system_prompt),
         ("human", prompt)
     ]
     try:
-        llm = ChatOllama(
-            model="llama3.2",
-            temperature=0
-        )
+        from langchain_ollama import ChatOllama
+
+        with gateway.call("assignment_insights", system_prompt, prompt) as timeout:
+            llm = ChatOllama(
+                model="llama3.2",
+                temperature=0,
+                client_kwargs={"timeout": timeout}
+            )
 
-        ai_msg = llm.invoke(messages)
+            with timed("llm_call", model="llama3.2", purpose="assignment_insights"):
+                ai_msg = llm.invoke(messages)
         return ai_msg.content
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print(f"Error generating insights for Assignment {assignment.id}: {str(e)}")
         return None
 
-def generate_assignment_insights_openai(assignment, prompt):
+def generate_assignment_insights_openai(assignment, system_prompt, prompt):
     """Generate insights for an assignment using aggregated focus data."""
     # Prepare a prompt for OpenAI
 
     # Call OpenAI to generate insights
     try:
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        client = OpenAI(api_key=openai.api_key)
+        from openai import OpenAI
+
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
         model = "gpt-4"
         messages = [
             {
                 "role": "system",
-                "content": "You are an assistant that provides actionable feedback for teachers "
-                           "based on student focus behavior data."
+                "content": system_prompt
             },
             {
                 "role": "user",
                 "content": prompt
             }
         ]
-        response = client.chat.completions.create(
-            messages=messages,
-            model=model,
-        )
+        with gateway.call("assignment_insights", system_prompt, prompt) as timeout, \
+                timed("llm_call", model=model, purpose="assignment_insights"):
+            response = client.chat.completions.create(
+                messages=messages,
+                model=model,
+                timeout=timeout,
+            )
         insights = response.choices[0].message.content.strip()
         return insights
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print(f"Error generating insights for Assignment {assignment.id}: {str(e)}")
         return None
@@ -149,8 +147,13 @@ def store_assignment_insights(assignment, insights):
     """Store the insights in the Assignment table."""
     #print(assignment, insights)
     if assignment:
-        assignment.insights = insights
-        db.session.commit()
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            snapshot.write(update(Assignment).where(Assignment.id == assignment.id).values(insights=insights))
+            return
+        with profiler.stage("commit"):
+            assignment.insights = insights
+            db.session.commit()
     else:
         print(f"No assignment found with ID {assignment.id}")
 
@@ -158,159 +161,243 @@ def generate_insights_for_all_assignments():
     """Main function to generate heatmaps and insights for all assignments."""
     assignments = Assignment.query.all()
     for assignment in assignments:
-        print(f"Processing Assignment {assignment.id}: {assignment.title}")
-        # Generate heatmap
-        heatmap_path = generate_assignment_heatmap(assignment.id)
-        if heatmap_path:
-            print(f"Heatmap generated: {heatmap_path}")
-            # Generate insights
-            insights = generate_assignment_insights(assignment)
-            if insights:
-                # Store insights in Assignment table
-                store_assignment_insights(assignment, insights)
-                print(f"Insights generated and stored successfully for Assignment {assignment.id}")
-            else:
-                print(f"Failed to generate insights for Assignment {assignment.id}")
-        else:
-            print(f"Failed to generate heatmap for Assignment {assignment.id}")
+        with profiler.unit("assignment", assignment.id):
+            process_assignment(assignment)
+
+
+def process_assignment(assignment):
+    """Generate the heatmap and insights for one assignment. Returns False if it should be retried."""
+    print(f"Processing Assignment {assignment.id}: {assignment.title}")
+    # Generate heatmap
+    heatmap_path = generate_assignment_heatmap(assignment.id)
+    if heatmap_path:
+        print(f"Heatmap generated: {heatmap_path}")
+        # Generate insights
+        insights = generate_assignment_insights(assignment)
+        if insights:
+            # Store insights in Assignment table
+            store_assignment_insights(assignment, insights)
+            print(f"Insights generated and stored successfully for Assignment {assignment.id}")
+            return True
+        print(f"Failed to generate insights for Assignment {assignment.id}")
+        return False
+    # No focus data yet, nothing to retry
+    print(f"Failed to generate heatmap for Assignment {assignment.id}")
+    return True
 
 
 def generate_heatmap(student_id, assignment_id):
     """Generate a heatmap for a given student and assignment."""
-    focus_data = FocusData.query.filter_by(user_id=student_id, assignment_id=assignment_id).all()
-    if not focus_data:
+    with profiler.stage("query"):
+        grid, label = heatmap_grid(user_id=student_id, assignment_id=assignment_id)
+    if grid is None:
         return None  # No focus data available
 
-    # Extract x and y coordinates
-    x_coords = [data.x_coord for data in focus_data]
-    y_coords = [data.y_coord for data in focus_data]
-
     # File naming convention
     file_name = f'heatmap_user_{student_id}_assignment_{assignment_id}.png'
     heatmap_path = os.path.join(heatmap_dir, file_name)
 
     # Generate heatmap
-    plt.figure(figsize=(10, 8))
-    plt.hist2d(x_coords, y_coords, bins=50, cmap='hot')
-    plt.colorbar(label='Frequency')
-    plt.title(f'Heatmap for Student {student_id} - Assignment {assignment_id}')
-    plt.xlabel('X Coordinate')
-    plt.ylabel('Y Coordinate')
-    plt.savefig(heatmap_path)
-    plt.close()
-
-    return heatmap_path
-
-
-def generate_insights(student, assignment):
+    with profiler.stage("render"):
+        return render_heatmap(grid, heatmap_path, f'Heatmap for Student {student_id} - Assignment {assignment_id}',
+                              label)
+
+
+def student_insight_messages(student, assignment, metrics=None):
+    """
+    (system, user) prompts for a student's insights, or None when there is no focus data.
+    `metrics` are the student's merged session metrics, loaded when not given.
+    """
+    # Metrics cached on the student's closed sessions, and the class distribution to compare them with
+    with profiler.stage("metrics"):
+        if metrics is None:
+            metrics = session_metrics(user_id=student.id, assignment_id=assignment.id)
+        if metrics is None:
+            return None
+        cohort = cohort_percentiles(assignment.id, metrics)
+    return student_prompt(student, assignment, metrics, cohort)
+
+
+def generate_insights(student, assignment, metrics=None):
     """Generate insights using OpenAI or Llama based on the heatmap."""
-    # Simulate a description or summary of the heatmap as input text
-    focus_data = FocusData.query.filter_by(user_id=student.id, assignment_id=assignment.id).all()
-    summary = summarize_focus_behavior(focus_data)
-    if summary is None:
+    messages = student_insight_messages(student, assignment, metrics)
+    if messages is None:
         print(f"Error generating insights for Student {student.id}, Assignment {assignment.id}")
         return
-    text = f"Please analyze the student {student.username}'s  focus behavior for the assigment {assignment.title} " \
-           f"provied as {summary} and provide concise insights for student focus patterns."
 
-    if llm_model == "llama":
-        return generate_insights_llama(student, assignment, text)
-    else:
-        return generate_insights_openai(student, assignment, text)
+    with profiler.stage("llm"):
+        if llm_model == "llama":
+            return generate_insights_llama(*messages)
+        else:
+            return generate_insights_openai(*messages)
 
 
-def generate_insights_llama(student, assignment, text):
+def generate_insights_llama(system_prompt, prompt):
     """Generate insights using Llama based on the heatmap."""
     messages = [
-        (
-            "system",
-            f"You are an assistant that reviews student's focus behavior for the given assignment {assignment.title}  "
-            f"and student {student.username} and summarizes the into concise insights for student focus patterns."
-            f"Based on your analysis, Maintain a personal tone and address directly to the student and "
-            f"provide best suggestions for improving their focus and concentration and study patterns."
-            f"Use the signature as Best Regards, Your friendly iFocus Buddy"
-        ),
-        ("human", f"Summarize in rich text format in 200 words :\n\n{text}")
+        ("system", system_prompt),
+        ("human", prompt)
     ]
     try:
-        llm = ChatOllama(
-            model="llama3.2",
-            temperature=0
-        )
+        from langchain_ollama import ChatOllama
 
-        ai_msg = llm.invoke(messages)
+        with gateway.call("student_insights", system_prompt, prompt) as timeout:
+            llm = ChatOllama(
+                model="llama3.2",
+                temperature=0,
+                client_kwargs={"timeout": timeout}
+            )
+
+            with timed("llm_call", model="llama3.2", purpose="student_insights"):
+                ai_msg = llm.invoke(messages)
         return ai_msg.content
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print(f"Error generating insights: {str(e)}")
         return None
 
-def generate_insights_openai(student, assignment, text):
+def generate_insights_openai(system_prompt, prompt):
     """Generate insights using OpenAI or Llama based on the heatmap."""
-    client = OpenAI(api_key=openai.api_key)
+    from openai import OpenAI
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
     model = "gpt-4"
     messages = [
         {
             "role": "system",
-            "content": f"You are an assistant that reviews student's focus behavior for the given assignment {assignment.title}  "
-                       f"and student {student.username} and summarizes the into concise insights for student focus patterns."
-                       f"Based on your analysis, Maintain a personal tone and address directly to the student and "
-                       f"provide best suggestions for improving their focus and concentration and study patterns."
-                       f"Use the signature as Best Regards, Your friendly iFocus Buddy"
+            "content": system_prompt
         },
         {
             "role": "user",
-            "content": f"Summarize in rich text format in 200 words :\n\n{text}"
+            "content": prompt
         }
     ]
     try:
-        response = client.chat.completions.create(
-            messages=messages,
-            model=model,
-        )
+        with gateway.call("student_insights", system_prompt, prompt) as timeout, \
+                timed("llm_call", model=model, purpose="student_insights"):
+            response = client.chat.completions.create(
+                messages=messages,
+                model=model,
+                timeout=timeout,
+            )
         insights = response.choices[0].message.content
         return insights
+    except LLMUnavailable:
+        raise
     except Exception as e:
         print(f"Error generating insights: {str(e)}")
         return None
 
+def stream_llm(system_prompt, prompt, purpose):
+    """
+    Yield the completion for a prompt chunk by chunk as the model produces it, for the
+    on-demand regeneration pages. The time to the first chunk is recorded as llm_first_token.
+    """
+    start = time.perf_counter()
+    first_chunk = True
+    # The concurrency slot is held until the stream ends, and the deadline covers the whole stream
+    with gateway.call(purpose, system_prompt, prompt) as timeout:
+        if llm_model == "llama":
+            from langchain_ollama import ChatOllama
+
+            model = "llama3.2"
+            llm = ChatOllama(model=model, temperature=0, client_kwargs={"timeout": timeout})
+            chunks = (chunk.content for chunk in llm.stream([("system", system_prompt), ("human", prompt)]))
+        else:
+            from openai import OpenAI
+
+            model = "gpt-4"
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+            response = client.chat.completions.create(
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+                model=model,
+                stream=True,
+                timeout=timeout,
+            )
+            chunks = (event.choices[0].delta.content for event in response if event.choices)
+
+        with timed("llm_stream", model=model, purpose=purpose):
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if first_chunk:
+                    operation_latency.observe(time.perf_counter() - start, operation="llm_first_token",
+                                              model=model, purpose=purpose)
+                    first_chunk = False
+                yield chunk
+
+
 def store_insights(student_id, assignment_id, insights):
     """Store the insights in the Enrollment table."""
-    enrollment = Enrollment.query.filter_by(user_id=student_id, assignment_id=assignment_id).first()
-    if enrollment:
-        enrollment.insights = insights
-        db.session.commit()
-    else:
-        print(f"No enrollment found for student {student_id} and assignment {assignment_id}")
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        snapshot.write(update(Enrollment)
+                       .where(Enrollment.user_id == student_id, Enrollment.assignment_id == assignment_id)
+                       .values(insights=insights))
+        return
+    with profiler.stage("commit"):
+        enrollment = Enrollment.query.filter_by(user_id=student_id, assignment_id=assignment_id).first()
+        if enrollment:
+            enrollment.insights = insights
+            db.session.commit()
+            return
+    print(f"No enrollment found for student {student_id} and assignment {assignment_id}")
+
+def process_enrollment(enrollment):
+    """Generate the heatmap and insights for one student enrollment. Returns False if it should be retried."""
+    student_id = enrollment.user_id
+    assignment_id = enrollment.assignment_id
+    student = enrollment.user
+    assignment = enrollment.assignment
+
+    # Check if there is focus data
+    with profiler.stage("query"):
+        focus_data = (analytics_session().query(FocusData.id)
+                      .filter(FocusData.user_id == student_id, FocusData.assignment_id == assignment_id).first())
+    if focus_data:
+        print(f"Processing Student {student_id}, Assignment {assignment_id}")
+        with profiler.stage("metrics"):
+            metrics = session_metrics(user_id=student_id, assignment_id=assignment_id)
+        # Count the student in the class distribution of this run, whatever happens to the insights
+        record_cohort_metrics(student_id, assignment_id, metrics)
+        # Generate heatmap
+        heatmap_path = generate_heatmap(student_id, assignment_id)
+        if heatmap_path:
+            print(f"Heatmap generated: {heatmap_path}")
+            # Generate insights
+            insights = generate_insights(student, assignment, metrics)
+            if insights:
+                # Store insights in Enrollment table
+                store_insights(student_id, assignment_id, insights)
+                print(f"Insights generated and stored successfully")
+                return True
+            print(f"Failed to generate insights for Student {student_id}, Assignment {assignment_id}")
+            return False
+        print(f"Failed to generate heatmap for Student {student_id}, Assignment {assignment_id}")
+        return False
+    print(f"No focus data for Student {student_id}, Assignment {assignment_id}")
+    return True
+
+
+def add_unprocessed_to_cohort(sketches, enrollments):
+    """
+    Add the students this run did not process (deferred to the insight worker, or finished by an
+    earlier attempt of the run) to the class sketches, from their cached session metrics.
+    """
+    with profiler.stage("metrics"):
+        for assignment_id, user_ids in sketches.missing(enrollments).items():
+            for user_id, metrics in session_metrics_by_user(assignment_id).items():
+                if user_id in user_ids:
+                    sketches.add(user_id, assignment_id, metrics)
+
 
 def generate_for_user(user_id):
     user_enrollments = Enrollment.query.filter_by(user_id=user_id).all()
     # Iterate through the user's enrollments
     for enrollment in user_enrollments:
-        student_id = enrollment.user_id
-        assignment_id = enrollment.assignment_id
-        student = enrollment.user
-        assignment = enrollment.assignment
-
-        # Check if there is focus data
-        focus_data = FocusData.query.filter_by(user_id=student_id, assignment_id=assignment_id).all()
-        if focus_data:
-            print(f"Processing Student {student_id}, Assignment {assignment_id}")
-            # Generate heatmap
-            heatmap_path = generate_heatmap(student_id, assignment_id)
-            if heatmap_path:
-                print(f"Heatmap generated: {heatmap_path}")
-                # Generate insights
-                insights = generate_insights(student, assignment)
-                if insights:
-                    # Store insights in Enrollment table
-                    store_insights(student_id, assignment_id, insights)
-                    print(f"Insights generated and stored successfully")
-                else:
-                    print(f"Failed to generate insights for Student {student_id}, Assignment {assignment_id}")
-            else:
-                print(f"Failed to generate heatmap for Student {student_id}, Assignment {assignment_id}")
-        else:
-            print(f"No focus data for Student {student_id}, Assignment {assignment_id}")
+        with profiler.unit("enrollment", enrollment.id):
+            process_enrollment(enrollment)
 
 
 def generate_for_all_users():
@@ -319,35 +406,159 @@ def generate_for_all_users():
     enrollments = Enrollment.query.all()
 
     for enrollment in enrollments:
-        student_id = enrollment.user_id
-        assignment_id = enrollment.assignment_id
-        student = enrollment.user
-        assignment = enrollment.assignment
-
-        # Check if there is focus data
-        focus_data = FocusData.query.filter_by(user_id=student_id, assignment_id=assignment_id).all()
-        if focus_data:
-            print(f"Processing Student {student_id}, Assignment {assignment_id}")
-            # Generate heatmap
-            heatmap_path = generate_heatmap(student_id, assignment_id)
-            if heatmap_path:
-                print(f"Heatmap generated: {heatmap_path}")
-                # Generate insights
-                insights = generate_insights(student, assignment)
-                if insights:
-                    # Store insights in Enrollment table
-                    store_insights(student_id, assignment_id, insights)
-                    print(f"Insights generated and stored successfully")
-                else:
-                    print(f"Failed to generate insights for Student {student_id}, Assignment {assignment_id}")
+        with profiler.unit("enrollment", enrollment.id):
+            process_enrollment(enrollment)
+
+
+def in_shard(unit_id, shard):
+    """
+    Whether a unit belongs to shard (index, count). Units are spread by the CRC32 of their id,
+    which is stable across processes and machines, unlike Python's salted hash().
+    """
+    index, count = shard
+    return zlib.crc32(str(unit_id).encode()) % count == index
+
+
+def select_enrollments(teacher_id=None, assignment_id=None, shard=(0, 1)):
+    query = Enrollment.query.join(Assignment)
+    if teacher_id is not None:
+        query = query.filter(Assignment.teacher_id == teacher_id)
+    if assignment_id is not None:
+        query = query.filter(Enrollment.assignment_id == assignment_id)
+    return [enrollment for enrollment in query.order_by(Enrollment.id) if in_shard(enrollment.id, shard)]
+
+
+def select_assignments(teacher_id=None, assignment_id=None, shard=(0, 1)):
+    query = Assignment.query
+    if teacher_id is not None:
+        query = query.filter(Assignment.teacher_id == teacher_id)
+    if assignment_id is not None:
+        query = query.filter(Assignment.id == assignment_id)
+    return [assignment for assignment in query.order_by(Assignment.id) if in_shard(assignment.id, shard)]
+
+
+def run_units(kind, units, process, run_id, owner):
+    """
+    Process each unit under a CronLease, so shards, overlapping runs and retries sharing the
+    database never call the LLM twice for the same unit of the same run.
+    While the LLM gateway's circuit is open, units are handed to the insight job queue
+    instead of being processed. Returns (processed, skipped, failed, deferred) counts.
+    """
+    snapshot = current_snapshot()
+    ttl = SNAPSHOT_LEASE_TTL if snapshot is not None else DEFAULT_LEASE_TTL
+    processed = skipped = failed = deferred = 0
+    for unit in units:
+        key = f"{kind}:{unit.id}"
+        if not acquire_lease(key, owner, run_id, ttl=ttl):
+            print(f"Skipping {kind} {unit.id}: already done for run {run_id} or leased by another worker")
+            skipped += 1
+            continue
+
+        if gateway.breaker.is_open():
+            release_lease(key, owner)
+            defer_unit(kind, unit, gateway.breaker.retry_after())
+            deferred += 1
+            continue
+
+        with profiler.unit(kind, unit.id):
+            try:
+                succeeded = process(unit)
+            except LLMUnavailable as e:
+                print(f"Deferring {kind} {unit.id} to the insight worker: {e}")
+                release_lease(key, owner)
+                defer_unit(kind, unit, e.retry_after)
+                deferred += 1
+                continue
+            except Exception:
+                release_lease(key, owner)
+                raise
+        if succeeded:
+            if snapshot is not None:
+                snapshot.complete_lease(key, owner)
             else:
-                print(f"Failed to generate heatmap for Student {student_id}, Assignment {assignment_id}")
+                complete_lease(key, owner)
+            processed += 1
+        else:
+            release_lease(key, owner)
+            failed += 1
+    if deferred:
+        print(f"LLM unavailable, {deferred} {kind} units were queued for the insight worker")
+    return processed, skipped, failed, deferred
+
+
+def run_insights(students=True, assignments=True, teacher_id=None, assignment_id=None, shard=(0, 1),
+                 run_id=None, snapshot=True):
+    """
+    Generate heatmaps and insights for the selected enrollments and assignments of one shard.
+    run_id names the run for lease bookkeeping (default: today's date), so re-running the same
+    command only retries the units that failed or were never reached.
+    With snapshot=True focus data is read from a point-in-time copy of the database and the
+    results are written back in one transaction at the end (see snapshot.py).
+    """
+    run_id = run_id or date.today().isoformat()
+    owner = lease_owner()
+
+    # Idle sessions only need closing once, not once per shard
+    if shard[0] == 0:
+        print(f"\nClosed {close_idle_sessions()} idle focus sessions")
+    with analytics_snapshot() if snapshot else nullcontext():
+        _run_shard(students, assignments, teacher_id, assignment_id, shard, run_id, owner)
+
+
+def _run_shard(students, assignments, teacher_id, assignment_id, shard, run_id, owner):
+    # The sketches are stored before the assignment stage, so its prompts see this run's class
+    with cohort_sketches(run_id, shard) as sketches:
+        if students:
+            print(f"\nGenerating insights for students (shard {shard[0]}/{shard[1]}):")
+            enrollments = select_enrollments(teacher_id, assignment_id, shard)
+            counts = run_units("enrollment", enrollments, process_enrollment, run_id, owner)
+            add_unprocessed_to_cohort(sketches, enrollments)
+            print(f"Stored {sketches.store()} cohort sketches")
+            print("Enrollments: {} processed, {} skipped, {} failed, {} deferred".format(*counts))
+        if assignments:
+            print(f"\nGenerating insights for assignments (shard {shard[0]}/{shard[1]}):")
+            counts = run_units("assignment", select_assignments(teacher_id, assignment_id, shard),
+                               process_assignment, run_id, owner)
+            print("Assignments: {} processed, {} skipped, {} failed, {} deferred".format(*counts))
+
+
+def run_profiled(app, func, *args, **kwargs):
+    """Run func with the stage profiler and cProfile enabled, and save both to the profiles directory."""
+    profiler.enable()
+    run_profile = cProfile.Profile()
+    run_profile.runcall(func, *args, **kwargs)
+    report_path = profiler.save(profile_dir(app))
+    run_profile.dump_stats(report_path.replace(".json", ".prof"))
+    profiler.print_summary()
+    print(f"\nProfile saved to {report_path}")
+
+
+def check_llm_config():
+    if llm_model == "openai":
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError("The OPENAI_API_KEY environment variable is not set.")
+        print("Generating insights using OpenAI Model")
+    else:
+        print("Generating insights using Llama Model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate heatmaps and insights for all students and assignments.")
+    parser.add_argument("--profile", action="store_true",
+                        help="record a per-stage timing breakdown and a cProfile of the run in the profiles directory")
+    parser.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                        help="read from the live database instead of a point-in-time snapshot")
+    args = parser.parse_args()
+    check_llm_config()
+
+    from app import create_app
+    app = create_app(minimal=True)
+    with app.app_context():
+        if args.profile:
+            run_profiled(app, run_insights, snapshot=args.snapshot)
         else:
-            print(f"No focus data for Student {student_id}, Assignment {assignment_id}")
+            run_insights(snapshot=args.snapshot)
 
 
 if __name__ == "__main__":
-    print("\nGenerating insights for all the students:")
-    generate_for_all_users()
-    print("\nGenerating insights for all the assignments")
-    generate_insights_for_all_assignments()
\ No newline at end of file
+    main()
\ No newline at end of file
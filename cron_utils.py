@@ -1,48 +1,48 @@
-from datetime import timedelta
-from collections import Counter
 import numpy as np
-from scipy.ndimage import gaussian_filter
+
+from fixations import detect_fixations
+from focus_store import FocusArrays
+from scanpath import merge_scanpaths, scanpath_features
+
+# One second in the unit of FocusArrays.timestamp
+_SECOND = np.timedelta64(1, "s")
+
+
+def _arrays(data):
+    """Accept FocusArrays or a list of FocusData objects."""
+    return data if isinstance(data, FocusArrays) else FocusArrays.from_entries(data)
+
 
 def calculate_total_duration(data):
     """
     Calculate the total time spent based on focus data entries.
-    The `data` parameter should be a list of FocusData objects.
-    Assumes data is sorted by timestamp.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
     """
+    data = _arrays(data)
     if len(data) < 2:
         return 0  # Not enough data to calculate duration
 
-    # Sort the data by timestamp to ensure correct calculations
-    sorted_data = sorted(data, key=lambda entry: entry.timestamp)
-
-    total_duration = timedelta(0)
-    for i in range(1, len(sorted_data)):
-        # Add the time difference between consecutive entries
-        total_duration += sorted_data[i].timestamp - sorted_data[i - 1].timestamp
-
-    return total_duration.total_seconds()  # Return in seconds
+    # Consecutive differences of the sorted timestamps add up to last minus first
+    return float((data.timestamp.max() - data.timestamp.min()) / _SECOND)  # Return in seconds
 
 def calculate_distraction_time(data):
     """
     Calculate the total distraction time from focus data.
-    The `data` parameter should be a list of FocusData objects.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
+    The gap before every sample recorded outside the content counts as distraction.
     """
-    distraction_time = timedelta(0)
-    previous_time = None
-
-    for entry in data:
-        if entry.outside:
-            if previous_time:
-                distraction_time += entry.timestamp - previous_time
-        previous_time = entry.timestamp
+    data = _arrays(data)
+    if len(data) < 2:
+        return 0.0
 
-    return distraction_time.total_seconds()  # Return in seconds
+    gaps = np.diff(data.timestamp)
+    return float(gaps[data.outside[1:]].sum() / _SECOND)  # Return in seconds
 
 
 def calculate_focus_time(data, total_duration):
     """
     Calculate the total focus time from focus data.
-    The `data` parameter should be a list of FocusData objects.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
     """
     distraction_time = calculate_distraction_time(data)
     focus_time = total_duration - distraction_time
@@ -52,106 +52,225 @@ def calculate_focus_time(data, total_duration):
 def calculate_focus_distribution(data):
     """
     Calculate the focus distribution based on x and y coordinates.
-    The `data` parameter should be a list of FocusData objects.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
+    Coordinates are normalised to the learning content with y growing downwards.
     Returns a dictionary summarizing the focus intensity in different regions.
     """
     total_points = len(data)
     if total_points == 0:
         return {"top_left": 0, "top_right": 0, "bottom_left": 0, "bottom_right": 0}
 
-    # Divide the screen into quadrants
-    top_left = sum(1 for entry in data if entry.x_coord < 0.5 and entry.y_coord > 0.5)
-    top_right = sum(1 for entry in data if entry.x_coord >= 0.5 and entry.y_coord > 0.5)
-    bottom_left = sum(1 for entry in data if entry.x_coord < 0.5 and entry.y_coord <= 0.5)
-    bottom_right = sum(1 for entry in data if entry.x_coord >= 0.5 and entry.y_coord <= 0.5)
+    return {region: count / total_points for region, count in count_focus_quadrants(data).items()}
 
+
+def count_focus_quadrants(data):
+    """
+    Count the focus points falling in each quadrant of the learning content.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
+    """
+    data = _arrays(data)
+    left = data.x < 0.5
+    top = data.y < 0.5
+    # Divide the content area into quadrants
     return {
-        "top_left": top_left / total_points,
-        "top_right": top_right / total_points,
-        "bottom_left": bottom_left / total_points,
-        "bottom_right": bottom_right / total_points,
+        "top_left": int(np.count_nonzero(left & top)),
+        "top_right": int(np.count_nonzero(~left & top)),
+        "bottom_left": int(np.count_nonzero(left & ~top)),
+        "bottom_right": int(np.count_nonzero(~left & ~top)),
     }
 
 
+def _grid_cells(data, grid_size):
+    """
+    Flat grid cell (row * grid_size + column) of every sample, clamping gaze outside the
+    content onto the edge cells.
+    """
+    columns = np.clip((data.x * grid_size).astype(np.int64), 0, grid_size - 1)
+    rows = np.clip((data.y * grid_size).astype(np.int64), 0, grid_size - 1)
+    return rows * grid_size + columns
+
+
 def identify_focus_hotspots(data, grid_size=10):
     """
     Identify the areas with the highest concentration of focus points.
-    The `data` parameter should be a list of FocusData objects.
+    The `data` parameter should be FocusArrays or a list of FocusData objects.
     Returns the grid cell with the most focus points.
     """
-    if not data:
+    data = _arrays(data)
+    if not len(data):
         return None
 
-    # Normalize x and y coordinates to grid_size
-    focus_points = [(int(entry.x_coord * grid_size), int(entry.y_coord * grid_size)) for entry in data]
-
-    # Count occurrences of focus points in each grid cell
-    point_counts = Counter(focus_points)
+    # Count the focus points in each grid cell
+    cells = _grid_cells(data, grid_size)
+    counts = np.bincount(cells, minlength=grid_size * grid_size)
 
-    # Find the most focused grid cell
-    hotspot, count = point_counts.most_common(1)[0]
+    # Find the most focused grid cell; on ties, the one that received a point first
+    count = counts.max()
+    tied = np.flatnonzero(counts == count)
+    cell = tied[0] if len(tied) == 1 else cells[np.isin(cells, tied)][0]
     return {
-        "hotspot": hotspot,
-        "focus_intensity": count,
+        "hotspot": (int(cell % grid_size), int(cell // grid_size)),
+        "focus_intensity": int(count),
         "total_points": len(data),
-        "hotspot_ratio": count / len(data),
+        "hotspot_ratio": int(count) / len(data),
     }
 
 
-def calculate_focus_transitions(data, threshold=0.1):
+def calculate_focus_transitions(data, threshold=0.1, fixations=None):
     """
-    Calculate the number of transitions between focus regions.
-    The `data` parameter should be a list of FocusData objects.
+    Calculate the number of transitions between focus regions: saccades between consecutive
+    fixations that move the gaze further than `threshold` (in content widths).
+    The `data` parameter should be FocusArrays or a list of FocusData objects; pass the
+    already detected `fixations` of the samples to avoid detecting them again.
     """
-    if len(data) < 2:
-        return 0
+    if fixations is None:
+        fixations = detect_fixations(_arrays(data).sorted_by_time())
+    amplitudes, _ = fixations.saccades()
+    return int(np.count_nonzero(amplitudes > threshold))
 
-    transitions = 0
-    previous_x, previous_y = data[0].x_coord, data[0].y_coord
 
-    for entry in data[1:]:
-        if abs(entry.x_coord - previous_x) > threshold or abs(entry.y_coord - previous_y) > threshold:
-            transitions += 1
-        previous_x, previous_y = entry.x_coord, entry.y_coord
+def calculate_session_metrics(data, grid_size=10, fixations=None):
+    """
+    Calculate the cacheable metrics for one focus session.
+    The `data` parameter should be FocusArrays or a list of FocusData objects belonging to a single session.
+    Counts are stored instead of ratios so metrics of several sessions can be merged exactly.
+    `fixation_cells` holds the fixation time (seconds) per grid cell, next to the sample counts in `cells`,
+    and `scanpath` the cell-to-cell transitions and visits of the fixations (see scanpath.py).
+    """
+    data = _arrays(data).sorted_by_time()
+    if fixations is None:
+        fixations = detect_fixations(data)
+    cell_count = grid_size * grid_size
+    cells = np.bincount(_grid_cells(data, grid_size), minlength=cell_count)
+    fixation_grid_cells = _grid_cells(fixations, grid_size)
+    fixation_cells = np.bincount(fixation_grid_cells, weights=fixations.duration, minlength=cell_count)
 
-    return transitions
+    return {
+        "sample_count": len(data),
+        "total_duration": calculate_total_duration(data),
+        "distraction_time": calculate_distraction_time(data),
+        "quadrants": count_focus_quadrants(data),
+        "grid_size": grid_size,
+        "cells": cells.tolist(),
+        "transitions": calculate_focus_transitions(data, fixations=fixations),
+        "fixation_count": len(fixations),
+        "fixation_time": float(fixations.duration.sum()),
+        "fixation_cells": fixation_cells.round(3).tolist(),
+        "scanpath": scanpath_features(fixation_grid_cells, fixations.linked(), cell_count),
+    }
 
 
-def summarize_focus_behavior(data):
+def merge_session_metrics(metrics_list):
     """
-    Summarize the focus behavior based on the focus data.
-    Combines multiple metrics into a textual summary.
-    The `data` parameter should be a list of FocusData objects.
+    Merge the cached metrics of several sessions into one metrics dictionary.
+    Durations only cover time inside sessions, never the gaps between them.
     """
-    total_duration = calculate_total_duration(data)
-    distraction_time = calculate_distraction_time(data)
-    focus_time = calculate_focus_time(data, total_duration)
-    focus_distribution = calculate_focus_distribution(data)
-    hotspots = identify_focus_hotspots(data)
-    transitions = calculate_focus_transitions(data)
+    metrics_list = [metrics for metrics in metrics_list if metrics and metrics["sample_count"]]
+    if not metrics_list:
+        return None
+
+    grid_size = metrics_list[0]["grid_size"]
+    merged = {
+        "sample_count": 0,
+        "total_duration": 0,
+        "distraction_time": 0,
+        "quadrants": {"top_left": 0, "top_right": 0, "bottom_left": 0, "bottom_right": 0},
+        "grid_size": grid_size,
+        "cells": [0] * (grid_size * grid_size),
+        "transitions": 0,
+        "session_count": 0,
+        "fixation_count": 0,
+        "fixation_time": 0.0,
+        "fixation_cells": [0.0] * (grid_size * grid_size),
+    }
+    for metrics in metrics_list:
+        merged["sample_count"] += metrics["sample_count"]
+        merged["total_duration"] += metrics["total_duration"]
+        merged["distraction_time"] += metrics["distraction_time"]
+        merged["transitions"] += metrics["transitions"]
+        merged["session_count"] += metrics.get("session_count", 1)
+        for region, count in metrics["quadrants"].items():
+            merged["quadrants"][region] += count
+        for index, count in enumerate(metrics["cells"]):
+            merged["cells"][index] += count
+        # Sessions cached before fixation detection have no fixation metrics
+        merged["fixation_count"] += metrics.get("fixation_count", 0)
+        merged["fixation_time"] += metrics.get("fixation_time", 0.0)
+        for index, seconds in enumerate(metrics.get("fixation_cells", ())):
+            merged["fixation_cells"][index] += seconds
+    merged["scanpath"] = merge_scanpaths((metrics.get("scanpath") for metrics in metrics_list),
+                                         grid_size * grid_size)
+    return merged
+
+
+def summarize_metrics(metrics):
+    """
+    Build the textual summary used in LLM prompts from (merged) session metrics.
+    """
+    if not metrics:
+        return None
+
+    total_points = metrics["sample_count"]
+    total_duration = metrics["total_duration"]
+    distraction_time = metrics["distraction_time"]
+    focus_time = total_duration - distraction_time
+    quadrants = metrics["quadrants"]
+    session_count = metrics.get("session_count", 1)
+    sessions_text = f" over {session_count} sessions" if session_count > 1 else ""
 
     try:
         summary = (
-            f"Total duration: {total_duration} seconds.\n"
+            f"Total duration: {total_duration} seconds{sessions_text}.\n"
             f"Focus time: {focus_time:.2f} seconds ({(focus_time / total_duration) * 100:.2f}%).\n"
             f"Distraction time: {distraction_time:.2f} seconds ({(distraction_time / total_duration) * 100:.2f}%).\n"
             f"Focus distribution:\n"
-            f"  - Top-left: {focus_distribution['top_left'] * 100:.2f}%\n"
-            f"  - Top-right: {focus_distribution['top_right'] * 100:.2f}%\n"
-            f"  - Bottom-left: {focus_distribution['bottom_left'] * 100:.2f}%\n"
-            f"  - Bottom-right: {focus_distribution['bottom_right'] * 100:.2f}%\n"
+            f"  - Top-left: {quadrants['top_left'] / total_points * 100:.2f}%\n"
+            f"  - Top-right: {quadrants['top_right'] / total_points * 100:.2f}%\n"
+            f"  - Bottom-left: {quadrants['bottom_left'] / total_points * 100:.2f}%\n"
+            f"  - Bottom-right: {quadrants['bottom_right'] / total_points * 100:.2f}%\n"
         )
     except Exception as e:
         print(f"Error genearting summary: {str(e)}")
         print(f"Focus time: {focus_time:.2f} Total duration: {total_duration} seconds.")
         return None
 
-    if hotspots:
+    grid_size = metrics["grid_size"]
+    if metrics.get("fixation_time"):
+        # Weighted by how long the gaze rested, not by how many samples were recorded
+        seconds = max(metrics["fixation_cells"])
+        index = metrics["fixation_cells"].index(seconds)
+        hotspot = (index % grid_size, index // grid_size)
+        summary += (
+            f"The most focused region (hotspot) is grid cell {hotspot} "
+            f"with {seconds:.1f} seconds of fixation "
+            f"({seconds / metrics['fixation_time'] * 100:.2f}% of fixation time).\n"
+        )
+    else:
+        count = max(metrics["cells"])
+        index = metrics["cells"].index(count)
+        hotspot = (index % grid_size, index // grid_size)
         summary += (
-            f"The most focused region (hotspot) is grid cell {hotspots['hotspot']} "
-            f"with {hotspots['focus_intensity']} points ({hotspots['hotspot_ratio'] * 100:.2f}% of total points).\n"
+            f"The most focused region (hotspot) is grid cell {hotspot} "
+            f"with {count} points ({count / total_points * 100:.2f}% of total points).\n"
         )
 
-    summary += f"Number of focus transitions: {transitions}.\n"
+    summary += f"Number of focus transitions: {metrics['transitions']}.\n"
+    fixation_count = metrics.get("fixation_count")
+    if fixation_count:
+        summary += (f"Fixations: {fixation_count}, {metrics['fixation_time'] / fixation_count * 1000:.0f} ms "
+                    f"on average.\n")
 
     return summary
+
+
+def summarize_focus_behavior(data):
+    """
+    Summarize the focus behavior based on the focus data.
+    Combines multiple metrics into a textual summary.
+    The `data` parameter should be FocusArrays or a list of FocusData objects; samples are
+    grouped by session so the time between two sessions is not counted as duration.
+    """
+    sessions = _arrays(data).split_by("session_id")
+    return summarize_metrics(merge_session_metrics(
+        calculate_session_metrics(session_data) for session_data in sessions.values()
+    ))
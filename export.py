@@ -0,0 +1,283 @@
+"""
+Streaming export of gaze samples, fixations and per-session metrics as CSV, NDJSON or Parquet.
+
+Rows are read with a Core select and `yield_per`, and each batch of EXPORT_BATCH rows is
+encoded and handed on as bytes before the next one is fetched, so memory stays the same
+whatever the size of the export. CSV and NDJSON can be gzipped on the fly. Parquet is written
+one row group per batch and compresses its column chunks itself (gzip when asked for,
+otherwise snappy); it needs pyarrow, which is optional. Used by the teacher and admin export
+endpoints and `flask focus export`.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from instrumentation import export_rows, timed
+from models import db, FocusData, FocusSession, Fixation
+
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "10000"))
+GZIP_LEVEL = 6
+
+# Format: (mimetype, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+_samples = FocusData.__table__.c
+_fixations = Fixation.__table__.c
+_sessions = FocusSession.__table__.c
+
+# Dataset: (table, columns as (name, column or None when derived, type), time column)
+DATASETS = {
+    "samples": (FocusData.__table__, [
+        ("id", _samples.id, "int"),
+        ("user_id", _samples.user_id, "int"),
+        ("assignment_id", _samples.assignment_id, "int"),
+        ("session_id", _samples.session_id, "int"),
+        ("timestamp", _samples.timestamp, "datetime"),
+        ("x", _samples.x_coord, "float"),
+        ("y", _samples.y_coord, "float"),
+        ("outside", _samples.outside, "bool"),
+        ("page", _samples.page, "int"),
+        ("page_x", _samples.page_x, "float"),
+        ("page_y", _samples.page_y, "float"),
+        ("video_time", _samples.video_time, "float"),
+    ], _samples.timestamp),
+    "fixations": (Fixation.__table__, [
+        ("id", _fixations.id, "int"),
+        ("user_id", _fixations.user_id, "int"),
+        ("assignment_id", _fixations.assignment_id, "int"),
+        ("session_id", _fixations.session_id, "int"),
+        ("started_at", _fixations.started_at, "datetime"),
+        ("duration", _fixations.duration, "float"),
+        ("x", _fixations.x_coord, "float"),
+        ("y", _fixations.y_coord, "float"),
+        ("outside", _fixations.outside, "bool"),
+        ("sample_count", _fixations.sample_count, "int"),
+    ], _fixations.started_at),
+    # Closed sessions with their cached metrics flattened, see _session_row
+    "sessions": (FocusSession.__table__, [
+        ("id", _sessions.id, "int"),
+        ("user_id", _sessions.user_id, "int"),
+        ("assignment_id", _sessions.assignment_id, "int"),
+        ("started_at", _sessions.started_at, "datetime"),
+        ("ended_at", _sessions.ended_at, "datetime"),
+        ("end_reason", _sessions.end_reason, "str"),
+        ("metrics", _sessions.metrics, None),
+        ("samples", None, "int"),
+        ("duration", None, "float"),
+        ("distraction_time", None, "float"),
+        ("transitions", None, "int"),
+        ("fixations", None, "int"),
+        ("fixation_time", None, "float"),
+        ("top_left", None, "int"),
+        ("top_right", None, "int"),
+        ("bottom_left", None, "int"),
+        ("bottom_right", None, "int"),
+    ], _sessions.started_at),
+}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_time(value):
+    """A naive UTC datetime from an ISO 8601 string (with or without offset or 'Z'), or None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}, expected ISO 8601 such as 2024-09-02T09:00:00Z.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def export_filename(dataset, fmt, compress=False):
+    name = f"ifocus_{dataset}.{FORMATS[fmt][1]}"
+    return name + ".gz" if compress and fmt != "parquet" else name
+
+
+def export_mimetype(fmt, compress=False):
+    return "application/gzip" if compress and fmt != "parquet" else FORMATS[fmt][0]
+
+
+def _output_columns(dataset):
+    """(name, type) of the exported columns; the raw session metrics are not exported."""
+    return [(name, kind) for name, _, kind in DATASETS[dataset][1] if kind is not None]
+
+
+def _session_row(row):
+    """A sessions row with its metrics JSON replaced by the flat metric columns."""
+    metrics = row[-1] or {}
+    quadrants = metrics.get("quadrants", {})
+    return row[:-1] + (
+        metrics.get("sample_count"), metrics.get("total_duration"), metrics.get("distraction_time"),
+        metrics.get("transitions"), metrics.get("fixation_count"), metrics.get("fixation_time"),
+        quadrants.get("top_left"), quadrants.get("top_right"),
+        quadrants.get("bottom_left"), quadrants.get("bottom_right"),
+    )
+
+
+def export_batches(dataset, assignment_ids=None, user_id=None, start=None, end=None, batch_size=None):
+    """
+    Lists of row tuples (in _output_columns order) of a dataset in id order, EXPORT_BATCH at a
+    time, filtered by assignments, student and a [start, end) time range.
+    """
+    table, columns, time_column = DATASETS[dataset]
+    query = select(*(column for _, column, _ in columns if column is not None))
+    if assignment_ids is not None:
+        query = query.where(table.c.assignment_id.in_(assignment_ids))
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    if start is not None:
+        query = query.where(time_column >= start)
+    if end is not None:
+        query = query.where(time_column < end)
+    if dataset == "sessions":
+        query = query.where(_sessions.ended_at.isnot(None))
+    query = query.order_by(table.c.id)
+
+    result = db.session.connection().execution_options(yield_per=batch_size or EXPORT_BATCH).execute(query)
+    for rows in result.partitions():
+        yield [_session_row(tuple(row)) for row in rows] if dataset == "sessions" else [tuple(row) for row in rows]
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in columns)
+    for rows in batches:
+        writer.writerows(tuple(_json_value(value) for value in row) for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(columns, batches):
+    names = [name for name, _ in columns]
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(names, map(_json_value, row))), separators=(",", ":")) + "\n"
+                      for row in rows).encode()
+
+
+class _ChunkSink:
+    """Write-only file that keeps what was written since the last `take`, for ParquetWriter."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_chunks(columns, batches, compression):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "str": pa.string(),
+             "datetime": pa.timestamp("us")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, row)) for row in rows], schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _counted(dataset, fmt, batches):
+    with timed("export", dataset=dataset, format=fmt):
+        for rows in batches:
+            export_rows.inc(len(rows), dataset=dataset, format=fmt)
+            yield rows
+
+
+def export_stream(dataset, fmt, compress=False, **filters):
+    """
+    The bytes of an export as an iterator of chunks, for a streaming response or a file.
+    Filters are those of `export_batches`. Raises ValueError for an unknown dataset or format,
+    or Parquet without pyarrow, before anything is read.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset!r}, expected one of {', '.join(DATASETS)}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}.")
+    if fmt == "parquet" and not parquet_available():
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow).")
+
+    columns = _output_columns(dataset)
+    batches = _counted(dataset, fmt, export_batches(dataset, **filters))
+    if fmt == "parquet":
+        return _parquet_chunks(columns, batches, "gzip" if compress else "snappy")
+    chunks = _csv_chunks(columns, batches) if fmt == "csv" else _ndjson_chunks(columns, batches)
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_response(args, assignment_ids=None):
+    """
+    Streaming download for export query arguments: dataset (default samples), format (default
+    csv), user_id, start, end (ISO 8601) and gzip. Raises ValueError for invalid arguments.
+    """
+    dataset = args.get("dataset", "samples")
+    fmt = args.get("format", "csv")
+    compress = args.get("gzip", "").lower() in ("1", "true", "on", "yes")
+    user_id = args.get("user_id") or None
+    if user_id is not None and not user_id.isdigit():
+        raise ValueError("user_id must be a user id.")
+    chunks = export_stream(dataset, fmt, compress, assignment_ids=assignment_ids,
+                           user_id=user_id and int(user_id),
+                           start=parse_time(args.get("start")), end=parse_time(args.get("end")))
+    response = Response(stream_with_context(chunks), mimetype=export_mimetype(fmt, compress))
+    response.headers["Content-Disposition"] = f'attachment; filename="{export_filename(dataset, fmt, compress)}"'
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,7 @@
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager
+
+# Extension objects are created unbound and attached to an app in create_app,
+# so importing a model or a blueprint never builds an application
+db = SQLAlchemy()
+login_manager = LoginManager()
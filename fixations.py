@@ -0,0 +1,229 @@
+"""
+Fixation detection for raw gaze samples.
+
+WebGazer reports a gaze point per video frame, jittering around wherever the student is
+looking. Downstream metrics care about fixations (where the gaze rests, and for how long)
+and the saccades between them, not the individual points. Two detectors are provided,
+both working on time-sorted FocusArrays:
+
+- I-DT (dispersion threshold, the default): a fixation is a window of at least
+  MIN_FIXATION_SECONDS whose x and y spread stays under DISPERSION_THRESHOLD. Robust to
+  the noise of webcam eye tracking.
+- I-VT (velocity threshold): samples moving slower than VELOCITY_THRESHOLD join the
+  current fixation. Fully vectorised and faster, but more sensitive to jitter.
+
+Coordinates are normalised to the learning content, so thresholds are in content widths.
+Fixations of closed sessions are stored in the fixation table (see focus_sessions).
+"""
+import os
+
+import numpy as np
+from sqlalchemy import insert
+
+from models import db, Fixation
+
+# x range + y range of a fixation, in content widths (the old transition threshold)
+DISPERSION_THRESHOLD = 0.1
+# Content widths per second; slower movement is drift within a fixation
+VELOCITY_THRESHOLD = 1.0
+MIN_FIXATION_SECONDS = 0.1
+# Samples further apart than this (tracking lost, tab hidden) never share a fixation
+MAX_GAP_SECONDS = 0.5
+FIXATION_METHOD = os.getenv("FIXATION_METHOD", "idt").lower()
+
+_SECOND = np.timedelta64(1, "s")
+# I-DT min-duration windows longer than this many samples are not considered (> 600 Hz)
+_MAX_WINDOW = 64
+# Samples examined by the first step of extending an I-DT fixation (doubled on each further step)
+_EXTEND_CHUNK = 16
+
+
+class Fixations:
+    """
+    Fixations as parallel arrays: centroid x and y, start (datetime64[us]), duration
+    (seconds, first to last sample), outside (bool, most samples outside the content) and
+    sample_count. Ordered by start.
+    """
+
+    __slots__ = ("x", "y", "start", "duration", "outside", "sample_count")
+
+    def __init__(self, x, y, start, duration, outside, sample_count):
+        self.x = x
+        self.y = y
+        self.start = start
+        self.duration = duration
+        self.outside = outside
+        self.sample_count = sample_count
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty(0, dtype="datetime64[us]"), np.empty(0),
+                   np.empty(0, dtype=bool), np.empty(0, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.x)
+
+    def _intervals(self):
+        """Seconds from the end of each fixation to the start of the next one."""
+        ends = self.start[:-1] + (self.duration[:-1] * 1e6).astype(np.int64).astype("timedelta64[us]")
+        return (self.start[1:] - ends) / _SECOND
+
+    def linked(self):
+        """
+        For each pair of consecutive fixations, whether a saccade joins them: they are at
+        most MAX_GAP_SECONDS apart. Longer pauses are tracking gaps, not saccades.
+        """
+        if len(self) < 2:
+            return np.empty(0, dtype=bool)
+        return self._intervals() <= MAX_GAP_SECONDS
+
+    def saccades(self):
+        """(amplitude, seconds) of every saccade, see `linked`."""
+        if len(self) < 2:
+            return np.empty(0), np.empty(0)
+        linked = self.linked()
+        amplitude = np.hypot(np.diff(self.x), np.diff(self.y))
+        return amplitude[linked], self._intervals()[linked]
+
+
+def _segment_ends(timestamp, max_gap):
+    """For every sample, the index (exclusive) where its gap-free run of samples ends."""
+    gaps = np.flatnonzero(np.diff(timestamp) / _SECOND > max_gap) + 1
+    bounds = np.append(gaps, len(timestamp))
+    return bounds[np.searchsorted(bounds, np.arange(len(timestamp)), side="right")]
+
+
+def _collapse(data, starts, ends, min_duration):
+    """Fixations for the sample ranges [starts, ends) lasting at least min_duration."""
+    durations = (data.timestamp[ends - 1] - data.timestamp[starts]) / _SECOND
+    keep = durations >= min_duration
+    starts, ends, durations = starts[keep], ends[keep], durations[keep]
+    if not len(starts):
+        return Fixations.empty()
+
+    # reduceat sums each [start, next start) slice, so sum over the fixations' samples only
+    inside = np.zeros(len(data) + 1, dtype=np.int64)
+    inside[starts] += 1
+    inside[ends] -= 1
+    member = np.cumsum(inside[:-1]) > 0
+    counts = ends - starts
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return Fixations(
+        np.add.reduceat(data.x[member], offsets) / counts,
+        np.add.reduceat(data.y[member], offsets) / counts,
+        data.timestamp[starts],
+        durations.astype(np.float64),
+        np.add.reduceat(data.outside[member].astype(np.int64), offsets) * 2 > counts,
+        counts.astype(np.int64),
+    )
+
+
+def ivt_fixations(data, velocity_threshold=VELOCITY_THRESHOLD, min_duration=MIN_FIXATION_SECONDS,
+                  max_gap=MAX_GAP_SECONDS):
+    """Fixations of time-sorted FocusArrays by velocity threshold (I-VT)."""
+    if len(data) < 2:
+        return Fixations.empty()
+
+    seconds = np.diff(data.timestamp) / _SECOND
+    distance = np.hypot(np.diff(data.x), np.diff(data.y))
+    # Samples sharing a timestamp are compared as if 1/60 s apart (the fastest WebGazer rate)
+    velocity = distance / np.maximum(seconds, 1 / 60)
+    joined = (velocity <= velocity_threshold) & (seconds <= max_gap)
+
+    breaks = np.flatnonzero(~joined) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.append(breaks, len(data))
+    return _collapse(data, starts, ends, min_duration)
+
+
+def _extend(data, start, end, limit, threshold):
+    """Grow the fixation [start, end) sample by sample up to `limit` while its dispersion allows."""
+    chunk = _EXTEND_CHUNK
+    while end < limit:
+        stop = min(limit, end + chunk)
+        x, y = data.x[start:stop], data.y[start:stop]
+        dispersion = (np.maximum.accumulate(x) - np.minimum.accumulate(x)
+                      + np.maximum.accumulate(y) - np.minimum.accumulate(y))
+        over = np.flatnonzero(dispersion[end - start:] > threshold)
+        if len(over):
+            return end + int(over[0])
+        end = stop
+        chunk *= 2
+    return end
+
+
+def idt_fixations(data, dispersion_threshold=DISPERSION_THRESHOLD, min_duration=MIN_FIXATION_SECONDS,
+                  max_gap=MAX_GAP_SECONDS):
+    """
+    Fixations of time-sorted FocusArrays by dispersion threshold (I-DT).
+    The minimum-duration window of every sample is checked at once; the Python loop then
+    runs once per fixation (jumping over samples that cannot start one), not once per sample.
+    """
+    count = len(data)
+    if count < 2:
+        return Fixations.empty()
+
+    # Last sample of the minimum-duration window starting at each sample
+    window_ends = np.searchsorted(data.timestamp, data.timestamp + np.timedelta64(int(min_duration * 1e6), "us"))
+    segment_ends = _segment_ends(data.timestamp, max_gap)
+    lengths = window_ends - np.arange(count) + 1
+    valid = (window_ends < segment_ends) & (lengths <= _MAX_WINDOW)
+
+    # Dispersion of every window, growing all of them one sample per step
+    rows = np.flatnonzero(valid)
+    x_min = x_max = data.x[rows]
+    y_min = y_max = data.y[rows]
+    for step in range(1, int(lengths[rows].max()) if len(rows) else 0):
+        growing = step < lengths[rows]
+        index = np.minimum(rows + step, count - 1)
+        x_min = np.where(growing, np.minimum(x_min, data.x[index]), x_min)
+        x_max = np.where(growing, np.maximum(x_max, data.x[index]), x_max)
+        y_min = np.where(growing, np.minimum(y_min, data.y[index]), y_min)
+        y_max = np.where(growing, np.maximum(y_max, data.y[index]), y_max)
+    candidates = rows[(x_max - x_min) + (y_max - y_min) <= dispersion_threshold]
+
+    starts, ends = [], []
+    position = 0
+    while True:
+        next_candidate = np.searchsorted(candidates, position)
+        if next_candidate == len(candidates):
+            break
+        start = int(candidates[next_candidate])
+        end = _extend(data, start, int(window_ends[start]) + 1, int(segment_ends[start]), dispersion_threshold)
+        starts.append(start)
+        ends.append(end)
+        position = end
+    return _collapse(data, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), min_duration)
+
+
+def detect_fixations(data, method=None):
+    """Fixations of time-sorted FocusArrays with the FIXATION_METHOD ("idt" or "ivt") detector."""
+    method = method or FIXATION_METHOD
+    if method == "ivt":
+        return ivt_fixations(data)
+    if method == "idt":
+        return idt_fixations(data)
+    raise ValueError(f"Unknown fixation detection method: {method}")
+
+
+def store_fixations(fixations, user_id, assignment_id, session_id=None):
+    """Insert fixations into the fixation table, in the current transaction."""
+    if not len(fixations):
+        return 0
+    db.session.execute(insert(Fixation), [
+        {
+            "user_id": user_id,
+            "assignment_id": assignment_id,
+            "session_id": session_id,
+            "x_coord": x,
+            "y_coord": y,
+            "started_at": start,
+            "duration": duration,
+            "outside": outside,
+            "sample_count": sample_count,
+        }
+        for x, y, start, duration, outside, sample_count in zip(
+            fixations.x.tolist(), fixations.y.tolist(), fixations.start.tolist(), fixations.duration.tolist(),
+            fixations.outside.tolist(), fixations.sample_count.tolist())
+    ])
+    return len(fixations)
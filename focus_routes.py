@@ -0,0 +1,193 @@
+from datetime import datetime
+import os
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_login import login_required, current_user
+
+from extensions import db
+from models import Assignment, Enrollment, FocusData, FocusViewport, FocusSession
+from focus_sessions import start_session, touch_session, close_session
+from live_focus import broker, stream_assignment
+from instrumentation import SampledLogger, samples_ingested
+from insight_jobs import note_samples
+from video_attention import CLASS_CURVE, attention_curve
+from export import export_response
+
+# Gaze tracking API used by the assignment page: focus sessions, viewports, sample ingest
+# and the live classroom stream
+bp = Blueprint('focus', __name__)
+
+ingest_log = SampledLogger("ifocus.ingest", every=int(os.getenv("INGEST_LOG_EVERY", "100")))
+
+
+@bp.route('/assignment/<int:assignment_id>/live')
+@login_required
+def live_assignment_focus(assignment_id):
+    """Stream live per-student focus aggregates for an assignment as Server-Sent Events."""
+    if current_user.role != 'Teacher':
+        return jsonify({"error": "Only teachers can view live focus data."}), 403
+
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.teacher_id != current_user.id:
+        return jsonify({"error": "You do not have permission to view this assignment."}), 403
+
+    response = Response(stream_with_context(stream_assignment(assignment.id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/assignment/<int:assignment_id>/attention_curve')
+@login_required
+def assignment_attention_curve(assignment_id):
+    """
+    The class attention curve over a YouTube assignment's video, or one student's with
+    ?user_id=, per ?bucket= seconds (default 1).
+    """
+    if current_user.role != 'Teacher':
+        return jsonify({"error": "Only teachers can view attention curves."}), 403
+
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.teacher_id != current_user.id:
+        return jsonify({"error": "You do not have permission to view this assignment."}), 403
+
+    bucket = request.args.get('bucket', 1, type=int)
+    if bucket < 1:
+        return jsonify({"error": "bucket must be at least 1 second."}), 400
+    curve = attention_curve(assignment.id, request.args.get('user_id', CLASS_CURVE, type=int), bucket)
+    if curve is None:
+        return jsonify({"error": "No video focus data for this assignment yet."}), 404
+    return jsonify(curve)
+
+@bp.route('/assignment/<int:assignment_id>/export')
+@login_required
+def export_assignment_focus(assignment_id):
+    """
+    Download an assignment's gaze samples, fixations or session metrics as CSV, NDJSON or
+    Parquet, streamed as it is read (see export.py for the query arguments).
+    """
+    if current_user.role != 'Teacher':
+        return jsonify({"error": "Only teachers can export focus data."}), 403
+
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.teacher_id != current_user.id:
+        return jsonify({"error": "You do not have permission to view this assignment."}), 403
+
+    try:
+        return export_response(request.args, assignment_ids=[assignment.id])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.route('/focus_session/start', methods=['POST'])
+@login_required
+def start_focus_session():
+    """Open a focus session when the assignment page starts gaze tracking."""
+    data = request.json
+    enrollment = Enrollment.query.filter_by(user_id=current_user.id, assignment_id=data['assignment_id']).first()
+    if not enrollment:
+        return jsonify({"error": "You are not enrolled in this assignment."}), 403
+
+    session = start_session(current_user.id, enrollment.assignment_id)
+    return jsonify({"session_id": session.id})
+
+@bp.route('/focus_session/<int:session_id>/end', methods=['POST'])
+@login_required
+def end_focus_session(session_id):
+    """Close a focus session; called with navigator.sendBeacon when the page is unloaded."""
+    session = db.session.get(FocusSession, session_id)
+    if session is None or session.user_id != current_user.id:
+        return jsonify({"error": "Unknown focus session."}), 404
+
+    close_session(session, "unload")
+    return jsonify({"message": "Focus session closed."})
+
+def _open_session_for(session_id):
+    """Return the current user's open focus session with the given id, or None."""
+    session = db.session.get(FocusSession, session_id or 0)
+    if session is None or session.user_id != current_user.id or not session.is_open:
+        return None
+    return session
+
+@bp.route('/focus_viewport', methods=['POST'])
+@login_required
+def save_focus_viewport():
+    """Record the browser viewport and learning-content rectangle used to normalise gaze samples."""
+    data = request.json
+    session = _open_session_for(data.get('session_id'))
+    if session is None:
+        return jsonify({"error": "Focus session is closed, start a new one."}), 409
+
+    try:
+        viewport = data['viewport']
+        content = data['content_rect']
+        focus_viewport = FocusViewport(
+            user_id=current_user.id,
+            assignment_id=session.assignment_id,
+            session_id=session.id,
+            viewport_width=viewport['width'],
+            viewport_height=viewport['height'],
+            content_left=content['left'],
+            content_top=content['top'],
+            content_width=content['width'],
+            content_height=content['height']
+        )
+    except (KeyError, TypeError):
+        return jsonify({"error": "viewport needs width and height, content_rect left, top, width and height."}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db.session.add(focus_viewport)
+    db.session.commit()
+    return jsonify({"viewport_id": focus_viewport.id})
+
+@bp.route('/save_focus_data', methods=['POST'])
+@login_required
+def save_focus_data():
+    data = request.json
+
+    # Handle ISO 8601 timestamp with 'Z'
+    timestamp_str = data['timestamp'].replace('Z', '+00:00')
+    timestamp = datetime.fromisoformat(timestamp_str)
+
+    session = _open_session_for(data.get('session_id'))
+    if session is None:
+        return jsonify({"error": "Focus session is closed, start a new one."}), 409
+
+    # Store coordinates relative to the learning content so they do not depend on screen size
+    viewport = db.session.get(FocusViewport, data.get('viewport_id') or 0)
+    if viewport is None or viewport.session_id != session.id:
+        return jsonify({"error": "Unknown viewport, register it through /focus_viewport first."}), 400
+    x_coord, y_coord = viewport.normalise(data['x'], data['y'])
+
+    # PDF assignments also report the page under the gaze and the position on it (0-1)
+    page = data.get('page')
+    if page is not None and (not isinstance(page, int) or page < 1):
+        return jsonify({"error": "page must be a page number from 1."}), 400
+    # YouTube assignments report the player position while the video plays
+    video_time = data.get('video_time')
+    if video_time is not None and (not isinstance(video_time, (int, float)) or video_time < 0):
+        return jsonify({"error": "video_time must be a non-negative number of seconds."}), 400
+
+    touch_session(session)
+    focus_data = FocusData(
+        user_id=current_user.id,
+        assignment_id=session.assignment_id,
+        session_id=session.id,
+        viewport_id=viewport.id,
+        x_coord=x_coord,
+        y_coord=y_coord,
+        outside=data['outside'],
+        timestamp=timestamp,
+        page=page,
+        page_x=data.get('page_x') if page else None,
+        page_y=data.get('page_y') if page else None,
+        video_time=video_time
+    )
+    db.session.add(focus_data)
+    note_samples(current_user.id, session.assignment_id)
+    db.session.commit()
+    broker.publish_sample(focus_data.assignment_id, current_user.id, current_user.username,
+                          focus_data.x_coord, focus_data.y_coord, focus_data.outside)
+    samples_ingested.inc()
+    ingest_log.log("focus_sample_saved", user_id=current_user.id, session_id=session.id,
+                   assignment_id=session.assignment_id)
+    return jsonify({"message": "Focus data saved successfully!"})
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, select
+
+from models import db, FocusSession, FocusData, Fixation
+from focus_store import load_focus_arrays
+from snapshot import analytics_session
+from fixations import detect_fixations, store_fixations
+from cron_utils import calculate_session_metrics, merge_session_metrics, summarize_metrics
+from insight_jobs import enqueue_session_insights
+from video_attention import add_session_curve
+
+# A session without samples for this long is considered abandoned and closed
+SESSION_IDLE_TIMEOUT = timedelta(minutes=10)
+# last_seen_at is only refreshed when older than this, to avoid one UPDATE per sample
+LAST_SEEN_RESOLUTION = timedelta(seconds=15)
+
+
+def start_session(user_id, assignment_id):
+    """Open a new focus session, closing any session the student left open on the assignment."""
+    stale_sessions = FocusSession.query.filter_by(user_id=user_id, assignment_id=assignment_id,
+                                                  ended_at=None).all()
+    for stale in stale_sessions:
+        close_session(stale, "replaced", commit=False)
+
+    session = FocusSession(user_id=user_id, assignment_id=assignment_id)
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def touch_session(session, timestamp=None):
+    """Record activity on an open session. Returns True when the row was modified."""
+    now = timestamp or datetime.utcnow()
+    if now - session.last_seen_at >= LAST_SEEN_RESOLUTION:
+        session.last_seen_at = now
+        return True
+    return False
+
+
+def close_session(session, reason, commit=True):
+    """
+    Close a session, store its fixations, cache its metrics and add it to the video attention
+    curves so later readers never re-derive them. Sessions with samples queue insight
+    generation for the student and the assignment.
+    """
+    if not session.is_open:
+        return session
+
+    focus_data = load_focus_arrays(session_id=session.id).sorted_by_time()
+    session.metrics = None
+    if len(focus_data):
+        fixations = detect_fixations(focus_data)
+        store_fixations(fixations, session.user_id, session.assignment_id, session.id)
+        session.metrics = calculate_session_metrics(focus_data, fixations=fixations)
+        add_session_curve(session)
+        session.last_seen_at = max(session.last_seen_at, focus_data.timestamp.max().item())
+        enqueue_session_insights(session)
+    session.ended_at = datetime.utcnow()
+    session.end_reason = reason
+    if commit:
+        db.session.commit()
+    return session
+
+
+def close_idle_sessions(now=None):
+    """Close every open session that has not received samples within SESSION_IDLE_TIMEOUT."""
+    cutoff = (now or datetime.utcnow()) - SESSION_IDLE_TIMEOUT
+    idle_sessions = FocusSession.query.filter(FocusSession.ended_at.is_(None),
+                                              FocusSession.last_seen_at < cutoff).all()
+    for session in idle_sessions:
+        close_session(session, "idle", commit=False)
+    db.session.commit()
+    return len(idle_sessions)
+
+
+def session_metrics(user_id=None, assignment_id=None):
+    """
+    Merge the cached metrics of all closed sessions for a student and/or assignment.
+    Samples recorded before sessions existed are summarised as one extra pseudo-session.
+    """
+    query = analytics_session().query(FocusSession.metrics).filter(FocusSession.ended_at.isnot(None))
+    if user_id is not None:
+        query = query.filter(FocusSession.user_id == user_id)
+    if assignment_id is not None:
+        query = query.filter(FocusSession.assignment_id == assignment_id)
+
+    metrics = [metrics for (metrics,) in query]
+    legacy_data = load_focus_arrays(user_id=user_id, assignment_id=assignment_id, without_session=True)
+    if len(legacy_data):
+        metrics.append(calculate_session_metrics(legacy_data))
+    return merge_session_metrics(metrics)
+
+
+def summarize_sessions(user_id=None, assignment_id=None):
+    """Textual focus summary built from cached session metrics."""
+    return summarize_metrics(session_metrics(user_id=user_id, assignment_id=assignment_id))
+
+
+def session_metrics_by_user(assignment_id):
+    """Merged session metrics of every student of an assignment, as {user_id: metrics}."""
+    per_user = {}
+    closed_sessions = (analytics_session().query(FocusSession.user_id, FocusSession.metrics)
+                       .filter(FocusSession.assignment_id == assignment_id, FocusSession.ended_at.isnot(None)))
+    for user_id, metrics in closed_sessions:
+        per_user.setdefault(user_id, []).append(metrics)
+
+    legacy_data = load_focus_arrays(assignment_id=assignment_id, without_session=True)
+    for user_id, data in legacy_data.split_by("user_id").items():
+        per_user.setdefault(user_id, []).append(calculate_session_metrics(data))
+
+    merged = {user_id: merge_session_metrics(metrics) for user_id, metrics in per_user.items()}
+    return {user_id: metrics for user_id, metrics in merged.items() if metrics}
+
+
+def backfill_fixations():
+    """
+    Detect and store the fixations of closed sessions (recomputing their cached metrics) and
+    of legacy samples without a session that have none yet, e.g. data recorded before
+    fixation detection existed. Returns (sessions, legacy enrollments) processed.
+    """
+    closed = FocusSession.query.filter(FocusSession.ended_at.isnot(None), FocusSession.metrics.isnot(None))
+    sessions = [session for session in closed if "fixation_count" not in session.metrics]
+    for session in sessions:
+        focus_data = load_focus_arrays(session_id=session.id).sorted_by_time()
+        fixations = detect_fixations(focus_data)
+        store_fixations(fixations, session.user_id, session.assignment_id, session.id)
+        session.metrics = calculate_session_metrics(focus_data, fixations=fixations)
+        db.session.commit()
+
+    legacy = db.session.execute(
+        select(FocusData.user_id, FocusData.assignment_id).distinct()
+        .where(FocusData.session_id.is_(None))
+        .where(~exists().where(Fixation.session_id.is_(None), Fixation.user_id == FocusData.user_id,
+                               Fixation.assignment_id == FocusData.assignment_id))
+    ).all()
+    for user_id, assignment_id in legacy:
+        focus_data = load_focus_arrays(user_id=user_id, assignment_id=assignment_id,
+                                       without_session=True).sorted_by_time()
+        store_fixations(detect_fixations(focus_data), user_id, assignment_id)
+        db.session.commit()
+    return len(sessions), len(legacy)
@@ -0,0 +1,192 @@
+"""
+Array loader and SQL aggregation for gaze samples.
+
+Readers that only need coordinates, flags and timestamps should not build a FocusData ORM
+object per sample. `load_focus_arrays` runs a Core select of just those columns, streams the
+cursor in chunks and converts each chunk straight into NumPy arrays, returning one
+struct-of-arrays object that the heatmap and metrics code work on directly.
+Heatmaps do not need the samples at all: `binned_focus_grid` bins them inside the database,
+and `binned_fixation_grid` does the same for the detected fixations, weighted by duration.
+They all read from the cron run's analytics snapshot when one is active (see snapshot.py).
+"""
+import numpy as np
+from sqlalchemy import Integer, String, case, cast, func, select, type_coerce
+
+from heatmaps import HEATMAP_BINS
+from models import db, FocusData, Fixation
+from snapshot import analytics_session
+
+CHUNK_SIZE = 50_000
+
+# session_id of samples recorded before focus sessions existed
+NO_SESSION = -1
+
+_columns = FocusData.__table__.c
+_fixation_columns = Fixation.__table__.c
+
+
+class FocusArrays:
+    """
+    Gaze samples as parallel arrays: x and y (float64, normalised to the learning content),
+    outside (bool), timestamp (datetime64[us]), and user_id and session_id (int64,
+    NO_SESSION for samples without a session). Rows are in id (insertion) order.
+    """
+
+    __slots__ = ("x", "y", "outside", "timestamp", "user_id", "session_id")
+
+    def __init__(self, x, y, outside, timestamp, user_id, session_id):
+        self.x = x
+        self.y = y
+        self.outside = outside
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.session_id = session_id
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty(0, dtype=bool), np.empty(0, dtype="datetime64[us]"),
+                   np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def from_entries(cls, data):
+        """Arrays for a list of FocusData objects (or anything with the same attributes)."""
+        count = len(data)
+        return cls(
+            np.fromiter((entry.x_coord for entry in data), dtype=np.float64, count=count),
+            np.fromiter((entry.y_coord for entry in data), dtype=np.float64, count=count),
+            np.fromiter((bool(entry.outside) for entry in data), dtype=bool, count=count),
+            np.array([entry.timestamp for entry in data], dtype="datetime64[us]").reshape(count),
+            np.fromiter((entry.user_id or 0 for entry in data), dtype=np.int64, count=count),
+            np.fromiter((NO_SESSION if entry.session_id is None else entry.session_id for entry in data),
+                        dtype=np.int64, count=count),
+        )
+
+    def __len__(self):
+        return len(self.x)
+
+    def take(self, index):
+        """The samples selected by an index array or boolean mask, as a new FocusArrays."""
+        return FocusArrays(*(getattr(self, name)[index] for name in self.__slots__))
+
+    def sorted_by_time(self):
+        """Samples ordered by timestamp; ties keep their insertion order."""
+        return self.take(np.argsort(self.timestamp, kind="stable"))
+
+    def split_by(self, name):
+        """{value: FocusArrays} grouping the samples on user_id or session_id, order preserved."""
+        keys = getattr(self, name)
+        return {int(key): self.take(keys == key) for key in np.unique(keys)}
+
+
+def load_focus_arrays(user_id=None, assignment_id=None, session_id=None, without_session=False,
+                      chunk_size=CHUNK_SIZE):
+    """
+    Gaze samples matching the filters as FocusArrays, read with a column-only select.
+    without_session=True selects the legacy samples that belong to no focus session.
+    """
+    query = select(_columns.x_coord, _columns.y_coord, _columns.outside,
+                   # On SQLite the ISO text is parsed by NumPy, much faster than per-row datetimes
+                   type_coerce(_columns.timestamp, String), _columns.user_id, _columns.session_id)
+    if user_id is not None:
+        query = query.where(_columns.user_id == user_id)
+    if assignment_id is not None:
+        query = query.where(_columns.assignment_id == assignment_id)
+    if session_id is not None:
+        query = query.where(_columns.session_id == session_id)
+    if without_session:
+        query = query.where(_columns.session_id.is_(None))
+    query = query.order_by(_columns.id)
+
+    chunks = []
+    result = analytics_session().connection().execution_options(yield_per=chunk_size).execute(query)
+    for rows in result.partitions():
+        count = len(rows)
+        x, y, outside, timestamp, users, sessions = zip(*rows)
+        chunks.append(FocusArrays(
+            np.fromiter(x, dtype=np.float64, count=count),
+            np.fromiter(y, dtype=np.float64, count=count),
+            np.fromiter((bool(flag) for flag in outside), dtype=bool, count=count),
+            np.array(timestamp, dtype="datetime64[us]"),
+            np.fromiter(users, dtype=np.int64, count=count),
+            np.fromiter((NO_SESSION if session is None else session for session in sessions),
+                        dtype=np.int64, count=count),
+        ))
+
+    if not chunks:
+        return FocusArrays.empty()
+    if len(chunks) == 1:
+        return chunks[0]
+    return FocusArrays(*(np.concatenate([getattr(chunk, name) for chunk in chunks])
+                         for name in FocusArrays.__slots__))
+
+
+def _bin_index(column, bins):
+    """SQL expression for the histogram bin of a normalised coordinate, clamped like focus_grid."""
+    scaled = column * bins
+    if db.engine.dialect.name == "sqlite":
+        index = cast(scaled, Integer)  # truncates, which is floor for the non-negative values used
+    else:
+        index = cast(func.floor(scaled), Integer)  # PostgreSQL casts round
+    return case((column < 0, 0), (column >= 1, bins - 1), else_=index)
+
+
+def _binned_grid(columns, weight, time_column, bins, assignment_id, user_id, user_ids, start, end):
+    """Grid of `weight` summed per (x_bin, y_bin) of `columns`, or None when no row matches."""
+    x_bin = _bin_index(columns.x_coord, bins).label("x_bin")
+    y_bin = _bin_index(columns.y_coord, bins).label("y_bin")
+    query = select(x_bin, y_bin, weight).group_by(x_bin, y_bin)
+    if assignment_id is not None:
+        query = query.where(columns.assignment_id == assignment_id)
+    if user_id is not None:
+        query = query.where(columns.user_id == user_id)
+    if user_ids is not None:
+        query = query.where(columns.user_id.in_(user_ids))
+    if start is not None:
+        query = query.where(time_column >= start)
+    if end is not None:
+        query = query.where(time_column < end)
+
+    rows = analytics_session().execute(query).all()
+    if not rows:
+        return None
+    x_bins, y_bins, values = (np.array(column) for column in zip(*rows))
+    grid = np.zeros((bins, bins))
+    grid[x_bins, y_bins] = values
+    return grid
+
+
+def binned_focus_grid(assignment_id=None, user_id=None, user_ids=None, start=None, end=None, bins=HEATMAP_BINS):
+    """
+    The bins x bins count grid of `heatmaps.focus_grid`, computed with a GROUP BY in the
+    database so that only the populated bins are returned. Filters on an assignment, one
+    user or several (`user_ids` may be a list or a subquery) and on timestamp >= start and
+    < end. Returns None when no sample matches.
+    """
+    return _binned_grid(_columns, func.count(), _columns.timestamp, bins, assignment_id, user_id, user_ids,
+                        start, end)
+
+
+def binned_fixation_grid(assignment_id=None, user_id=None, user_ids=None, start=None, end=None,
+                         bins=HEATMAP_BINS):
+    """
+    Like `binned_focus_grid`, but summing the duration (seconds) of the stored fixations
+    whose centroid falls in each bin, filtered on their start time.
+    """
+    return _binned_grid(_fixation_columns, func.sum(_fixation_columns.duration), _fixation_columns.started_at,
+                        bins, assignment_id, user_id, user_ids, start, end)
+
+
+def heatmap_grid(assignment_id=None, user_id=None, user_ids=None, start=None, end=None, bins=HEATMAP_BINS):
+    """
+    (grid, colorbar label) for a heatmap: fixation time per bin when fixations have been
+    detected for the selection, else raw sample counts (e.g. before `flask focus
+    detect-fixations` was run on older data). Returns (None, None) without data.
+    """
+    filters = dict(assignment_id=assignment_id, user_id=user_id, user_ids=user_ids, start=start, end=end, bins=bins)
+    grid = binned_fixation_grid(**filters)
+    if grid is not None:
+        return grid, "Fixation time (s)"
+    grid = binned_focus_grid(**filters)
+    if grid is not None:
+        return grid, "Gaze samples"
+    return None, None
@@ -0,0 +1,49 @@
+import numpy as np
+
+from instrumentation import timed_function
+
+# Number of bins per axis. Coordinates are normalised to the learning-content element,
+# so every grid covers the same 0-1 square and grids from different students can be summed.
+HEATMAP_BINS = 50
+
+
+def focus_grid(x_coords, y_coords, bins=HEATMAP_BINS):
+    """
+    Bin normalised gaze coordinates into a fixed bins x bins count grid.
+    Points outside the learning content are clamped onto the nearest edge cell.
+    The grid is indexed as grid[x_bin, y_bin].
+    """
+    x = np.clip(np.asarray(x_coords, dtype=float), 0.0, 1.0)
+    y = np.clip(np.asarray(y_coords, dtype=float), 0.0, 1.0)
+    grid, _, _ = np.histogram2d(x, y, bins=bins, range=[[0.0, 1.0], [0.0, 1.0]])
+    return grid
+
+
+def _pyplot():
+    """
+    Import pyplot on first use with the non-interactive Agg backend, so web workers that
+    never render a heatmap do not pay for loading matplotlib.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+@timed_function("heatmap_render")
+def render_heatmap(grid, heatmap_path, title, label='Frequency'):
+    """
+    Render a grid produced by `focus_grid` (or a sum of them, or a fixation-time grid) to a
+    PNG file. `label` names the grid's unit on the colorbar.
+    """
+    plt = _pyplot()
+    plt.figure(figsize=(10, 8))
+    # Screen coordinates grow downwards, so draw row 0 at the top like the page itself
+    plt.imshow(grid.T, origin='upper', extent=(0.0, 1.0, 1.0, 0.0), cmap='hot', aspect='auto')
+    plt.colorbar(label=label)
+    plt.title(title)
+    plt.xlabel('X Coordinate')
+    plt.ylabel('Y Coordinate')
+    plt.savefig(heatmap_path)
+    plt.close()
+    return heatmap_path
@@ -0,0 +1,282 @@
+import os
+import random
+import time
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Enrollment, Assignment, CronLease, InsightJob
+from leases import take_over_lease, complete_lease, release_lease, lease_owner
+from llm_gateway import gateway, LLMUnavailable
+
+# Priorities, higher runs first: a student who just finished a session waits the least
+PRIORITY_SESSION_CLOSED = 10
+PRIORITY_SAMPLES = 5
+PRIORITY_ASSIGNMENT = 0
+# Nightly units handed over while the LLM was unavailable
+PRIORITY_DEFERRED = 1
+
+# Assignment insights aggregate every student, so wait a while to batch several closed sessions
+ASSIGNMENT_DELAY = timedelta(minutes=int(os.getenv("INSIGHT_ASSIGNMENT_DELAY_MINUTES", "10")))
+# Enqueue an enrollment job after this many new samples, even if the session is still open
+SAMPLE_TRIGGER = int(os.getenv("INSIGHT_SAMPLE_TRIGGER", "3000"))
+
+JOB_TIMEOUT = timedelta(minutes=15)
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+# Samples seen by this process since the last enqueue, per (user_id, assignment_id)
+_pending_samples = Counter()
+
+
+def _insert_for_dialect():
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _enqueue(kind, dedupe_key, assignment_id, user_id=None, priority=0, delay=timedelta(0)):
+    """
+    Insert a queued job, or merge into the queued job with the same dedupe_key by keeping the
+    higher priority and the earlier run_after. Runs in the caller's transaction.
+    """
+    now = datetime.utcnow()
+    insert = _insert_for_dialect()
+    statement = insert(InsightJob).values(
+        kind=kind, dedupe_key=dedupe_key, user_id=user_id, assignment_id=assignment_id, priority=priority,
+        status="queued", attempts=0, max_attempts=5, run_after=now + delay, created_at=now, updated_at=now,
+    )
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[InsightJob.dedupe_key],
+        index_where=InsightJob.status == "queued",
+        set_={
+            "priority": case((excluded.priority > InsightJob.priority, excluded.priority), else_=InsightJob.priority),
+            "run_after": case((excluded.run_after < InsightJob.run_after, excluded.run_after),
+                              else_=InsightJob.run_after),
+            "updated_at": now,
+        },
+    )
+    db.session.execute(statement)
+
+
+def enqueue_enrollment(user_id, assignment_id, priority=PRIORITY_SESSION_CLOSED, delay=timedelta(0)):
+    _enqueue("enrollment", f"enrollment:{user_id}:{assignment_id}", assignment_id, user_id=user_id,
+             priority=priority, delay=delay)
+
+
+def enqueue_assignment(assignment_id, priority=PRIORITY_ASSIGNMENT, delay=ASSIGNMENT_DELAY):
+    _enqueue("assignment", f"assignment:{assignment_id}", assignment_id, priority=priority, delay=delay)
+
+
+def enqueue_summary(assignment_id, delay=timedelta(0)):
+    """Queue the LLM summary of a new assignment that could not be made when it was submitted."""
+    _enqueue("summary", f"summary:{assignment_id}", assignment_id, priority=PRIORITY_DEFERRED, delay=delay)
+
+
+def enqueue_session_insights(session):
+    """Queue insights for the student and the assignment of a session that just closed."""
+    _pending_samples.pop((session.user_id, session.assignment_id), None)
+    enqueue_enrollment(session.user_id, session.assignment_id)
+    enqueue_assignment(session.assignment_id)
+
+
+def defer_unit(kind, unit, retry_after):
+    """Queue an enrollment or assignment the LLM could not take, to run once it is back."""
+    delay = timedelta(seconds=retry_after)
+    if kind == "enrollment":
+        enqueue_enrollment(unit.user_id, unit.assignment_id, priority=PRIORITY_DEFERRED, delay=delay)
+    else:
+        enqueue_assignment(unit.id, priority=PRIORITY_DEFERRED, delay=delay)
+    db.session.commit()
+
+
+def note_samples(user_id, assignment_id, count=1):
+    """
+    Count ingested samples and queue an enrollment job every SAMPLE_TRIGGER samples.
+    The count is kept per process, so with several workers the trigger is approximate.
+    Returns True when a job was queued (the caller commits).
+    """
+    key = (user_id, assignment_id)
+    _pending_samples[key] += count
+    if _pending_samples[key] < SAMPLE_TRIGGER:
+        return False
+    del _pending_samples[key]
+    enqueue_enrollment(user_id, assignment_id, priority=PRIORITY_SAMPLES)
+    return True
+
+
+def _claimable(now):
+    return or_(
+        (InsightJob.status == "queued") & (InsightJob.run_after <= now),
+        # A worker that died mid-job leaves it running; take it over once its lock expires
+        (InsightJob.status == "running") & (InsightJob.locked_until < now),
+    )
+
+
+def claim_job(owner, now=None):
+    """Atomically move the next due job to running for `owner`. Returns the job or None."""
+    while True:
+        now = now or datetime.utcnow()
+        job_id = db.session.execute(
+            select(InsightJob.id).where(_claimable(now))
+            .order_by(InsightJob.priority.desc(), InsightJob.run_after, InsightJob.id).limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+
+        result = db.session.execute(
+            update(InsightJob)
+            .where(InsightJob.id == job_id, _claimable(now))
+            .values(status="running", locked_by=owner, locked_until=now + JOB_TIMEOUT,
+                    attempts=InsightJob.attempts + 1, updated_at=now)
+        )
+        db.session.commit()
+        if result.rowcount:
+            return db.session.get(InsightJob, job_id)
+        # Another worker claimed it first, try the next one
+        now = None
+
+
+def backoff(attempts):
+    """Exponential backoff with full jitter."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def complete_job(job):
+    job.status = "done"
+    job.locked_by = None
+    job.locked_until = None
+    db.session.commit()
+
+
+def fail_job(job, error, retry_in=None):
+    """
+    Record a failed attempt. The job is queued again after a backoff, or moves to the dead
+    state once max_attempts is reached. retry_in reschedules without counting an attempt.
+    """
+    db.session.rollback()
+    job.last_error = error
+    job.locked_by = None
+    job.locked_until = None
+    if retry_in is not None:
+        job.attempts -= 1
+    if retry_in is None and job.attempts >= job.max_attempts:
+        job.status = "dead"
+        db.session.commit()
+        return
+
+    job.status = "queued"
+    job.run_after = datetime.utcnow() + (retry_in if retry_in is not None else backoff(job.attempts))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A newer trigger already queued the same work; that job supersedes this one
+        db.session.rollback()
+        job.status = "superseded"
+        job.locked_by = None
+        job.locked_until = None
+        db.session.commit()
+
+
+def run_job(job, owner):
+    """
+    Generate the heatmap and insights (or the summary) for a job. Units are claimed with the same
+    leases as `flask focus run-insights`, so a worker and a nightly run never process one unit at once.
+    A lease a run completed keeps that run's id, so retries of the run do not redo the unit.
+    """
+    import content
+    import cron_job
+
+    if job.kind == "enrollment":
+        unit = Enrollment.query.filter_by(user_id=job.user_id, assignment_id=job.assignment_id).first()
+        process = cron_job.process_enrollment
+    elif job.kind == "summary":
+        unit = db.session.get(Assignment, job.assignment_id)
+        process = content.summarize_assignment
+    else:
+        unit = db.session.get(Assignment, job.assignment_id)
+        process = cron_job.process_assignment
+    if unit is None:
+        complete_job(job)  # the enrollment or assignment was deleted
+        return "done"
+
+    lease = f"{job.kind}:{unit.id}"
+    # A failed job hands the lease back as completed as it found it
+    completed_at = db.session.execute(select(CronLease.completed_at).where(CronLease.unit == lease)).scalar()
+    if not take_over_lease(lease, owner, f"job-{job.id}"):
+        fail_job(job, "unit leased by another worker", retry_in=timedelta(minutes=1))
+        return "deferred"
+
+    try:
+        succeeded = process(unit)
+    except LLMUnavailable as e:
+        # Not the job's fault, so reschedule without using up an attempt
+        release_lease(lease, owner, completed_at)
+        fail_job(job, str(e), retry_in=max(timedelta(seconds=e.retry_after), BACKOFF_BASE))
+        return "deferred"
+    except Exception:
+        release_lease(lease, owner, completed_at)
+        fail_job(job, traceback.format_exc(limit=5))
+        return job.status
+
+    if succeeded:
+        complete_lease(lease, owner)
+        complete_job(job)
+        return "done"
+    release_lease(lease, owner, completed_at)
+    fail_job(job, "insight generation failed")
+    return job.status
+
+
+def work(once=False, poll_interval=5.0, max_jobs=None):
+    """Process jobs until the queue is empty (once=True), max_jobs were run, or forever."""
+    owner = lease_owner()
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        if gateway.breaker.is_open():
+            # Leave the jobs queued rather than claiming them only to defer them again
+            if once:
+                break
+            time.sleep(max(poll_interval, gateway.breaker.retry_after()))
+            continue
+
+        job = claim_job(owner)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"Job {job.id}: {job.kind} user={job.user_id} assignment={job.assignment_id} attempt {job.attempts}")
+        outcome = run_job(job, owner)
+        print(f"Job {job.id}: {outcome}")
+        processed += 1
+    return processed
+
+
+def queue_stats():
+    """Number of jobs per status."""
+    return dict(db.session.query(InsightJob.status, func.count(InsightJob.id)).group_by(InsightJob.status).all())
+
+
+def retry_dead_jobs():
+    """Give every dead job a fresh set of attempts. Returns how many were requeued."""
+    requeued = 0
+    for job in InsightJob.query.filter_by(status="dead").all():
+        job.status, job.attempts, job.run_after = "queued", 0, datetime.utcnow()
+        try:
+            db.session.commit()
+            requeued += 1
+        except IntegrityError:
+            db.session.rollback()
+            job.status = "superseded"
+            db.session.commit()
+    return requeued
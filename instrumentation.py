@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Latency buckets in seconds, shared by every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+slow_request_logger = logging.getLogger("ifocus.slow_requests")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, help_text):
+        return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_latency = registry.histogram("ifocus_request_duration_seconds", "HTTP request latency by endpoint.")
+request_queries = registry.histogram("ifocus_request_db_queries", "Database queries issued per request.",
+                                     QUERY_COUNT_BUCKETS)
+request_query_time = registry.histogram("ifocus_request_db_seconds", "Time spent in database queries per request.")
+db_queries = registry.counter("ifocus_db_queries_total", "Database queries executed.")
+operation_latency = registry.histogram("ifocus_operation_duration_seconds",
+                                       "Latency of instrumented operations (heatmap rendering, PDF extraction, LLM calls).")
+operation_errors = registry.counter("ifocus_operation_errors_total", "Instrumented operations that raised.")
+samples_ingested = registry.counter("ifocus_focus_samples_ingested_total", "Gaze samples stored by /save_focus_data.")
+export_rows = registry.counter("ifocus_export_rows_total", "Rows streamed by exports, by dataset and format.")
+prompt_tokens = registry.histogram("ifocus_llm_prompt_tokens", "Estimated input tokens per LLM prompt.", TOKEN_BUCKETS)
+llm_queue_wait = registry.histogram("ifocus_llm_queue_wait_seconds",
+                                   "Time LLM calls waited for the rate limiter and a concurrency slot.")
+llm_failures = registry.counter("ifocus_llm_failures_total", "LLM calls that failed or were rejected, by reason.")
+
+
+@contextmanager
+def timed(operation, **labels):
+    """Record the duration of the enclosed block in ifocus_operation_duration_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        operation_errors.inc(operation=operation, **labels)
+        raise
+    finally:
+        operation_latency.observe(time.perf_counter() - start, operation=operation, **labels)
+
+
+def timed_function(operation, **labels):
+    """Decorator form of `timed`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(operation, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SampledLogger:
+    """
+    Emits one structured (JSON) log line for every `every` events instead of one per event,
+    so hot paths such as sample ingestion do not pay for stdout I/O on each request.
+    """
+
+    def __init__(self, name, every=100):
+        self.logger = logging.getLogger(name)
+        self.every = every
+
+    def log(self, event_name, **fields):
+        if self.every > 1 and random.randrange(self.every):
+            return
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(json.dumps({"event": event_name, "sample_rate": 1 / self.every, **fields}, default=str))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_queries.inc()
+    if has_request_context() and "query_count" in g:
+        g.query_count += 1
+        g.query_time += elapsed
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.query_count = 0
+    g.query_time = 0.0
+
+
+def _after_request(response):
+    start = g.pop("request_start", None)
+    if start is None:
+        return response
+
+    elapsed = time.perf_counter() - start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    request_latency.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    request_queries.observe(g.query_count, endpoint=endpoint)
+    request_query_time.observe(g.query_time, endpoint=endpoint)
+
+    threshold = g.get("slow_request_threshold")
+    if threshold is not None and elapsed >= threshold:
+        slow_request_logger.warning(json.dumps({
+            "event": "slow_request",
+            "endpoint": endpoint,
+            "path": request.path,
+            "method": request.method,
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 1),
+            "db_queries": g.query_count,
+            "db_ms": round(g.query_time * 1000, 1),
+        }))
+    return response
+
+
+def metrics():
+    """
+    Prometheus text exposition of every metric recorded by this process.
+    When METRICS_TOKEN is set, scrapers must send it as a bearer token.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(registry.expose(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """
+    Install request timing and query counting on `app` and expose them on /metrics.
+    SLOW_REQUEST_SECONDS (config or environment) enables the slow request log.
+    """
+    threshold = app.config.get("SLOW_REQUEST_SECONDS", os.getenv("SLOW_REQUEST_SECONDS"))
+    threshold = float(threshold) if threshold else None
+
+    def before_request():
+        _before_request()
+        g.slow_request_threshold = threshold
+
+    app.before_request(before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
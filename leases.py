@@ -0,0 +1,112 @@
+import os
+import socket
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CronLease
+
+DEFAULT_LEASE_TTL = timedelta(minutes=15)
+
+
+def lease_owner():
+    """Identifies this worker process in CronLease.owner."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(unit, owner, run_id, ttl=DEFAULT_LEASE_TTL, now=None):
+    """
+    Try to claim `unit` for `run_id`. Returns False when another worker holds an unexpired
+    lease on it or when it was already completed for the same run_id.
+
+    The claim is a single conditional UPDATE (or an INSERT for a unit never seen before),
+    so two workers racing for the same unit cannot both win.
+    """
+    now = now or datetime.utcnow()
+    claimable = or_(
+        CronLease.owner == owner,
+        and_(CronLease.completed_at.is_(None), CronLease.expires_at < now),
+        and_(CronLease.completed_at.isnot(None), CronLease.run_id != run_id),
+    )
+    result = db.session.execute(
+        update(CronLease)
+        .where(CronLease.unit == unit, claimable)
+        .where(or_(CronLease.completed_at.is_(None), CronLease.run_id != run_id))
+        .values(owner=owner, run_id=run_id, expires_at=now + ttl, completed_at=None)
+    )
+    if result.rowcount:
+        db.session.commit()
+        return True
+
+    if db.session.get(CronLease, unit) is not None:
+        db.session.rollback()
+        return False
+
+    db.session.add(CronLease(unit=unit, owner=owner, run_id=run_id, expires_at=now + ttl))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker inserted the lease between our check and our insert
+        db.session.rollback()
+        return False
+    return True
+
+
+def take_over_lease(unit, owner, run_id, ttl=DEFAULT_LEASE_TTL, now=None):
+    """
+    Claim `unit` for work outside the runs (the insight worker), also when a run already
+    completed it. A completed lease keeps its run_id, so once the work is done retries of that
+    run still skip the unit; `run_id` only names a lease that did not exist yet.
+    Returns False when another worker holds an unexpired lease on it.
+    """
+    now = now or datetime.utcnow()
+    claimable = or_(
+        CronLease.owner == owner,
+        CronLease.completed_at.isnot(None),
+        CronLease.expires_at < now,
+    )
+    result = db.session.execute(
+        update(CronLease)
+        .where(CronLease.unit == unit, claimable)
+        .values(owner=owner, expires_at=now + ttl, completed_at=None)
+    )
+    if result.rowcount:
+        db.session.commit()
+        return True
+
+    if db.session.get(CronLease, unit) is not None:
+        db.session.rollback()
+        return False
+
+    db.session.add(CronLease(unit=unit, owner=owner, run_id=run_id, expires_at=now + ttl))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def complete_lease(unit, owner):
+    """Mark a claimed unit as done, so retries of the same run skip it."""
+    db.session.execute(
+        update(CronLease)
+        .where(CronLease.unit == unit, CronLease.owner == owner)
+        .values(completed_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+def release_lease(unit, owner, completed_at=None):
+    """
+    Give up a claim without completing it, so another worker or a retry can pick it up at once.
+    completed_at gives a lease taken over with `take_over_lease` back its earlier completion.
+    """
+    db.session.rollback()
+    db.session.execute(
+        update(CronLease)
+        .where(CronLease.unit == unit, CronLease.owner == owner, CronLease.completed_at.is_(None))
+        .values(expires_at=datetime.utcnow(), completed_at=completed_at)
+    )
+    db.session.commit()
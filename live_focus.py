@@ -0,0 +1,220 @@
+import json
+import queue
+import threading
+import time
+from collections import deque, Counter
+
+# Length of the rolling window used for the live classroom view
+WINDOW_SECONDS = 30
+# How often subscribers receive coalesced updates
+PUBLISH_INTERVAL = 1.0
+# Grid used for the live hotspot, same convention as identify_focus_hotspots
+GRID_SIZE = 10
+# Updates queued for a slow subscriber before older ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 10
+
+
+class StudentWindow:
+    """
+    Rolling window of recent gaze samples for one student on one assignment.
+    Samples are stored as (monotonic time, outside, grid cell) tuples.
+    """
+
+    def __init__(self, user_id, username):
+        self.user_id = user_id
+        self.username = username
+        self.samples = deque()
+        self.inside_count = 0
+        self.cells = Counter()
+
+    def add(self, now, outside, cell):
+        self.samples.append((now, outside, cell))
+        if not outside:
+            self.inside_count += 1
+        self.cells[cell] += 1
+
+    def expire(self, now):
+        cutoff = now - WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < cutoff:
+            _, outside, cell = self.samples.popleft()
+            if not outside:
+                self.inside_count -= 1
+            self.cells[cell] -= 1
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def snapshot(self):
+        """Return the compact aggregate sent to teachers, or None when the window is empty."""
+        total = len(self.samples)
+        if not total:
+            return None
+        hotspot = self.cells.most_common(1)[0][0]
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "samples": total,
+            "inside_ratio": round(self.inside_count / total, 3),
+            "hotspot": list(hotspot),
+        }
+
+
+class FocusBroker:
+    """
+    In-memory pub/sub for live focus aggregates.
+
+    The ingestion path calls `publish_sample` for every gaze sample. A single
+    background thread, started by the first sample or subscriber, wakes up once per
+    PUBLISH_INTERVAL, expires old samples, recomputes the rolling aggregate for every
+    active student and pushes one coalesced delta per assignment to each subscribed
+    teacher, so the cost per tick is proportional to the number of active students
+    rather than the number of raw samples, and viewers never touch the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}          # assignment_id -> {user_id: StudentWindow}
+        self._last_sent = {}        # assignment_id -> {user_id: last snapshot sent}
+        self._subscribers = {}      # assignment_id -> set of queues
+        self._thread = None
+
+    def publish_sample(self, assignment_id, user_id, username, x, y, outside):
+        cell = grid_cell(x, y)
+        now = time.monotonic()
+        with self._lock:
+            windows = self._windows.setdefault(assignment_id, {})
+            window = windows.get(user_id)
+            if window is None:
+                window = windows[user_id] = StudentWindow(user_id, username)
+            window.add(now, bool(outside), cell)
+            # Keep the window bounded even when nobody is watching
+            window.expire(now)
+        # The ticker also drops the windows of students who stopped sending
+        self._ensure_thread()
+
+    def subscribe(self, assignment_id):
+        """Register a subscriber and return its queue, primed with the current state."""
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(assignment_id, set()).add(subscriber)
+        subscriber.put_nowait(self.current_state(assignment_id))
+        self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, assignment_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(assignment_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[assignment_id]
+
+    def current_state(self, assignment_id):
+        """Full update describing every student currently active on the assignment."""
+        with self._lock:
+            students = list(self._last_sent.get(assignment_id, {}).values())
+        return {"students": students, "removed": [], "full": True}
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="focus-broker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(PUBLISH_INTERVAL)
+            self.tick()
+
+    def tick(self):
+        """Expire old samples and fan out one coalesced delta per assignment."""
+        now = time.monotonic()
+        deliveries = []
+        with self._lock:
+            # Every active window is re-evaluated, not just those that received samples,
+            # otherwise a student who stopped sending would never age out.
+            for assignment_id in set(self._windows) | set(self._last_sent):
+                windows = self._windows.get(assignment_id, {})
+                last_sent = self._last_sent.setdefault(assignment_id, {})
+                changed, removed = [], []
+                for user_id in set(windows) | set(last_sent):
+                    window = windows.get(user_id)
+                    if window is not None:
+                        window.expire(now)
+                        snapshot = window.snapshot()
+                    else:
+                        snapshot = None
+
+                    if snapshot is None:
+                        windows.pop(user_id, None)
+                        if last_sent.pop(user_id, None) is not None:
+                            removed.append(user_id)
+                    elif last_sent.get(user_id) != snapshot:
+                        last_sent[user_id] = snapshot
+                        changed.append(snapshot)
+
+                subscribers = self._subscribers.get(assignment_id)
+                if subscribers and (changed or removed):
+                    update = {"students": changed, "removed": removed, "full": False}
+                    deliveries.extend((subscriber, update) for subscriber in subscribers)
+
+            self._windows = {key: value for key, value in self._windows.items() if value}
+            self._last_sent = {key: value for key, value in self._last_sent.items() if value}
+
+        for subscriber, update in deliveries:
+            _offer(subscriber, update)
+
+
+def _offer(subscriber, update):
+    """Queue an update without blocking the broker; a lagging client gets a full resync."""
+    try:
+        subscriber.put_nowait(update)
+    except queue.Full:
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        subscriber.put_nowait({"resync": True})
+
+
+def grid_cell(x, y, grid_size=GRID_SIZE):
+    """Map a coordinate onto the hotspot grid, clamping values outside the 0-1 range."""
+    column = min(max(int(x * grid_size), 0), grid_size - 1)
+    row = min(max(int(y * grid_size), 0), grid_size - 1)
+    return column, row
+
+
+def format_sse(data, event=None):
+    """Encode a payload as a Server-Sent Events message."""
+    message = ""
+    if event:
+        message += f"event: {event}\n"
+    message += f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+    return message
+
+
+def stream_assignment(assignment_id, heartbeat=15):
+    """
+    Generator yielding SSE messages for a teacher watching an assignment.
+    Sends a comment line every `heartbeat` seconds so proxies keep the connection open.
+    """
+    subscriber = broker.subscribe(assignment_id)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                update = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+
+            if update.get("resync"):
+                update = broker.current_state(assignment_id)
+            yield format_sse(update, event="focus")
+    finally:
+        broker.unsubscribe(assignment_id, subscriber)
+
+
+broker = FocusBroker()
@@ -0,0 +1,190 @@
+"""
+Gateway in front of every LLM call (summaries, insights and streamed regeneration).
+
+Calls are admitted through a token-bucket limiter on requests and tokens per minute and a
+bounded number of concurrent calls, each with a deadline covering both the wait and the call.
+A circuit breaker opens after consecutive failures: while it is open calls fail fast with
+LLMUnavailable instead of waiting on a dead backend, and callers defer the work to the
+insight job queue. Limits are per process, so with several web workers divide them accordingly.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import llm_failures, llm_queue_wait
+from prompts import count_tokens
+
+# Tokens reserved for the completion on top of the prompt, when admitting a call
+COMPLETION_TOKEN_ESTIMATE = 400
+
+
+class LLMUnavailable(Exception):
+    """The call was not sent: the circuit is open or it could not start before its deadline."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"LLM unavailable ({reason}), retry in {retry_after:.0f} s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows `rate` units per minute with bursts of up to one minute's worth."""
+
+    def __init__(self, rate):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.rate = rate / 60.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, amount):
+        """Take `amount` now, or return the seconds to wait before it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount, deadline):
+        """Block until `amount` units are taken. Returns False if that would pass the deadline."""
+        amount = min(amount, self.capacity)
+        while True:
+            wait = self._take(amount)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. After `reset_timeout` seconds one
+    trial call is let through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until the circuit lets a call through again (0 when closed)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self):
+        return self.retry_after() > 0
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() < self.opened_at + self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def end_trial(self):
+        """Let another trial through when a half-open call ended without reaching the backend."""
+        with self._lock:
+            self._trial_running = False
+
+
+def failure_reason(error):
+    """Short label for an exception raised by an LLM client, for metrics and job errors."""
+    name = type(error).__name__
+    if "Timeout" in name:
+        return "timeout"
+    if "RateLimit" in name or getattr(error, "status_code", None) == 429:
+        return "rate_limited"
+    if "Connect" in name:
+        return "connection"
+    return "error"
+
+
+class LLMGateway:
+    def __init__(self, requests_per_minute=60, tokens_per_minute=60000, max_concurrency=4, timeout=60.0,
+                 failure_threshold=5, reset_timeout=60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "60000")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "60")),
+        )
+
+    def _reject(self, reason, purpose, retry_after):
+        llm_failures.inc(reason=reason, purpose=purpose)
+        return LLMUnavailable(reason, retry_after)
+
+    @contextmanager
+    def call(self, purpose, *messages, timeout=None):
+        """
+        Admit one LLM call for the prompt `messages` and yield the seconds left before its
+        deadline, to be passed to the client as its timeout. Exceptions raised inside the
+        block count as backend failures; LLMUnavailable is raised when the call is not admitted.
+
+            with gateway.call("summary", system_prompt, prompt) as timeout:
+                response = client.chat.completions.create(..., timeout=timeout)
+        """
+        if not self.breaker.allow():
+            raise self._reject("circuit_open", purpose, self.breaker.retry_after())
+
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        if not self.concurrency.acquire(timeout=max(0.0, deadline - start)):
+            self.breaker.end_trial()
+            raise self._reject("queue_timeout", purpose, self.breaker.reset_timeout)
+        try:
+            tokens = sum(count_tokens(message) for message in messages) + COMPLETION_TOKEN_ESTIMATE
+            if not (self.requests.acquire(1, deadline) and self.tokens.acquire(tokens, deadline)):
+                raise self._reject("queue_timeout", purpose, self.breaker.reset_timeout)
+            llm_queue_wait.observe(time.monotonic() - start, purpose=purpose)
+
+            try:
+                yield deadline - time.monotonic()
+            except Exception as e:
+                llm_failures.inc(reason=failure_reason(e), purpose=purpose)
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+        finally:
+            # Also reached when a stream is abandoned by its client (GeneratorExit)
+            self.breaker.end_trial()
+            self.concurrency.release()
+
+
+# Shared by the web app, the cron job and the insight worker
+gateway = LLMGateway.from_env()
@@ -1,10 +1,10 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
-db = SQLAlchemy()
+from extensions import db
+
 DB_NAME = "ifocus.db"
 
 
@@ -40,6 +40,9 @@ class Assignment(db.Model):
     enrollments = db.relationship("Enrollment", back_populates="assignment", cascade="all, delete-orphan",
                                   lazy="dynamic")
     focus_data = db.relationship("FocusData", back_populates="assignment", lazy="dynamic")
+    content_regions = db.relationship("ContentRegion", cascade="all, delete-orphan", lazy="dynamic")
+    attention_seconds = db.relationship("AttentionSecond", cascade="all, delete-orphan", lazy="dynamic")
+    cohort_sketches = db.relationship("CohortSketch", cascade="all, delete-orphan", lazy="dynamic")
 
 
     def __init__(self, **kwargs):
@@ -90,15 +93,218 @@ class Note(db.Model):
 
 
 
+class FocusSession(db.Model):
+    """
+    One continuous period of gaze tracking, from the assignment page starting WebGazer
+    until the page is unloaded or the student goes idle. Metrics are cached on close.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ended_at = db.Column(db.DateTime, nullable=True)
+    end_reason = db.Column(db.String(20), nullable=True)
+    metrics = db.Column(db.JSON, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_focus_session_user_assignment', 'user_id', 'assignment_id'),
+        db.Index('ix_focus_session_assignment_keyset', 'assignment_id', 'id'),
+        db.Index('ix_focus_session_open', 'ended_at', 'last_seen_at'),
+    )
+
+    user = db.relationship("User")
+    assignment = db.relationship("Assignment")
+    viewports = db.relationship("FocusViewport", back_populates="session", lazy="dynamic")
+    focus_data = db.relationship("FocusData", back_populates="session", lazy="dynamic")
+
+    @property
+    def is_open(self):
+        return self.ended_at is None
+
+
+class FocusViewport(db.Model):
+    """
+    Screen geometry reported by the student's browser when gaze tracking starts (and on resize).
+    Gaze samples are normalised against the learning-content rectangle recorded here.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('focus_session.id'), nullable=True)
+    viewport_width = db.Column(db.Float, nullable=False)
+    viewport_height = db.Column(db.Float, nullable=False)
+    content_left = db.Column(db.Float, nullable=False)
+    content_top = db.Column(db.Float, nullable=False)
+    content_width = db.Column(db.Float, nullable=False)
+    content_height = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    session = db.relationship("FocusSession", back_populates="viewports")
+    focus_data = db.relationship("FocusData", back_populates="viewport", lazy="dynamic")
+
+    @validates('viewport_width', 'viewport_height', 'content_width', 'content_height')
+    def validate_size(self, key, value):
+        if value is None or value <= 0:
+            raise ValueError(f"{key} must be positive.")
+        return value
+
+    def normalise(self, x, y):
+        """
+        Convert page pixel coordinates (viewport plus scroll offset, like the content rectangle)
+        into coordinates relative to the learning content, where (0, 0) is its top-left and
+        (1, 1) its bottom-right corner.
+        """
+        return (
+            (x - self.content_left) / self.content_width,
+            (y - self.content_top) / self.content_height,
+        )
+
+
 class FocusData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('focus_session.id'), nullable=True, index=True)
+    viewport_id = db.Column(db.Integer, db.ForeignKey('focus_viewport.id'), nullable=True)
+    # Normalised to the learning-content element, see FocusViewport.normalise
     x_coord = db.Column(db.Float, nullable=False)
     y_coord = db.Column(db.Float, nullable=False)
     outside = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # PDF page under the gaze (from 1) and the position on it (0-1), see content_regions.py
+    page = db.Column(db.Integer, nullable=True)
+    page_x = db.Column(db.Float, nullable=True)
+    page_y = db.Column(db.Float, nullable=True)
+    # YouTube player position (seconds) while the video plays, see video_attention.py
+    video_time = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        # Per-assignment and per-student reads, optionally bounded in time (heatmap binning)
+        db.Index('ix_focus_data_assignment_user_time', 'assignment_id', 'user_id', 'timestamp'),
+        # Keyset pages of the admin browser filtered by assignment or student, in id order
+        db.Index('ix_focus_data_assignment_keyset', 'assignment_id', 'id'),
+        db.Index('ix_focus_data_user_keyset', 'user_id', 'id'),
+    )
 
     # Relationships
     user = db.relationship("User", back_populates="focus_data")
-    assignment = db.relationship("Assignment", back_populates="focus_data")
\ No newline at end of file
+    assignment = db.relationship("Assignment", back_populates="focus_data")
+    session = db.relationship("FocusSession", back_populates="focus_data")
+    viewport = db.relationship("FocusViewport", back_populates="focus_data")
+
+
+class Fixation(db.Model):
+    """
+    A fixation detected in the gaze samples of a closed focus session (see fixations.py), or
+    in legacy samples without a session (session_id NULL). Heatmaps weight them by duration.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('focus_session.id', ondelete='CASCADE'), nullable=True,
+                           index=True)
+    # Centroid, normalised to the learning-content element like FocusData
+    x_coord = db.Column(db.Float, nullable=False)
+    y_coord = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Float, nullable=False)  # seconds
+    outside = db.Column(db.Boolean, nullable=False, default=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_fixation_assignment_user_time', 'assignment_id', 'user_id', 'started_at'),
+    )
+
+
+class ContentRegion(db.Model):
+    """
+    A word, line, paragraph or figure of a PDF assignment, extracted at upload (see
+    content_regions.py). The box is normalised to its page like FocusData.page_x/page_y.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', ondelete='CASCADE'), nullable=False)
+    page = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    x0 = db.Column(db.Float, nullable=False)
+    y0 = db.Column(db.Float, nullable=False)
+    x1 = db.Column(db.Float, nullable=False)
+    y1 = db.Column(db.Float, nullable=False)
+    text = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_content_region_assignment_kind', 'assignment_id', 'kind'),
+    )
+
+
+class AttentionSecond(db.Model):
+    """
+    One second of an assignment's video on an attention curve: the gaze samples recorded
+    while it played and how many were on the content. There is a curve per student and a
+    class curve (user_id video_attention.CLASS_CURVE), both updated as sessions close.
+    """
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)  # not a foreign key, 0 is the class curve
+    second = db.Column(db.Integer, primary_key=True)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    inside = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CohortSketch(db.Model):
+    """
+    KLL quantile sketch of one per-enrollment metric over an assignment's class, built by
+    one shard of an insights run (see cohort.py). Readers merge the shards of the latest run.
+    """
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', ondelete='CASCADE'), primary_key=True)
+    metric = db.Column(db.String(32), primary_key=True)
+    shard = db.Column(db.String(16), primary_key=True)  # "index/count"
+    run_id = db.Column(db.String(64), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    sketch = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class CronLease(db.Model):
+    """
+    Claim on one unit of cron work ("enrollment:12", "assignment:3") so that concurrent shards,
+    overlapping runs and retries never process the same unit twice. A lease is held until
+    expires_at; completed_at records that the unit was finished for run_id.
+    """
+    unit = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    run_id = db.Column(db.String(64), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+
+class InsightJob(db.Model):
+    """
+    Queued heatmap + insight generation for one enrollment (kind "enrollment") or one
+    assignment (kind "assignment"), or the summary of a new assignment (kind "summary"),
+    processed by `flask focus worker`.
+
+    status moves queued -> running -> done, or back to queued with a later run_after when an
+    attempt fails, and to dead once max_attempts is reached. At most one queued job exists per
+    dedupe_key, so repeated triggers for the same student and assignment collapse into one.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', ondelete='CASCADE'), nullable=False)
+    dedupe_key = db.Column(db.String(64), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(128), nullable=True)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('uq_insight_job_queued', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status = 'queued'"), postgresql_where=db.text("status = 'queued'")),
+        db.Index('ix_insight_job_claim', 'status', 'priority', 'run_after'),
+    )
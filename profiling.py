@@ -0,0 +1,148 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from flask import g, request
+from flask_login import current_user
+
+PROFILE_QUERY_ARG = "_profile"
+PROFILE_HEADER = "X-Profile"
+
+
+def profile_dir(app):
+    """Directory holding request and cron profiles, created on demand."""
+    path = app.config.get("PROFILE_DIR") or os.path.join(app.instance_path, "profiles")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _profile_requested():
+    if not (request.args.get(PROFILE_QUERY_ARG) or request.headers.get(PROFILE_HEADER)):
+        return False
+    return current_user.is_authenticated and current_user.role == "Admin"
+
+
+def init_app(app):
+    """
+    Let admins profile a single request by adding ?_profile=1 or an X-Profile header.
+    The request runs under cProfile and the stats are saved as a .prof file in profile_dir,
+    where they can be browsed from the admin panel or opened with snakeviz / pstats.
+    """
+
+    def start_profiler():
+        if _profile_requested():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def stop_profiler(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+
+        profiler.disable()
+        endpoint = re.sub(r"[^A-Za-z0-9_.-]", "_", request.endpoint or "unmatched")
+        file_name = f"request-{datetime.utcnow():%Y%m%dT%H%M%S%f}-{endpoint}.prof"
+        profiler.dump_stats(os.path.join(profile_dir(app), file_name))
+        response.headers["X-Profile-File"] = file_name
+        return response
+
+    app.before_request(start_profiler)
+    app.after_request(stop_profiler)
+
+
+def format_pstats(path, limit=60, sort="cumulative"):
+    """Render the top entries of a .prof file as text."""
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+class StageProfiler:
+    """
+    Per-stage wall-clock breakdown of a cron run.
+
+    Work is grouped into units (one enrollment or one assignment) and, inside a unit,
+    into stages such as query, metrics, render, llm and commit. When disabled every
+    method is a no-op so the cron job pays nothing for the hooks.
+    """
+
+    STAGES = ("query", "metrics", "render", "llm", "commit")
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.units = []
+        self._current = None
+        self._started = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.units = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def _unit(self, kind, key):
+        unit = {"kind": kind, "key": key, "stages": {}, "total": 0.0}
+        previous, self._current = self._current, unit
+        start = time.perf_counter()
+        try:
+            yield unit
+        finally:
+            unit["total"] = time.perf_counter() - start
+            self._current = previous
+            self.units.append(unit)
+
+    def unit(self, kind, key):
+        return self._unit(kind, key) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                stages = self._current["stages"]
+                stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def stage(self, name):
+        return self._stage(name) if self.enabled else nullcontext()
+
+    def report(self):
+        totals = {}
+        for unit in self.units:
+            for name, seconds in unit["stages"].items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return {
+            "generated_at": datetime.utcnow().isoformat(),
+            "wall_time": time.perf_counter() - self._started,
+            "stage_totals": totals,
+            "units": self.units,
+        }
+
+    def save(self, directory):
+        path = os.path.join(directory, f"cron-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+    def print_summary(self):
+        report = self.report()
+        print(f"\nCron profile: {report['wall_time']:.2f} s wall time")
+        header = "".join(f"{stage:>10}" for stage in self.STAGES)
+        print(f"{'unit':<28}{header}{'total':>10}")
+        for unit in self.units:
+            stages = "".join(f"{unit['stages'].get(stage, 0.0):>10.3f}" for stage in self.STAGES)
+            print(f"{unit['kind'] + ' ' + str(unit['key']):<28}{stages}{unit['total']:>10.3f}")
+        totals = "".join(f"{report['stage_totals'].get(stage, 0.0):>10.3f}" for stage in self.STAGES)
+        print(f"{'all units':<28}{totals}")
+
+
+# Shared by cron_job.py, enabled by running it with --profile
+profiler = StageProfiler(enabled=False)
@@ -0,0 +1,195 @@
+"""
+Prompt construction for insight generation.
+
+Metrics are sent to the model as one compact JSON block instead of prose, and every prompt
+is checked against a token budget: optional sections are added in order of importance only
+while the prompt still fits PROMPT_TOKEN_BUDGET.
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+from instrumentation import prompt_tokens
+from cohort import COHORT_METRICS
+from scanpath import revisits, top_cells, top_transitions
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "700"))
+# Classes up to this size get one row per student; larger ones get quantiles and outliers
+PER_STUDENT_ROWS_MAX = 8
+MAX_OUTLIERS = 5
+# Most-read paragraphs and figures of a PDF assignment, and how much of their text is quoted
+PROMPT_REGIONS = 5
+REGION_TEXT_CHARS = 60
+
+STUDENT_SYSTEM_PROMPT = (
+    "You review a student's focus data from eye tracking while they studied an assignment. "
+    "Address the student directly in a personal tone, point out their focus patterns and give concrete "
+    "suggestions to improve focus and study habits. Markdown, at most 200 words. "
+    "Sign off with: Best Regards, Your friendly iFocus Buddy"
+)
+
+ASSIGNMENT_SYSTEM_PROMPT = (
+    "You give a teacher actionable feedback from students' eye-tracking focus data on one assignment: "
+    "how to improve engagement, address distractions and make the assignment more effective. "
+    "Concise markdown, at most 250 words."
+)
+
+# Shared legend so the JSON keys can stay short
+METRICS_LEGEND = (
+    "Keys: min=minutes tracked, focus=% of time looking at the content, quad=% of samples per quadrant "
+    "(tl,tr,bl,br), hot=[col,row,%,returns] cells of a 10x10 grid from the top-left with the most fixation "
+    "time and how often the gaze came back to them, sw=saccades between content regions per minute, "
+    "fix=[fixations per minute, mean fixation ms], "
+    "path=[from col,row,to col,row,count] most frequent saccades between cells, session_min=minutes per session."
+)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """
+    Number of tokens in `text`. Uses tiktoken when it is installed, otherwise an estimate
+    (one token per word or punctuation mark) that tracks BPE counts closely for compact JSON.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return len(_TOKEN_PATTERN.findall(text))
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+def compact_metrics(metrics):
+    """Reduce merged session metrics to the few numbers the model needs, rounded."""
+    samples = metrics["sample_count"]
+    duration = metrics["total_duration"]
+    minutes = duration / 60
+    quadrants = metrics["quadrants"]
+    grid_size = metrics["grid_size"]
+    # Fixation time per cell when fixations were detected, else sample counts
+    fixation_time = metrics.get("fixation_time")
+    cells, total = (metrics["fixation_cells"], fixation_time) if fixation_time else (metrics["cells"], samples)
+    fixations = metrics.get("fixation_count")
+    # Scanpaths are missing from metrics cached before fixation detection
+    scanpath = metrics.get("scanpath") or {"transitions": [], "visits": []}
+    returns = revisits(scanpath) if scanpath["visits"] else None
+
+    def cell(index):
+        return [index % grid_size, index // grid_size]
+
+    return {
+        "sessions": metrics.get("session_count", 1),
+        "min": round(minutes, 1),
+        "focus": round(100 * (duration - metrics["distraction_time"]) / duration) if duration else None,
+        "quad": [round(100 * quadrants[region] / samples)
+                 for region in ("top_left", "top_right", "bottom_left", "bottom_right")],
+        "hot": [cell(index) + [round(100 * cells[index] / total), None if returns is None else int(returns[index])]
+                for index in top_cells(cells)],
+        "sw": round(metrics["transitions"] / minutes, 1) if minutes else None,
+        "fix": [round(fixations / minutes), round(1000 * fixation_time / fixations)] if fixations and minutes else None,
+        "path": [cell(source) + cell(target) + [count] for source, target, count in top_transitions(scanpath)],
+    }
+
+
+def _json(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+def _fit(required, optional, budget):
+    """
+    Join the required sections and as many optional sections (in order) as fit the budget.
+    Returns (text, tokens).
+    """
+    sections = list(required)
+    tokens = count_tokens("\n".join(sections))
+    for section in optional:
+        section_tokens = count_tokens(section)
+        if tokens + section_tokens > budget:
+            continue
+        sections.append(section)
+        tokens += section_tokens
+    return "\n".join(sections), tokens
+
+
+def student_prompt(student, assignment, metrics, cohort=None, budget=PROMPT_TOKEN_BUDGET):
+    """
+    (system, user) prompts for a student's insights from their merged session metrics.
+    `cohort` places them in the class (see cohort.cohort_percentiles).
+    """
+    compact = compact_metrics(metrics)
+    required = [
+        f"Student: {student.username}. Assignment: {assignment.title}.",
+        f"Focus metrics: {_json(compact)}",
+    ]
+    optional = []
+    if cohort:
+        percentiles = {COHORT_METRICS[metric]: [entry["percentile"], entry["median"]]
+                       for metric, entry in cohort.items()}
+        optional.append(f"Class percentile of the student and class median [pct,median]: {_json(percentiles)}")
+    optional.append(METRICS_LEGEND)
+    user, tokens = _fit(required, optional, budget - count_tokens(STUDENT_SYSTEM_PROMPT))
+    prompt_tokens.observe(tokens + count_tokens(STUDENT_SYSTEM_PROMPT), purpose="student_insights")
+    return STUDENT_SYSTEM_PROMPT, user
+
+
+def _quantiles(values):
+    p10, p25, p50, p75, p90 = np.percentile(values, [10, 25, 50, 75, 90])
+    return [round(float(value), 1) for value in (p10, p25, p50, p75, p90)]
+
+
+def _outliers(names, values, label):
+    """Students outside 1.5 IQR of the class on one metric, most extreme first."""
+    q1, q3 = np.percentile(values, [25, 75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    median = float(np.median(values))
+    flagged = [(name, value) for name, value in zip(names, values) if value < low or value > high]
+    flagged.sort(key=lambda item: abs(item[1] - median), reverse=True)
+    return [{"student": name, label: round(value, 1)} for name, value in flagged[:MAX_OUTLIERS]]
+
+
+def compact_regions(regions, limit=PROMPT_REGIONS):
+    """[page, kind, % of page gaze time, students, text excerpt] of the most-read regions."""
+    return [[region["page"], region["kind"], round(100 * region["share"]), region["students"],
+             (region["text"] or "")[:REGION_TEXT_CHARS]]
+            for region in regions[:limit]]
+
+
+def assignment_prompt(assignment, pooled, per_student, regions=None, cohort=None, budget=PROMPT_TOKEN_BUDGET):
+    """
+    (system, user) prompts for an assignment's insights.
+    `pooled` are the metrics merged over the whole class and `per_student` maps student
+    usernames to their own merged metrics, so the model sees the spread, not just the average.
+    `regions` are the paragraphs and figures of a PDF by gaze time (see content_regions.region_dwell)
+    and `cohort` the class quantiles from the stored sketches (see cohort.cohort_quantiles), used
+    instead of exact quantiles for classes too large for one row per student.
+    """
+    students = {name: compact_metrics(metrics) for name, metrics in sorted(per_student.items())}
+    required = [
+        f"Assignment: {assignment.title}. Students with focus data: {len(students)}.",
+        f"Class totals: {_json(compact_metrics(pooled))}",
+    ]
+    optional = []
+    if regions:
+        optional.append(f"Most-read content [page,kind,%,students,text]: {_json(compact_regions(regions))}")
+
+    if len(students) <= PER_STUDENT_ROWS_MAX:
+        rows = [[name, m["min"], m["focus"], m["sw"], m["hot"][0][:2] if m["hot"] else None]
+                for name, m in students.items()]
+        optional.append(f"Per student [name,min,focus,sw,hot]: {_json(rows)}")
+    else:
+        names = list(students)
+        columns = {key: [students[name][key] or 0 for name in names] for key in ("min", "focus", "sw")}
+        if cohort:
+            quantiles = {COHORT_METRICS[metric]: entry["quantiles"] for metric, entry in cohort.items()}
+        else:
+            quantiles = {key: _quantiles(values) for key, values in columns.items()}
+        optional.append(f"Per-student quantiles [p10,p25,p50,p75,p90]: {_json(quantiles)}")
+        outliers = _outliers(names, columns["focus"], "focus") + _outliers(names, columns["min"], "min")
+        if outliers:
+            optional.append(f"Outliers: {_json(outliers)}")
+    optional.append(METRICS_LEGEND)
+
+    user, tokens = _fit(required, optional, budget - count_tokens(ASSIGNMENT_SYSTEM_PROMPT))
+    prompt_tokens.observe(tokens + count_tokens(ASSIGNMENT_SYSTEM_PROMPT), purpose="assignment_insights")
+    return ASSIGNMENT_SYSTEM_PROMPT, user
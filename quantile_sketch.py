@@ -0,0 +1,105 @@
+"""
+KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+A sketch summarises a stream of numbers in O(k) space so that ranks and quantiles can be
+answered with an error of about 1.7/k of the count, and two sketches merge into a sketch
+of both streams with the same guarantee. Values are kept in a stack of compactors: level h
+holds values that each stand for 2**h inputs. When the sketch outgrows its capacity the
+lowest full level is sorted and every other value (odd or even positions, at random) is
+promoted to the next level. Up to about k values nothing is compacted, so small streams
+are summarised exactly.
+"""
+import math
+import random
+
+import numpy as np
+
+DEFAULT_K = 200
+# Capacity of each level relative to the one above it
+_DECAY = 2 / 3
+
+
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, levels=None, count=0, seed=None):
+        self.k = k
+        self.levels = levels or [[]]
+        self.count = count
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * _DECAY ** depth)))
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self):
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value):
+        """Add one value."""
+        self.levels[0].append(float(value))
+        self.count += 1
+        if self._size() >= self._max_size():
+            self._compress()
+
+    def extend(self, values):
+        for value in values:
+            self.update(value)
+
+    def _compress(self):
+        """Compact the lowest level over capacity until the sketch fits again."""
+        while self._size() >= self._max_size():
+            for level, values in enumerate(self.levels):
+                if len(values) >= self._capacity(level):
+                    break
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            values.sort()
+            # An odd value out stays behind so the total weight is unchanged
+            keep = [values.pop()] if len(values) % 2 else []
+            self.levels[level + 1].extend(values[self._random.randint(0, 1)::2])
+            self.levels[level] = keep
+
+    def merge(self, other):
+        """Add every value summarised by another sketch (with the same k) to this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _weighted(self):
+        """(sorted values, cumulative weights)."""
+        values = np.concatenate([np.asarray(level, dtype=np.float64) for level in self.levels])
+        weights = np.concatenate([np.full(len(level), 2 ** height, dtype=np.int64)
+                                  for height, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def rank(self, value):
+        """Approximate fraction of the values that are <= value (0 for an empty sketch)."""
+        if not self.count:
+            return 0.0
+        values, cumulative = self._weighted()
+        position = np.searchsorted(values, value, side="right")
+        return float(cumulative[position - 1] / cumulative[-1]) if position else 0.0
+
+    def quantiles(self, fractions):
+        """Approximate value at each fraction (0-1) of the values, or None for an empty sketch."""
+        if not self.count:
+            return None
+        values, cumulative = self._weighted()
+        targets = np.asarray(fractions, dtype=np.float64) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, targets, side="left"), len(values) - 1)
+        return values[positions].tolist()
+
+    def to_dict(self):
+        """Compact JSON-able form: k, count and the levels' values."""
+        return {"k": self.k, "n": self.count, "levels": [[round(value, 4) for value in level] for level in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(k=data["k"], levels=[list(level) for level in data["levels"]], count=data["n"])
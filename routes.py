@@ -1,17 +1,32 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
+from flask import session as cookie_session
 from flask_login import login_user, logout_user, login_required, current_user
-from openai import OpenAI
 
-from app import app, db, login_manager
-from models import User, Assignment, Enrollment, Note, FocusData
+from extensions import db, login_manager
+from models import User, Assignment, Enrollment, Note
+from content import process_pdf, fetch_youtube_transcription
+from content_regions import index_pdf, region_dwell
+from cohort import COHORT_LABELS, cohort_percentiles, cohort_quantiles
+from focus_sessions import session_metrics
+from export import parquet_available
 from werkzeug.security import generate_password_hash, check_password_hash
-from youtube_transcript_api import YouTubeTranscriptApi
-import pdfplumber
+import logging
 import os
-import openai
+import secrets
+from sqlalchemy import select
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from langchain_ollama import ChatOllama
+from heatmaps import render_heatmap
+from focus_store import heatmap_grid
+from live_focus import format_sse
+from llm_gateway import gateway, LLMUnavailable
+from insight_jobs import enqueue_summary
+from transcripts import TranscriptUnavailable, parse_video_id
+
+bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
+
+# Content regions listed on the teacher insights page
+TOP_REGIONS = 10
 
 
 # home, login, logout, register pages
@@ -20,21 +35,21 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-@app.route('/', methods=['GET', 'POST'])
+@bp.route('/', methods=['GET', 'POST'])
 def home():
     if request.method == 'GET':
         if current_user and current_user.is_authenticated:
             if current_user.role == 'Admin':
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('main.admin_dashboard'))
             elif current_user.role == 'Student':
-                return redirect(url_for('student_dashboard'))
+                return redirect(url_for('main.student_dashboard'))
             elif current_user.role == 'Teacher':
-                return redirect(url_for('teacher_dashboard'))
+                return redirect(url_for('main.teacher_dashboard'))
 
     return render_template("login.html")
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -47,36 +62,36 @@ def login():
         if user and check_password_hash(user.password, password):
             login_user(user)
             if user.role == 'Admin':
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('main.admin_dashboard'))
             elif user.role == 'Student':
-                return redirect(url_for('student_dashboard'))
+                return redirect(url_for('main.student_dashboard'))
             elif user.role == 'Teacher':
-                return redirect(url_for('teacher_dashboard'))
+                return redirect(url_for('main.teacher_dashboard'))
         else:
             flash('Invalid username or password', 'danger')
     elif request.method == 'GET':
         if current_user and current_user.is_authenticated:
             if current_user.role == 'Admin':
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('main.admin_dashboard'))
             elif current_user.role == 'Student':
-                return redirect(url_for('student_dashboard'))
+                return redirect(url_for('main.student_dashboard'))
             elif current_user.role == 'Teacher':
-                return redirect(url_for('teacher_dashboard'))
+                return redirect(url_for('main.teacher_dashboard'))
         else:
             return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     # Flash a success message for user feedback
     flash('You have been logged out successfully.', 'success')
     # Redirect the user to the login page
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -87,7 +102,7 @@ def register():
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash('Username already exists. Please choose a different one.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         # Create a new user
         new_user = User(
@@ -99,17 +114,17 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         flash('Registration successful! Please sign in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html')
 
 ## Student routes and methods
-@app.route('/student_dashboard', methods=['GET', 'POST'])
+@bp.route('/student_dashboard', methods=['GET', 'POST'])
 @login_required
 def student_dashboard():
     if current_user.role != 'Student':
         flash('You do not have permission to access the student dashboard.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     # Fetch all assignments the current student is enrolled in
     enrollments = Enrollment.query.filter_by(user_id=current_user.id).all()
@@ -126,19 +141,19 @@ def student_dashboard():
     return render_template('student_dashboard.html', assignments=assignments)
 
 
-@app.route('/student/insights/<int:assignment_id>')
+@bp.route('/student/insights/<int:assignment_id>')
 @login_required
 def student_insights(assignment_id):
     if current_user.role != 'Student':
         flash('You do not have permission to access the student dashboard.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     # Fetch the enrollment record for the current user and the assignment
     enrollment = Enrollment.query.filter_by(user_id=current_user.id, assignment_id=assignment_id).first()
 
     if not enrollment or not enrollment.insights:
         flash("Insights not available for this assignment.", "warning")
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
 
     # Path to the heatmap file
     heatmap_path = f'static/heatmaps/heatmap_user_{current_user.id}_assignment_{assignment_id}.png'
@@ -146,16 +161,120 @@ def student_insights(assignment_id):
     # Check if heatmap exists
     if not os.path.exists(heatmap_path):
         flash("Heatmap not available for this assignment.", "warning")
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
+
+    # Where the student stands in the class, from the class quantile sketches
+    cohort = cohort_percentiles(assignment_id, session_metrics(user_id=current_user.id, assignment_id=assignment_id))
+
+    return render_template('student_insights.html', heatmap_file=f'heatmaps/heatmap_user_{current_user.id}_assignment_{assignment_id}.png', enrollment=enrollment,
+                           cohort=cohort, cohort_labels=COHORT_LABELS)
+
+# Regenerate tokens kept per browser session; older ones are dropped
+REGENERATE_TOKENS_KEPT = 5
+
+
+def _issue_regenerate_token(target):
+    """
+    One-time token for starting a regeneration of `target`. Tokens are only handed out by POST
+    and kept in the signed session cookie, so a cross-site link or <img> cannot start one.
+    """
+    token = secrets.token_urlsafe(16)
+    tokens = cookie_session.get('regenerate_tokens', {})
+    tokens[token] = target
+    cookie_session['regenerate_tokens'] = dict(list(tokens.items())[-REGENERATE_TOKENS_KEPT:])
+    return token
+
+
+def _use_regenerate_token(target):
+    """Consume the request's ?token= if it was issued for `target`."""
+    tokens = cookie_session.get('regenerate_tokens', {})
+    token = request.args.get('token')
+    if not token or tokens.get(token) != target:
+        return False
+    del tokens[token]
+    cookie_session['regenerate_tokens'] = tokens
+    return True
+
+
+def _insight_stream(system_prompt, prompt, purpose, persist):
+    """
+    SSE generator relaying LLM output as 'token' events. When the model finishes, the full text
+    is passed to `persist` and a 'done' event is sent; failures, and a model that produced no
+    text, end the stream with 'error' and leave the stored insights as they were.
+    """
+    import cron_job
+
+    chunks = []
+    try:
+        for chunk in cron_job.stream_llm(system_prompt, prompt, purpose):
+            chunks.append(chunk)
+            yield format_sse({"text": chunk}, event="token")
+    except LLMUnavailable as e:
+        yield format_sse({"error": f"Insight generation is busy, please try again in {max(e.retry_after, 1):.0f} seconds."},
+                         event="error")
+        return
+    except Exception as e:
+        print(f"Error streaming insights: {str(e)}")
+        yield format_sse({"error": "Insight generation failed, please try again later."}, event="error")
+        return
+
+    insights = "".join(chunks).strip()
+    if not insights:
+        yield format_sse({"error": "The model returned no insights, the previous ones were kept."}, event="error")
+        return
+    persist(insights)
+    yield format_sse({}, event="done")
+
+
+def _sse_response(stream):
+    response = Response(stream_with_context(stream), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-    return render_template('student_insights.html', heatmap_file=f'heatmaps/heatmap_user_{current_user.id}_assignment_{assignment_id}.png', enrollment=enrollment)
 
-@app.route('/student-assignment/<int:assignment_id>', methods=['GET', 'POST'])
+@bp.route('/student/insights/<int:assignment_id>/regenerate', methods=['POST'])
+@login_required
+def start_student_insights(assignment_id):
+    """Issue the one-time URL the page opens as an EventSource to regenerate the student's insights."""
+    if current_user.role != 'Student':
+        return jsonify({"error": "Only students can regenerate their insights."}), 403
+
+    token = _issue_regenerate_token(f"enrollment:{current_user.id}:{assignment_id}")
+    return jsonify({"url": url_for('main.regenerate_student_insights', assignment_id=assignment_id, token=token)})
+
+@bp.route('/student/insights/<int:assignment_id>/regenerate')
+@login_required
+def regenerate_student_insights(assignment_id):
+    """Regenerate the student's insights, streaming them to the page as Server-Sent Events."""
+    import cron_job
+
+    if current_user.role != 'Student':
+        return jsonify({"error": "Only students can regenerate their insights."}), 403
+
+    if not _use_regenerate_token(f"enrollment:{current_user.id}:{assignment_id}"):
+        return jsonify({"error": "Start regeneration from the insights page."}), 403
+
+    enrollment = Enrollment.query.filter_by(user_id=current_user.id, assignment_id=assignment_id).first()
+    if not enrollment:
+        return jsonify({"error": "You are not enrolled in this assignment."}), 404
+
+    messages = cron_job.student_insight_messages(current_user, enrollment.assignment)
+    if messages is None:
+        return jsonify({"error": "No focus data available for this assignment."}), 404
+
+    def persist(insights):
+        enrollment.insights = insights
+        db.session.commit()
+
+    return _sse_response(_insight_stream(*messages, "student_insights", persist))
+
+@bp.route('/student-assignment/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
 def student_assignment_details(assignment_id):
     if current_user.role != 'Student':
         flash('You do not have permission to access student dashboard.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     assignment = Assignment.query.get_or_404(assignment_id)
     note = Note.query.filter_by(assignment_id=assignment.id, user_id=current_user.id).first()
@@ -176,118 +295,44 @@ def student_assignment_details(assignment_id):
         db.session.commit()
 
         #flash('Note has been saved successfully!')
-        #return redirect(url_for('student_assignment_details', assignment_id=assignment.id))
+        #return redirect(url_for('main.student_assignment_details', assignment_id=assignment.id))
         return jsonify(success=True, message="Note has been saved successfully!", note_content=note_content)
 
     return render_template('student_assignment_details.html', assignment=assignment, pdf_filename=pdf_filename, note=note)
 
 
 ## Teacher routes and methods
-
-def summarize_text(text):
-    """
-    Summarize text using the selected LLM model based on the LLM_MODEL environment variable.
-    Defaults to the OpenAI method if the environment variable is not set.
-    """
-    llm_model = os.getenv("LLM_MODEL", "openai").lower()
-
-    if llm_model == "llama":
-        return summarize_text_llama(text)
-    else:
-        return summarize_text_openai(text)
-def summarize_text_llama(text):
-    llm = ChatOllama(
-        model="llama3.2",
-        temperature=0
-    )
-    messages = [
-        (
-            "system",
-            "You are an assistant that summarizes long transcripts into concise summaries.Please use the same front size as text for header sections. "
-        ),
-        ("human", f"Summarize the following text in rich text format in {200} words:\n\n{text}"),
-    ]
-    ai_msg = llm.invoke(messages)
-    return ai_msg.content
-
-def summarize_text_openai(text):
-    """
-    Summarize text using the OpenAI Chat API.
-    """
-    # Set your OpenAI API key
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=openai.api_key)
-    model = "gpt-4"
-    messages = [
-        {
-            "role": "system",
-            "content": "You are an assistant that summarizes long transcripts into concise summaries."
-        },
-        {
-            "role": "user",
-            "content": f"Summarize the following text in rich text format in {200} words:\n\n{text}"
-        }
-    ]
-
-    try:
-        response = client.chat.completions.create(
-            messages=messages,
-            model=model,
-        )
-        notes_content = "This is an AI generated notes. Please feel free to update...\n\n" + response.choices[0].message.content
-        return notes_content
-    except Exception as e:
-        print(f"Error summarizing text: {str(e)}")
-        return None
-
-def fetch_youtube_transcription(youtube_url):
-    """
-    Fetch captions from YouTube and summarize them using OpenAI.
-    """
-    video_id = youtube_url.split("v=")[1].split("&")[0]
-    transcript = YouTubeTranscriptApi.get_transcript(video_id)
-    full_text = " ".join([item['text'] for item in transcript])
-    return summarize_text(full_text)
-
-def process_pdf(file_path):
-    """
-    Extract text from a PDF file and summarize it using OpenAI.
-    """
-    with pdfplumber.open(file_path) as pdf:
-        full_text = " ".join(page.extract_text() for page in pdf.pages if page.extract_text())
-    return summarize_text(full_text)
-
-@app.route('/teacher_dashboard', methods=['GET', 'POST'])
+@bp.route('/teacher_dashboard', methods=['GET', 'POST'])
 @login_required
 def teacher_dashboard():
     if current_user.role != 'Teacher':
         flash('You do not have permission to access teacher dashboard.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     tab = request.args.get('tab', 'list-assignments') # default tab
     assignments = Assignment.query.filter_by(teacher_id=current_user.id).all()
     return render_template('teacher_dashboard.html', assignments=assignments, active_tab=tab)
 
-@app.route('/assignment/<int:assignment_id>')
+@bp.route('/assignment/<int:assignment_id>')
 @login_required
 def view_assignment(assignment_id):
     if current_user.role != 'Teacher':
         flash('You do not have permission to access teacher dashboard.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     assignment = Assignment.query.get_or_404(assignment_id)
     if assignment.teacher_id != current_user.id:
         flash('You do not have permission to view this assignment.', 'danger')
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
     students = [enrollment.user for enrollment in assignment.enrollments]
     return render_template('assignment_detail.html', assignment=assignment, students=students)
 
-@app.route('/submit_assignment', methods=['POST'])
+@bp.route('/submit_assignment', methods=['POST'])
 @login_required
 def submit_assignment():
     if current_user.role != "Teacher":
         flash('You do not have permission to view this assignment.', 'danger')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     title = request.form['title']
     assignment_type = request.form['type']
@@ -303,28 +348,48 @@ def submit_assignment():
         summary = process_pdf(file_path)
         new_assignment = Assignment(title=title, pdf_path=file_path, teacher_id=current_user.id)
     elif assignment_type == 'youtube' and youtube_url:
-        summary = fetch_youtube_transcription(youtube_url)
+        try:
+            summary = fetch_youtube_transcription(youtube_url)
+        except (ValueError, TranscriptUnavailable) as e:
+            flash(f"Could not use this video: {e}", "error")
+            return redirect(url_for('main.teacher_dashboard'))
         new_assignment = Assignment(title=title, youtube_url=youtube_url, teacher_id=current_user.id)
     else:
         flash("Invalid assignment data.", "error")
-        return redirect(url_for('submit_assignment_form'))
+        return redirect(url_for('main.teacher_dashboard'))
 
     db.session.add(new_assignment)
     db.session.commit()
 
     # Store the summary in the database (add a summary column if needed)
     new_assignment.summary = summary  # Ensure this column exists in the Assignment model
+    if summary is None:
+        # The LLM was unavailable; the insight worker summarizes once it is back
+        enqueue_summary(new_assignment.id, delay=timedelta(seconds=gateway.breaker.retry_after()))
     db.session.commit()
 
+    # Paragraph and figure boxes that gaze samples are mapped onto
+    if new_assignment.pdf_path:
+        try:
+            index_pdf(new_assignment)
+            db.session.commit()
+        except Exception:
+            # Keep the assignment; `flask focus index-regions` can index it later
+            db.session.rollback()
+            logger.exception("Could not extract the regions of assignment %s", new_assignment.id)
+            flash("Assignment submitted, but its paragraphs and figures could not be read from the PDF, "
+                  "so reading statistics per paragraph will be missing.", "warning")
+            return redirect(url_for('main.teacher_dashboard', tab='list-assignments'))
+
     flash("Assignment successfully submitted!", "success")
-    return redirect(url_for('teacher_dashboard', tab='list-assignments'))
+    return redirect(url_for('main.teacher_dashboard', tab='list-assignments'))
 
-@app.route('/add_students_to_assignment/<int:assignment_id>', methods=['GET', 'POST'])
+@bp.route('/add_students_to_assignment/<int:assignment_id>', methods=['GET', 'POST'])
 @login_required
 def add_students_to_assignment(assignment_id):
     if current_user.role != 'Teacher':
         flash("You are not authorized to perform this action.", "danger")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     # Fetch the assignment
     assignment = Assignment.query.get_or_404(assignment_id)
@@ -345,24 +410,27 @@ def add_students_to_assignment(assignment_id):
                 db.session.add(enrollment)
         db.session.commit()
         flash(f"Students added to {assignment.title} successfully!", "success")
-        return redirect(url_for('view_assignment', assignment_id=assignment.id))
+        return redirect(url_for('main.view_assignment', assignment_id=assignment.id))
 
     return render_template('add_students_to_assignment.html', assignment=assignment, available_students=available_students)
 
 
-@app.route('/teacher/insights/<int:assignment_id>')
+@bp.route('/teacher/insights/<int:assignment_id>')
 @login_required
 def view_teacher_insights(assignment_id):
     # Ensure the user is a teacher
     if current_user.role != 'Teacher':
         flash("Access denied. Only teachers can view this page.", "danger")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
 
     # Fetch the assignment
     assignment = Assignment.query.get(assignment_id)
     if not assignment:
         flash("Assignment not found.", "warning")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
+    if assignment.teacher_id != current_user.id:
+        flash('You do not have permission to view this assignment.', 'danger')
+        return redirect(url_for('main.teacher_dashboard'))
 
     # Fetch the heatmap path
     heatmap_file = f'heatmap_assignment_{assignment_id}.png'
@@ -371,57 +439,79 @@ def view_teacher_insights(assignment_id):
     # Verify if heatmap exists
     if not os.path.exists(heatmap_path):
         flash("Heatmap not found for this assignment.", "warning")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
+
+    # Paragraphs and figures of a PDF that got the most attention
+    regions = region_dwell(assignment.id, limit=TOP_REGIONS) if assignment.pdf_path else []
 
     # Render the insights page
     return render_template(
         'teacher_insights.html',
         assignment=assignment,
         heatmap_file=heatmap_file,
-        insights=assignment.insights
+        insights=assignment.insights,
+        regions=regions,
+        cohort=cohort_quantiles(assignment.id),
+        cohort_labels=COHORT_LABELS,
+        parquet_export=parquet_available()
     )
 
 
+@bp.route('/teacher/insights/<int:assignment_id>/regenerate', methods=['POST'])
+@login_required
+def start_teacher_insights(assignment_id):
+    """Issue the one-time URL the page opens as an EventSource to regenerate an assignment's insights."""
+    if current_user.role != 'Teacher':
+        return jsonify({"error": "Only teachers can regenerate assignment insights."}), 403
+
+    token = _issue_regenerate_token(f"assignment:{current_user.id}:{assignment_id}")
+    return jsonify({"url": url_for('main.regenerate_teacher_insights', assignment_id=assignment_id, token=token)})
+
+@bp.route('/teacher/insights/<int:assignment_id>/regenerate')
+@login_required
+def regenerate_teacher_insights(assignment_id):
+    """Regenerate an assignment's insights, streaming them to the page as Server-Sent Events."""
+    import cron_job
+
+    if current_user.role != 'Teacher':
+        return jsonify({"error": "Only teachers can regenerate assignment insights."}), 403
+
+    if not _use_regenerate_token(f"assignment:{current_user.id}:{assignment_id}"):
+        return jsonify({"error": "Start regeneration from the insights page."}), 403
+
+    assignment = Assignment.query.get_or_404(assignment_id)
+    if assignment.teacher_id != current_user.id:
+        return jsonify({"error": "You do not have permission to view this assignment."}), 403
+
+    messages = cron_job.assignment_insight_messages(assignment)
+    if messages is None:
+        return jsonify({"error": "No focus data available for this assignment."}), 404
+
+    def persist(insights):
+        assignment.insights = insights
+        db.session.commit()
+
+    return _sse_response(_insight_stream(*messages, "assignment_insights", persist))
+
+
 ## Admin dashboard routes and methods
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin_dashboard():
     if current_user.role != 'Admin':
         flash('Unauthorized access', 'danger')
-        return redirect(url_for('login'))  # Redirect to login if not admin
+        return redirect(url_for('main.login'))  # Redirect to login if not admin
 
     # Redirect to the /admin page directly
     return redirect(url_for('admin.index'))
 
 
-@app.route('/save_focus_data', methods=['POST'])
-@login_required
-def save_focus_data():
-    data = request.json
-
-    # Handle ISO 8601 timestamp with 'Z'
-    timestamp_str = data['timestamp'].replace('Z', '+00:00')
-    timestamp = datetime.fromisoformat(timestamp_str)
-
-    focus_data = FocusData(
-        user_id=current_user.id,
-        assignment_id=data['assignment_id'],
-        x_coord=data['x'],
-        y_coord=data['y'],
-        outside=data['outside'],
-        timestamp=timestamp
-    )
-    db.session.add(focus_data)
-    db.session.commit()
-    print("Focus data saved successfully!")
-    return jsonify({"message": "Focus data saved successfully!"})
-
-@app.route('/student/heatmap/<int:assignment_id>')
+@bp.route('/student/heatmap/<int:assignment_id>')
 @login_required
 def heatmap(assignment_id):
     # Fetch focus data for the user and assignment
-    focus_data = FocusData.query.filter_by(user_id=current_user.id, assignment_id=assignment_id).all()
-    if not focus_data:
+    grid, label = heatmap_grid(user_id=current_user.id, assignment_id=assignment_id)
+    if grid is None:
         return "No focus data available for this assignment.", 404
 
     # Fetch assignment details
@@ -429,24 +519,13 @@ def heatmap(assignment_id):
     if not assignment:
         return "Assignment not found.", 404
 
-    # Extract x and y coordinates
-    x_coords = [data.x_coord for data in focus_data]
-    y_coords = [data.y_coord for data in focus_data]
-
     # Save heatmap with user_id and assignment_id
     heatmap_dir = os.path.join('static', 'heatmaps')
     os.makedirs(heatmap_dir, exist_ok=True)
     file_name = f'heatmap_user_{current_user.id}_assignment_{assignment_id}.png'
     heatmap_path = os.path.join(heatmap_dir, file_name)
 
-    plt.figure(figsize=(10, 8))
-    plt.hist2d(x_coords, y_coords, bins=50, cmap='hot')
-    plt.colorbar(label='Frequency')
-    plt.title(f'Heatmap for {current_user.username} - {assignment.title}')
-    plt.xlabel('X Coordinate')
-    plt.ylabel('Y Coordinate')
-    plt.savefig(heatmap_path)
-    plt.close()
+    render_heatmap(grid, heatmap_path, f'Heatmap for {current_user.username} - {assignment.title}', label)
 
     # Pass the file name, student name, and assignment title to the template
     return render_template(
@@ -456,7 +535,7 @@ def heatmap(assignment_id):
         assignment_title=assignment.title
     )
 
-@app.route('/student/heatmaps')
+@bp.route('/student/heatmaps')
 @login_required
 def all_heatmaps():
     # Define the directory for heatmaps
@@ -485,19 +564,10 @@ def all_heatmaps():
                 continue
 
         # If the file doesn't exist or is outdated, generate the heatmap
-        focus_data = FocusData.query.filter_by(user_id=current_user.id, assignment_id=assignment.id).all()
-        if focus_data:
-            x_coords = [data.x_coord for data in focus_data]
-            y_coords = [data.y_coord for data in focus_data]
-
-            plt.figure(figsize=(10, 8))
-            plt.hist2d(x_coords, y_coords, bins=50, cmap='hot')
-            plt.colorbar(label='Frequency')
-            plt.title(f'Heatmap for {current_user.username} - {assignment.title}')
-            plt.xlabel('X Coordinate')
-            plt.ylabel('Y Coordinate')
-            plt.savefig(heatmap_path)
-            plt.close()
+        grid, label = heatmap_grid(user_id=current_user.id, assignment_id=assignment.id)
+        if grid is not None:
+            render_heatmap(grid, heatmap_path,
+                           f'Heatmap for {current_user.username} - {assignment.title}', label)
 
             # Add the heatmap to the list
             heatmaps.append({
@@ -508,7 +578,7 @@ def all_heatmaps():
     # If no heatmaps exist, show a message
     if not heatmaps:
         flash("No focus data available for any assignments.", "warning")
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('main.student_dashboard'))
 
     # Render the heatmaps in the template
     return render_template(
@@ -517,30 +587,30 @@ def all_heatmaps():
         heatmaps=heatmaps
     )
 
-@app.route('/teacher/heatmap/<int:assignment_id>')
+@bp.route('/teacher/heatmap/<int:assignment_id>')
 @login_required
 def teacher_assignment_heatmap(assignment_id):
     # Ensure the current user is a teacher
     if current_user.role != 'Teacher':
         flash("Access denied. Only teachers can view this page.", "danger")
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     # Fetch assignment details
     assignment = Assignment.query.get(assignment_id)
     if not assignment:
         flash("Assignment not found.", "warning")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
 
     # Check if the current user is the owner of the assignment
     if assignment.teacher_id != current_user.id:
         flash("You do not have permission to view this heatmap.", "danger")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
 
     # Fetch all students enrolled in the assignment
     enrollments = Enrollment.query.filter_by(assignment_id=assignment_id).all()
     if not enrollments:
         flash("No students are enrolled in this assignment.", "warning")
-        return redirect(url_for('teacher_dashboard'))
+        return redirect(url_for('main.teacher_dashboard'))
 
     # File naming: Use assignment_id and teacher_id
     heatmap_dir = os.path.join('static', 'teacher_heatmaps')
@@ -550,31 +620,24 @@ def teacher_assignment_heatmap(assignment_id):
 
     # Check if the heatmap already exists or needs to be regenerated
     if not os.path.exists(heatmap_path):
-        # Generate a combined heatmap for all students
-        x_coords = []
-        y_coords = []
-        for enrollment in enrollments:
-            student_focus_data = FocusData.query.filter_by(user_id=enrollment.user_id, assignment_id=assignment_id).all()
-            x_coords.extend([data.x_coord for data in student_focus_data])
-            y_coords.extend([data.y_coord for data in student_focus_data])
+        # Generate a combined heatmap for all enrolled students; coordinates are normalised,
+        # so the database bins every fixation of the assignment into one grid
+        enrolled = select(Enrollment.user_id).where(Enrollment.assignment_id == assignment_id)
+        grid, label = heatmap_grid(assignment_id=assignment_id, user_ids=enrolled)
 
         # Generate the heatmap if there is data
-        if x_coords and y_coords:
-            plt.figure(figsize=(10, 8))
-            plt.hist2d(x_coords, y_coords, bins=50, cmap='hot')
-            plt.colorbar(label='Frequency')
-            plt.title(f'Heatmap for Assignment {assignment.title} (Generated by Teacher {current_user.username})')
-            plt.xlabel('X Coordinate')
-            plt.ylabel('Y Coordinate')
-            plt.savefig(heatmap_path)
-            plt.close()
+        if grid is not None:
+            render_heatmap(grid, heatmap_path,
+                           f'Heatmap for Assignment {assignment.title} (Generated by Teacher {current_user.username})',
+                           label)
         else:
             flash("No focus data available for this assignment.", "warning")
-            return redirect(url_for('teacher_dashboard'))
+            return redirect(url_for('main.teacher_dashboard'))
 
     # Render the templatea
     return render_template(
         'teacher_heatmap.html',
+        assignment=assignment,
         assignment_title=assignment.title,
         heatmap_file=file_name
     )
@@ -604,12 +667,18 @@ def calculate_focus_time(data, total_duration):
     focus_time = total_duration - distraction_time
     return focus_time
 
-@app.errorhandler(404)
+@bp.app_template_filter('youtube_id')
+def youtube_id_filter(url):
+    """Video id of a YouTube URL, for embedding: {{ assignment.youtube_url | youtube_id }}"""
+    return parse_video_id(url) or ''
+
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html'), 500
@@ -0,0 +1,86 @@
+"""
+Scanpath analytics over the grid cells of consecutive fixations.
+
+A session's scanpath is summarised by the cell-to-cell transition matrix (how often a
+saccade led from one grid cell to another) and the number of visits per cell (runs of
+consecutive fixations in the same cell). Both are counts, so the scanpaths of several
+sessions, students or a whole class merge by addition. They are computed together with
+the other session metrics (see cron_utils.calculate_session_metrics) and cached with them;
+dwell time per cell is the metrics' fixation_cells.
+
+The matrix is stored sparse, as [from cell, to cell, count] triples, since a session only
+uses a small part of the grid_size**4 possible transitions.
+"""
+import numpy as np
+
+TOP_K = 3
+
+
+def scanpath_features(cells, linked, cell_count):
+    """
+    Transitions and visits of one session in a single vectorised pass.
+    `cells` is the flat grid cell of every fixation in time order and `linked[i]` tells
+    whether a saccade joins fixation i to i + 1 (see Fixations.linked).
+    """
+    if not len(cells):
+        return {"transitions": [], "visits": [0] * cell_count}
+
+    pairs = cells[:-1][linked] * cell_count + cells[1:][linked]
+    counts = np.bincount(pairs, minlength=cell_count * cell_count)
+    used = np.flatnonzero(counts)
+
+    # A visit starts at the first fixation, after a tracking gap and wherever the cell changes
+    new_visit = np.ones(len(cells), dtype=bool)
+    new_visit[1:] = (cells[1:] != cells[:-1]) | ~linked
+    visits = np.bincount(cells[new_visit], minlength=cell_count)
+    return {
+        "transitions": np.column_stack((used // cell_count, used % cell_count, counts[used])).tolist(),
+        "visits": visits.tolist(),
+    }
+
+
+def merge_scanpaths(scanpaths, cell_count):
+    """Sum the scanpaths of several sessions (or students). Missing ones are skipped."""
+    scanpaths = [scanpath for scanpath in scanpaths if scanpath]
+    visits = np.zeros(cell_count, dtype=np.int64)
+    for scanpath in scanpaths:
+        visits += scanpath["visits"]
+    moves = [scanpath["transitions"] for scanpath in scanpaths if scanpath["transitions"]]
+    if not moves:
+        return {"transitions": [], "visits": visits.tolist()}
+
+    source, target, count = np.concatenate(moves).T
+    counts = np.bincount(source * cell_count + target, weights=count, minlength=cell_count * cell_count)
+    used = np.flatnonzero(counts)
+    counts = counts[used].astype(np.int64)
+    return {
+        "transitions": np.column_stack((used // cell_count, used % cell_count, counts)).tolist(),
+        "visits": visits.tolist(),
+    }
+
+
+def transition_matrix(scanpath, cell_count):
+    """The dense cell_count x cell_count transition count matrix, indexed [from, to]."""
+    matrix = np.zeros((cell_count, cell_count), dtype=np.int64)
+    if scanpath and scanpath["transitions"]:
+        source, target, count = np.array(scanpath["transitions"]).T
+        matrix[source, target] = count
+    return matrix
+
+
+def revisits(scanpath):
+    """Returns to a cell after the gaze had left it, per cell."""
+    return np.maximum(np.array(scanpath["visits"]) - 1, 0)
+
+
+def top_cells(weights, k=TOP_K):
+    """Flat indices of the k largest non-zero weights, largest first (ties by lowest index)."""
+    weights = np.asarray(weights)
+    order = np.argsort(-weights, kind="stable")[:k]
+    return [int(cell) for cell in order if weights[cell] > 0]
+
+
+def top_transitions(scanpath, k=TOP_K):
+    """The k most frequent [from, to, count] transitions between different cells."""
+    moves = [move for move in scanpath["transitions"] if move[0] != move[1]]
+    return sorted(moves, key=lambda move: (-move[2], move[0], move[1]))[:k]
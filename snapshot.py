@@ -0,0 +1,151 @@
+"""
+Point-in-time analytics snapshot for the nightly insights run.
+
+On SQLite a long analytics pass interleaved with per-unit commits competes with live gaze
+ingestion for the database lock. With a snapshot the run instead reads from a private copy
+of the database made with SQLite's online backup API, and collects what it would write
+(insights, class sketches and completed leases). Everything collected is applied to the live
+database in one short write transaction at the end. Lease claims still go to the live
+database one by one, since they are what keeps shards and overlapping runs apart.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from instrumentation import timed
+from leases import release_lease
+from models import db, CronLease
+from profiling import profiler
+
+
+def current_snapshot():
+    """The AnalyticsSnapshot the cron run in this app context reads from, or None."""
+    return g.get("analytics_snapshot") if has_app_context() else None
+
+
+def analytics_session():
+    """Session for the heavy analytics reads: the snapshot's when one is active, else db.session."""
+    snapshot = current_snapshot()
+    return snapshot.session if snapshot is not None else db.session
+
+
+def snapshot_dir(app):
+    """Directory for snapshot files (SNAPSHOT_DIR, default instance/snapshots), created on demand."""
+    path = (app.config.get("SNAPSHOT_DIR") or os.getenv("SNAPSHOT_DIR")
+            or os.path.join(app.instance_path, "snapshots"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def snapshot_supported(engine):
+    """Snapshots are taken of SQLite database files only (other databases give consistent reads already)."""
+    return engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:")
+
+
+def copy_database(engine, path):
+    """
+    Copy the live SQLite database to `path` with the online backup API, in a single step so
+    the copy is consistent. Writers only wait for the copy itself in rollback-journal mode,
+    and not at all in WAL mode. Returns the size of the copy in bytes.
+    """
+    source = engine.raw_connection()
+    target = sqlite3.connect(path)
+    try:
+        source.driver_connection.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return os.path.getsize(path)
+
+
+class AnalyticsSnapshot:
+    def __init__(self, path, size, seconds):
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        self.engine = create_engine(f"sqlite:///file:{path}?mode=ro&uri=true")
+        self.session = Session(bind=self.engine)
+        # Core statements and (unit, owner) lease completions for the live database
+        self.writes = []
+        self.leases = []
+
+    def write(self, statement):
+        """Queue an UPDATE/INSERT for the live database instead of committing it now."""
+        self.writes.append(statement)
+
+    def complete_lease(self, unit, owner):
+        """Complete the lease together with the results it guards, in the write-back."""
+        self.leases.append((unit, owner))
+
+    def write_back(self):
+        """
+        Apply every queued write and lease completion in one transaction. Returns the seconds
+        taken. If it fails the leases are released, so a retry of the run redoes those units.
+        """
+        if not (self.writes or self.leases):
+            return 0.0
+        start = time.perf_counter()
+        with profiler.unit("write_back", len(self.writes)), profiler.stage("commit"), timed("snapshot_write_back"):
+            db.session.rollback()
+            try:
+                for statement in self.writes:
+                    db.session.execute(statement)
+                now = datetime.utcnow()
+                for unit, owner in self.leases:
+                    db.session.execute(update(CronLease)
+                                       .where(CronLease.unit == unit, CronLease.owner == owner)
+                                       .values(completed_at=now))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for unit, owner in self.leases:
+                    release_lease(unit, owner)
+                raise
+        self.writes, self.leases = [], []
+        return time.perf_counter() - start
+
+    def close(self):
+        self.session.close()
+        self.engine.dispose()
+        os.remove(self.path)
+
+
+@contextmanager
+def analytics_snapshot(directory=None):
+    """
+    Take a snapshot of the live database in `directory` (default `snapshot_dir`) and make
+    `analytics_session` read from it in the current app context. On exit the collected writes
+    are applied to the live database (also when the run fails part way, so finished units are
+    kept) and the copy is deleted. Yields None, and changes nothing, when the database cannot be snapshotted.
+    """
+    if not snapshot_supported(db.engine):
+        print(f"Snapshots need a SQLite database file, reading from {db.engine.url.get_backend_name()} directly")
+        yield None
+        return
+
+    directory = directory or snapshot_dir(current_app)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"snapshot-{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.db")
+    start = time.perf_counter()
+    with profiler.unit("snapshot", os.path.basename(path)), profiler.stage("query"), timed("snapshot_copy"):
+        size = copy_database(db.engine, path)
+    snapshot = AnalyticsSnapshot(path, size, time.perf_counter() - start)
+    print(f"Snapshot taken in {snapshot.seconds:.2f} s ({size / 1e6:.1f} MB)")
+
+    g.analytics_snapshot = snapshot
+    try:
+        yield snapshot
+    finally:
+        g.pop("analytics_snapshot", None)
+        writes, leases = len(snapshot.writes), len(snapshot.leases)
+        try:
+            seconds = snapshot.write_back()
+            print(f"Wrote back {writes} results and {leases} completed leases in one transaction in {seconds:.3f} s")
+        finally:
+            snapshot.close()
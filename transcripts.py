@@ -0,0 +1,181 @@
+"""
+Local store for YouTube transcripts and their summaries.
+
+Transcripts are fetched once per (video id, language) and kept as JSON files, so the same
+video reused across sections and terms is neither downloaded nor summarised again.
+With TRANSCRIPTS_OFFLINE=1 nothing is fetched: only files already in the store (for example
+fixtures checked into a test directory pointed to by TRANSCRIPT_DIR) are served.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+from instrumentation import registry, timed
+
+project_root = os.path.abspath(os.path.dirname(__file__))
+
+DEFAULT_LANGUAGE = "en"
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com")
+_HOST_PREFIXES = ("www.", "m.", "music.")
+# Path prefixes followed by the video id, e.g. /shorts/<id>
+_ID_PATH_PREFIXES = ("embed", "shorts", "live", "v", "e")
+
+transcript_lookups = registry.counter("ifocus_transcript_lookups_total",
+                                      "Transcript and summary lookups by kind and result (hit, miss, unavailable).")
+
+
+class TranscriptUnavailable(Exception):
+    """No transcript could be found for the video (or none is stored in offline mode)."""
+
+
+def parse_video_id(url):
+    """
+    The 11-character video id of a YouTube URL (watch, youtu.be, shorts, embed and live links,
+    with or without www./m./music.), or of a bare id. Returns None when there is none.
+    """
+    url = (url or "").strip()
+    if _VIDEO_ID.match(url):
+        return url
+    if "://" not in url:
+        url = "https://" + url
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        host = host.removeprefix(prefix)
+    parts = [part for part in parsed.path.split("/") if part]
+    if host == "youtu.be":
+        candidate = parts[0] if parts else None
+    elif host in _YOUTUBE_HOSTS:
+        if parts[:1] == ["watch"] or not parts:
+            candidate = parse_qs(parsed.query).get("v", [None])[0]
+        elif len(parts) >= 2 and parts[0] in _ID_PATH_PREFIXES:
+            candidate = parts[1]
+        else:
+            candidate = None
+    else:
+        candidate = None
+    return candidate if candidate and _VIDEO_ID.match(candidate) else None
+
+
+def _write_json(path, data):
+    """Write atomically, so concurrent prefetches never leave a half-written file behind."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class TranscriptStore:
+    def __init__(self, directory=None, offline=None):
+        self.directory = directory or os.getenv("TRANSCRIPT_DIR") or os.path.join(project_root, "instance",
+                                                                                  "transcripts")
+        if offline is None:
+            offline = os.getenv("TRANSCRIPTS_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+
+    def _transcript_path(self, video_id, language):
+        return os.path.join(self.directory, f"{video_id}.{language}.json")
+
+    def _summary_path(self, video_id, language, model):
+        return os.path.join(self.directory, "summaries", f"{video_id}.{language}.{model}.json")
+
+    def get(self, video_id, language=DEFAULT_LANGUAGE):
+        """Transcript text of a video, fetched from YouTube on the first request only."""
+        cached = _read_json(self._transcript_path(video_id, language))
+        if cached is not None:
+            transcript_lookups.inc(kind="transcript", result="hit")
+            return cached["text"]
+        if self.offline:
+            transcript_lookups.inc(kind="transcript", result="unavailable")
+            raise TranscriptUnavailable(f"No stored transcript for {video_id} ({language}) in offline mode")
+
+        transcript_lookups.inc(kind="transcript", result="miss")
+        segments = self._fetch(video_id, language)
+        text = " ".join(item["text"] for item in segments)
+        _write_json(self._transcript_path(video_id, language), {
+            "video_id": video_id,
+            "language": language,
+            "fetched_at": datetime.utcnow().isoformat(),
+            "text": text,
+            "segments": segments,
+        })
+        return text
+
+    def _fetch(self, video_id, language):
+        from youtube_transcript_api import YouTubeTranscriptApi
+
+        try:
+            with timed("transcript_fetch"):
+                return YouTubeTranscriptApi.get_transcript(video_id, languages=(language,))
+        except Exception as e:
+            transcript_lookups.inc(kind="transcript", result="unavailable")
+            raise TranscriptUnavailable(f"No transcript for {video_id} ({language}): {e}") from e
+
+    def summary(self, video_id, summarize, model, language=DEFAULT_LANGUAGE):
+        """
+        Summary of a video's transcript made with `summarize(text)`, stored per model and
+        invalidated when the transcript changes. Failed summaries (None) are not stored.
+        """
+        text = self.get(video_id, language)
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        path = self._summary_path(video_id, language, model)
+        cached = _read_json(path)
+        if cached is not None and cached["transcript_sha256"] == digest:
+            transcript_lookups.inc(kind="summary", result="hit")
+            return cached["summary"]
+
+        transcript_lookups.inc(kind="summary", result="miss")
+        summary = summarize(text)
+        if summary:
+            _write_json(path, {"transcript_sha256": digest, "created_at": datetime.utcnow().isoformat(),
+                               "summary": summary})
+        return summary
+
+    def prefetch(self, urls, language=DEFAULT_LANGUAGE, workers=8, summarize=None, model=None):
+        """
+        Resolve and store the transcripts (and summaries, when `summarize` is given) of many
+        URLs concurrently. Returns {url: "ok" | error message}; duplicate videos are fetched once.
+        """
+        results = {}
+        video_ids = {}
+        for url in urls:
+            video_id = parse_video_id(url)
+            if video_id is None:
+                results[url] = "not a YouTube video URL"
+            else:
+                video_ids.setdefault(video_id, []).append(url)
+
+        def load(video_id):
+            try:
+                if summarize is None:
+                    self.get(video_id, language)
+                else:
+                    self.summary(video_id, summarize, model, language)
+                return "ok"
+            except TranscriptUnavailable as e:
+                return str(e)
+
+        # Fetching is network bound, so threads overlap the waits; summaries are
+        # additionally limited by the LLM gateway
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for video_id, outcome in zip(video_ids, pool.map(load, video_ids)):
+                for url in video_ids[video_id]:
+                    results[url] = outcome
+        return results
@@ -0,0 +1,152 @@
+"""
+Attention curves over the video timeline of YouTube assignments.
+
+The assignment page sends the player's current time with every gaze sample recorded while
+the video plays. When a focus session closes, its samples are bucketed by video second in
+one vectorised pass and added to two precomputed curves: the student's curve for the
+assignment and the class curve. A curve is one AttentionSecond row per second, counting
+the samples and how many were on the content. The additions are atomic upserts
+(samples = samples + n), so the assignment curve is updated incrementally and never
+rebuilt from raw rows. Only `rebuild_curves`, for data recorded before curves existed,
+reads raw rows.
+"""
+import numpy as np
+from sqlalchemy import delete, select
+
+from models import db, AttentionSecond, FocusData, FocusSession
+
+# user_id of the class curve of an assignment, the sum of its students' curves
+CLASS_CURVE = 0
+
+_columns = FocusData.__table__.c
+
+
+def _insert_for_dialect():
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def curve_counts(video_time, outside, keys=None):
+    """
+    Bucket samples by whole video second. Returns (key, second, samples, inside) arrays for
+    the populated buckets, where key is the sample's entry of `keys` (e.g. user ids) or 0.
+    """
+    seconds = np.floor(video_time).astype(np.int64)
+    keys = np.zeros(len(seconds), dtype=np.int64) if keys is None else np.asarray(keys, dtype=np.int64)
+    if not len(seconds):
+        return (np.empty(0, dtype=np.int64),) * 4
+    # One bucket per (key, second), numbered densely so bincount stays small
+    width = int(seconds.max()) + 1
+    unique_keys, key_index = np.unique(keys, return_inverse=True)
+    buckets = key_index * width + seconds
+    samples = np.bincount(buckets, minlength=len(unique_keys) * width)
+    inside = np.bincount(buckets, weights=~outside, minlength=len(unique_keys) * width).astype(np.int64)
+    used = np.flatnonzero(samples)
+    return unique_keys[used // width], used % width, samples[used], inside[used]
+
+
+def add_to_curves(assignment_id, user_ids, seconds, samples, inside):
+    """
+    Add bucketed counts to the students' curves and to the class curve, in the caller's
+    transaction. Rows are created on first use and incremented atomically afterwards.
+    """
+    if not len(seconds):
+        return 0
+    # The class curve gets the per-second totals over all the given students
+    class_samples = np.bincount(seconds, weights=samples).astype(np.int64)
+    class_inside = np.bincount(seconds, weights=inside).astype(np.int64)
+    class_seconds = np.flatnonzero(class_samples)
+
+    rows = [{"assignment_id": assignment_id, "user_id": user_id, "second": second, "samples": count,
+             "inside": on_content}
+            for user_id, second, count, on_content in zip(user_ids.tolist(), seconds.tolist(), samples.tolist(),
+                                                           inside.tolist())]
+    rows += [{"assignment_id": assignment_id, "user_id": CLASS_CURVE, "second": second, "samples": count,
+              "inside": on_content}
+             for second, count, on_content in zip(class_seconds.tolist(), class_samples[class_seconds].tolist(),
+                                                  class_inside[class_seconds].tolist())]
+
+    insert = _insert_for_dialect()
+    statement = insert(AttentionSecond)
+    statement = statement.on_conflict_do_update(
+        index_elements=[AttentionSecond.assignment_id, AttentionSecond.user_id, AttentionSecond.second],
+        set_={
+            "samples": AttentionSecond.samples + statement.excluded.samples,
+            "inside": AttentionSecond.inside + statement.excluded.inside,
+        },
+    )
+    db.session.execute(statement, rows)
+    return len(rows)
+
+
+def add_session_curve(session):
+    """Add the video samples of a closing session to its student's and its class's curves."""
+    rows = db.session.execute(
+        select(_columns.video_time, _columns.outside)
+        .where(_columns.session_id == session.id, _columns.video_time.isnot(None))
+    ).all()
+    if not rows:
+        return 0
+    video_time, outside = zip(*rows)
+    _, seconds, samples, inside = curve_counts(np.array(video_time, dtype=np.float64),
+                                               np.array(outside, dtype=bool))
+    user_ids = np.full(len(seconds), session.user_id, dtype=np.int64)
+    return add_to_curves(session.assignment_id, user_ids, seconds, samples, inside)
+
+
+def rebuild_curves(assignment_id=None):
+    """
+    Recompute curves from the samples of closed sessions, replacing the stored ones, e.g.
+    for videos watched before curves existed. Samples of open sessions are added when
+    their session closes. Returns the number of assignments with curves.
+    """
+    query = (select(_columns.assignment_id, _columns.user_id, _columns.video_time, _columns.outside)
+             .join(FocusSession, FocusSession.id == _columns.session_id)
+             .where(_columns.video_time.isnot(None), FocusSession.ended_at.isnot(None)))
+    clear = delete(AttentionSecond)
+    if assignment_id is not None:
+        query = query.where(_columns.assignment_id == assignment_id)
+        clear = clear.where(AttentionSecond.assignment_id == assignment_id)
+    db.session.execute(clear)
+
+    rows = db.session.execute(query).all()
+    if not rows:
+        db.session.commit()
+        return 0
+    assignments, users, video_time, outside = (np.array(column) for column in zip(*rows))
+    for assignment in np.unique(assignments):
+        selected = assignments == assignment
+        user_ids, seconds, samples, inside = curve_counts(video_time[selected].astype(np.float64),
+                                                          outside[selected].astype(bool), users[selected])
+        add_to_curves(int(assignment), user_ids, seconds, samples, inside)
+    db.session.commit()
+    return len(np.unique(assignments))
+
+
+def attention_curve(assignment_id, user_id=CLASS_CURVE, bucket=1):
+    """
+    The class (or one student's) curve as compact arrays for a timeline chart: per bucket of
+    `bucket` seconds from the start of the video, the sample count and the fraction of them
+    on the content (None for buckets without samples). Returns None when there is no curve.
+    """
+    rows = db.session.execute(
+        select(AttentionSecond.second, AttentionSecond.samples, AttentionSecond.inside)
+        .where(AttentionSecond.assignment_id == assignment_id, AttentionSecond.user_id == user_id)
+    ).all()
+    if not rows:
+        return None
+    seconds, samples, inside = (np.array(column, dtype=np.int64) for column in zip(*rows))
+    buckets = seconds // bucket
+    samples = np.bincount(buckets, weights=samples).astype(np.int64)
+    inside = np.bincount(buckets, weights=inside, minlength=len(samples))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        attention = np.round(inside / samples, 3)
+    return {
+        "bucket": bucket,
+        "duration": int(seconds.max()) + 1,
+        "samples": samples.tolist(),
+        "attention": [None if count == 0 else float(value) for count, value in zip(samples, attention)],
+    }
@@ -1,10 +1,17 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
 from flask_login import current_user
-from flask import redirect, url_for, request, flash
+from flask import redirect, url_for, request, flash, abort, current_app, send_from_directory, g
 from flask_admin import AdminIndexView, expose, BaseView
 from flask_admin.contrib.sqla import ModelView
-from sqlalchemy import func
+from sqlalchemy import func, text
 from wtforms import SelectField, StringField, PasswordField
 from models import db, User, Assignment, Note  # Import your models
+from profiling import profile_dir, format_pstats, StageProfiler
+from export import DATASETS, FORMATS, export_response, parquet_available
 
 
 class MyModelView(ModelView):
@@ -12,10 +19,111 @@ class MyModelView(ModelView):
         return current_user.is_authenticated and current_user.role == 'Admin'
 
     def inaccessible_callback(self, name, **kwargs):
-        return redirect(url_for('login', next=request.url))
-
-
-class UserAdminView(MyModelView):
+        return redirect(url_for('main.login', next=request.url))
+
+
+# List pages count at most this many rows, so counting stays cheap on large tables
+ADMIN_COUNT_LIMIT = int(os.getenv("ADMIN_COUNT_LIMIT", "10000"))
+# Seconds the count of a list over the limit is reused for the same search and filters
+ADMIN_COUNT_TTL = float(os.getenv("ADMIN_COUNT_TTL", "60"))
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def estimated_row_count(table):
+    """
+    Rough row count of a whole table without scanning it: the planner statistics on
+    PostgreSQL, the largest id elsewhere (an upper bound, as deleted ids are not reused).
+    """
+    if db.engine.dialect.name == "postgresql":
+        return db.session.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)"),
+                                  {"name": table.name}).scalar()
+    return db.session.query(func.max(table.c.id)).scalar() or 0
+
+
+class KeysetModelView(MyModelView):
+    """
+    List pages that seek on the primary key (`?after=<id>` / `?before=<id>`) instead of
+    OFFSET, so every page costs the same however deep it is. Counts stop at ADMIN_COUNT_LIMIT;
+    beyond it an unfiltered list shows the table estimate, and the label is cached for
+    ADMIN_COUNT_TTL seconds. Sorting by another column falls back to OFFSET pages without a count.
+    """
+    list_template = 'admin/keyset_list.html'
+    simple_list_pager = True  # Flask-Admin never runs its own count query
+    # True lists the newest rows first when the list is not sorted
+    keyset_desc = False
+
+    def _keyset_url(self, **cursor):
+        args = request.args.to_dict(flat=False)
+        for name in ('after', 'before', 'page'):
+            args.pop(name, None)
+        args.update(cursor)
+        return url_for('.index_view', **args)
+
+    def _row_count(self, query, search, filters):
+        """Label for the number of rows; only labels of lists over the cap are cached."""
+        key = (self.endpoint, search, repr(filters))
+        now = time.monotonic()
+        with _count_lock:
+            cached = _count_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        pk = getattr(self.model, self._primary_key)
+        count = self.session.query(func.count()).select_from(
+            query.with_entities(pk).order_by(None).limit(ADMIN_COUNT_LIMIT + 1).subquery()).scalar()
+        if count <= ADMIN_COUNT_LIMIT:
+            return f"{count} rows"
+        if search or filters:
+            label = f"more than {ADMIN_COUNT_LIMIT} rows"
+        else:
+            label = f"about {max(estimated_row_count(self.model.__table__), count)} rows"
+        with _count_lock:
+            for stale in [entry for entry, (expires, _) in _count_cache.items() if expires <= now]:
+                del _count_cache[stale]
+            _count_cache[key] = (now + ADMIN_COUNT_TTL, label)
+        return label
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        page_size = self.page_size if page_size is None else page_size
+        if not execute or not page_size or sort_column not in (None, self._primary_key):
+            return super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+
+        # The searched and filtered query, without ordering or limit
+        _, query = super().get_list(None, None, None, search, filters, execute=False, page_size=False)
+        g.admin_row_count = self._row_count(query, search, filters)
+
+        pk = getattr(self.model, self._primary_key)
+        desc = self.keyset_desc if sort_column is None else bool(sort_desc)
+        before = request.args.get('before', type=int)
+        cursor = request.args.get('after', type=int) if before is None else before
+        # Pages towards the start are read in reverse order from the cursor, then flipped
+        descending = desc == (before is None)
+        if cursor is not None:
+            query = query.filter(pk < cursor if descending else pk > cursor)
+        rows = query.order_by(pk.desc() if descending else pk.asc()).limit(page_size + 1).all()
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if before is not None:
+            rows.reverse()
+
+        has_previous = (more if before is not None else cursor is not None) and bool(rows)
+        has_next = (more if before is None else True) and bool(rows)
+        g.admin_keyset = {
+            'first_url': self._keyset_url() if cursor is not None else None,
+            'previous_url': self._keyset_url(before=self.get_pk_value(rows[0])) if has_previous else None,
+            'next_url': self._keyset_url(after=self.get_pk_value(rows[-1])) if has_next else None,
+        }
+        return None, rows
+
+    def render(self, template, **kwargs):
+        kwargs.setdefault('keyset', g.get('admin_keyset'))
+        kwargs.setdefault('row_count', g.get('admin_row_count'))
+        return super().render(template, **kwargs)
+
+
+class UserAdminView(KeysetModelView):
     can_create = True
     can_edit = True
     can_delete = True
@@ -43,10 +151,6 @@ class UserAdminView(MyModelView):
         """Override get_query to filter out Admin users from the list"""
         return self.session.query(self.model).filter(self.model.role != 'Admin')
 
-    def get_count_query(self):
-        """Override get_count_query to return a proper query object"""
-        return self.session.query(func.count('*')).select_from(self.model).filter(self.model.role != 'Admin')
-
     # Override the create_model method to hash the password
     def create_model(self, form):
         model = self.model()
@@ -134,7 +238,7 @@ class UserAdminView(MyModelView):
             return False
 
 
-class AssignmentAdminView(MyModelView):
+class AssignmentAdminView(KeysetModelView):
     can_create = True
     can_edit = True
     can_delete = True
@@ -150,10 +254,6 @@ class AssignmentAdminView(MyModelView):
         """Override get_query to filter out Admin users from the list"""
         return self.session.query(self.model)
 
-    def get_count_query(self):
-        """Override get_count_query to return a proper query object"""
-        return self.session.query(func.count('*')).select_from(self.model)
-
     def on_model_change(self, form, model, is_created):
         if model.pdf_path and model.youtube_url:
             raise ValueError("An assignment can only have either a PDF or a YouTube video, not both.")
@@ -190,7 +290,7 @@ class AssignmentAdminView(MyModelView):
             return False
 
 
-class NoteAdminView(MyModelView):
+class NoteAdminView(KeysetModelView):
     can_create = True
     can_edit = True
     can_delete = True
@@ -206,10 +306,6 @@ class NoteAdminView(MyModelView):
         """Override get_query to filter out Admin users from the list"""
         return self.session.query(self.model)
 
-    def get_count_query(self):
-        """Override get_count_query to return a proper query object"""
-        return self.session.query(func.count('*')).select_from(self.model)
-
     def delete_model(self, model):
         try:
             db.session.delete(model)
@@ -241,7 +337,124 @@ class NoteAdminView(MyModelView):
             return False
 
 
+class FocusDataAdminView(KeysetModelView):
+    """Read-only browser of raw gaze samples, newest first. Use Export to download them."""
+    can_create = False
+    can_edit = False
+    can_delete = False
+    can_view_details = True
+    keyset_desc = True
+
+    column_list = ['id', 'user_id', 'assignment_id', 'session_id', 'timestamp', 'x_coord', 'y_coord', 'outside',
+                   'page', 'video_time']
+    # Each is the leading column of an index ending in id, so filtered pages seek too
+    column_filters = ['assignment_id', 'user_id', 'session_id']
+    column_sortable_list = ['id']
+
+
+def _format_session_metrics(view, context, model, name):
+    metrics = model.metrics
+    if not metrics or not metrics.get('total_duration'):
+        return ''
+    duration = metrics['total_duration']
+    focus = 100 * (duration - metrics['distraction_time']) / duration
+    return f"{metrics['sample_count']} samples, {duration / 60:.1f} min, {focus:.0f}% focus"
+
+
+class FocusSessionAdminView(KeysetModelView):
+    """Read-only browser of focus sessions with their cached metrics, newest first."""
+    can_create = False
+    can_edit = False
+    can_delete = False
+    can_view_details = True
+    keyset_desc = True
+
+    column_list = ['id', 'user_id', 'assignment_id', 'started_at', 'ended_at', 'end_reason', 'metrics']
+    column_labels = {'metrics': 'Summary'}
+    column_formatters = {'metrics': _format_session_metrics}
+    column_filters = ['assignment_id', 'user_id']
+    column_sortable_list = ['id']
+
+
+class ProfilesView(BaseView):
+    """Lists the request (.prof) and cron (.json) profiles saved in the profiles directory."""
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.role == 'Admin'
+
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for('main.login', next=request.url))
+
+    def _profile_path(self, filename):
+        directory = profile_dir(current_app)
+        path = os.path.join(directory, filename)
+        if os.path.basename(filename) != filename or not filename.endswith(('.prof', '.json')) or not os.path.isfile(path):
+            abort(404)
+        return directory, path
+
+    @expose('/')
+    def index(self):
+        directory = profile_dir(current_app)
+        profiles = []
+        for filename in os.listdir(directory):
+            if filename.endswith(('.prof', '.json')):
+                stat = os.stat(os.path.join(directory, filename))
+                profiles.append({
+                    'name': filename,
+                    'size_kb': stat.st_size / 1024,
+                    'modified': datetime.fromtimestamp(stat.st_mtime),
+                })
+        profiles.sort(key=lambda profile: profile['modified'], reverse=True)
+        return self.render('admin/profiles.html', profiles=profiles, directory=directory)
+
+    @expose('/<filename>')
+    def detail(self, filename):
+        _, path = self._profile_path(filename)
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'ncalls'):
+            sort = 'cumulative'
+
+        if filename.endswith('.prof'):
+            return self.render('admin/profile_detail.html', filename=filename, stats=format_pstats(path, sort=sort),
+                               sort=sort, report=None, stages=None)
+
+        with open(path) as f:
+            report = json.load(f)
+        return self.render('admin/profile_detail.html', filename=filename, stats=None, sort=sort,
+                           report=report, stages=StageProfiler.STAGES)
+
+    @expose('/<filename>/download')
+    def download(self, filename):
+        directory, _ = self._profile_path(filename)
+        return send_from_directory(directory, filename, as_attachment=True)
+
+
+class ExportView(BaseView):
+    """Streaming download of gaze samples, fixations or session metrics across all assignments."""
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.role == 'Admin'
+
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect(url_for('main.login', next=request.url))
+
+    @expose('/')
+    def index(self):
+        assignments = db.session.query(Assignment.id, Assignment.title).order_by(Assignment.id).all()
+        return self.render('admin/export.html', assignments=assignments, datasets=list(DATASETS),
+                           formats=[fmt for fmt in FORMATS if fmt != 'parquet' or parquet_available()])
+
+    @expose('/download')
+    def download(self):
+        assignment_id = request.args.get('assignment_id', type=int)
+        try:
+            return export_response(request.args, assignment_ids=[assignment_id] if assignment_id else None)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('.index'))
+
+
 class SignoutView(BaseView):
     @expose('/')
     def index(self):
-        return redirect(url_for('logout'))
\ No newline at end of file
+        return redirect(url_for('main.logout'))
\ No newline at end of file